@@ -1,27 +1,260 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from langgraph.config import get_stream_writer
 from langgraph.func import entrypoint
-from retrieval import perform_retrieval
-from structured_agent import generate_structured_pathway
+from retrieval import perform_group_retrieval, perform_retrieval
+from structured_agent import generate_structured_pathway, generate_structured_pathway_incremental
 from explanation import enhance_structured_explanations
+from context_handle import open_context
+from artifact_store import artifact_store, stage_key
+from pathway_cache import cohort_key, pathway_cache
+from metrics import instrument_stage
+from model_routing import routing_metadata, runs_stage
+import telemetry
+
+# Profiles of one cohort whose LLM stages run at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
 
 @entrypoint()
-def adaptive_learning_agent(student_profile: dict) -> dict:
+@instrument_stage("pipeline")
+async def adaptive_learning_agent(student_profile: dict) -> dict:
     """
     Main entrypoint for the adaptive learning pathway generation agent.
     Uses enhanced structured approach with detailed phase-by-phase explanations.
+
+    The entrypoint is async: call it with `await adaptive_learning_agent.ainvoke(profile)`
+    so the web server's event loop stays free while the upstream calls are in flight.
+    With `astream(profile, stream_mode="custom")` it emits one event per completed stage;
+    when the profile sets 'stream_phases' it also emits each phase, milestone and
+    explanation section as soon as Gemini finishes generating it.
+    Stages whose inputs match an earlier run are served from the artifact store
+    instead (their events carry 'reused': True), so a profile that only changes
+    its hobby reruns enhancement alone.
     """
-    # 1. Retrieve context
-    retrieval_result = perform_retrieval(student_profile).result()
-    combined_text = retrieval_result["combined_text"]
+    writer = get_stream_writer()
+    stage_timings = {}
+    pipeline_start = time.perf_counter()
+
+    reused_stages = []
+
+    # 1. Retrieve context, unless a run with the same topic, domain and learning style stored it
+    stage_start = time.perf_counter()
+    retrieval_key = stage_key("retrieval", student_profile)
+    retrieval_result = await artifact_store.aget("retrieval", retrieval_key, student_profile)
+    if retrieval_result is not None:
+        reused_stages.append("retrieval")
+    else:
+        retrieval_result = await perform_retrieval(student_profile)
+        # Only complete retrievals are reused; a timed-out query should be retried next time
+        if all(timing["status"] in ("ok", "cached") for timing in retrieval_result.get("timings", {}).values()):
+            await artifact_store.aput("retrieval", retrieval_key, retrieval_result)
     relevant_links = retrieval_result["relevant_links"]
+    stage_timings["retrieval"] = round(time.perf_counter() - stage_start, 3)
+    writer({
+        "event": "retrieval",
+        "relevant_links": relevant_links,
+        "query_timings": retrieval_result.get("timings", {}),
+        "context_stats": retrieval_result.get("context_stats", {}),
+        "seconds": stage_timings["retrieval"],
+        "reused": "retrieval" in reused_stages,
+    })
+    
+    enhanced_pathway = await _personalize(student_profile, retrieval_result, stage_timings, pipeline_start, writer,
+                                          reused_stages)
+    writer({"event": "complete", "pathway": enhanced_pathway, "stage_timings": stage_timings})
     
+    # 5. Return the enhanced structured response
+    return enhanced_pathway
+
+
+async def _personalize(student_profile: dict, retrieval_result: dict, stage_timings: dict,
+                       pipeline_start: float, writer, reused_stages: list = None) -> dict:
+    """
+    The profile-specific stages after retrieval: structured pathway generation and
+    explanation enhancement over the retrieved context, plus links and metadata.
+    Each stage is served from the artifact store when its inputs are unchanged
+    since an earlier run; metadata["reused_stages"] lists the stages that were.
+    """
+    reused_stages = reused_stages if reused_stages is not None else []
+    relevant_links = retrieval_result["relevant_links"]
+    # Retrieved context assembled once and shared by every LLM stage of the request
+    context = open_context(retrieval_result)
+
     # 2. Generate structured learning pathway
-    structured_pathway = generate_structured_pathway(student_profile, combined_text).result()
+    stage_start = time.perf_counter()
+    structured_key = stage_key("structured_pathway", student_profile, upstream=context.key)
+    structured_pathway = await artifact_store.aget("structured_pathway", structured_key, student_profile)
+    if structured_pathway is not None:
+        reused_stages.append("structured_pathway")
+    else:
+        if student_profile.get("stream_phases"):
+            structured_pathway = await generate_structured_pathway_incremental(student_profile, context)
+        else:
+            structured_pathway = await generate_structured_pathway(student_profile, context)
+        await artifact_store.aput("structured_pathway", structured_key, structured_pathway)
+    stage_timings["structured_pathway"] = round(time.perf_counter() - stage_start, 3)
+    writer({
+        "event": "structured_pathway",
+        "pathway": structured_pathway,
+        "seconds": stage_timings["structured_pathway"],
+        "reused": "structured_pathway" in reused_stages,
+    })
     
-    # 3. Enhance explanations with detailed phase-by-phase content
-    enhanced_pathway = enhance_structured_explanations(structured_pathway, student_profile).result()
+    # 3. Enhance explanations with detailed phase-by-phase content (skipped by the express tier)
+    if runs_stage("enhancement", student_profile):
+        stage_start = time.perf_counter()
+        enhancement_key = stage_key("enhancement", student_profile, upstream=structured_key)
+        sections = await artifact_store.aget("enhancement", enhancement_key, student_profile)
+        if sections is not None:
+            reused_stages.append("enhancement")
+            enhanced_pathway = {**structured_pathway, "explanation_and_kickstart_examples": sections}
+        else:
+            enhanced_pathway = await enhance_structured_explanations(structured_pathway, student_profile, context)
+            # Sections that fell back to the original content are regenerated next time
+            if not enhanced_pathway.get("metadata", {}).get("enhancement_fallbacks"):
+                await artifact_store.aput("enhancement", enhancement_key,
+                                          enhanced_pathway.get("explanation_and_kickstart_examples", []))
+        stage_timings["enhancement"] = round(time.perf_counter() - stage_start, 3)
+        writer({
+            "event": "enhanced_explanations",
+            "explanation_and_kickstart_examples": enhanced_pathway.get("explanation_and_kickstart_examples", []),
+            "seconds": stage_timings["enhancement"],
+            "reused": "enhancement" in reused_stages,
+        })
+    else:
+        enhanced_pathway = dict(structured_pathway)
     
     # 4. Add retrieved links to the enhanced pathway
     enhanced_pathway["relevant_links"] = relevant_links
-    
-    # 5. Return the enhanced structured response
+
+    stage_timings["total"] = round(time.perf_counter() - pipeline_start, 3)
+    telemetry.set_stage_timings(stage_timings)
+    enhanced_pathway["metadata"] = {
+        **enhanced_pathway.get("metadata", {}),
+        "stage_timings": stage_timings,
+        "context_stats": retrieval_result.get("context_stats", {}),
+        "query_statuses": {field: timing["status"] for field, timing in retrieval_result.get("timings", {}).items()},
+        "routing": routing_metadata(student_profile, stage_timings["total"]),
+        "context": context.stats(),
+        "reused_stages": reused_stages,
+    }
     return enhanced_pathway
+
+
+@entrypoint()
+@instrument_stage("cohort")
+async def cohort_learning_agent(cohort: dict) -> list:
+    """
+    Batch mode of adaptive_learning_agent for {"profiles": [...], "concurrency": n}.
+    Profiles are grouped by normalized topic and domain; each group runs retrieval
+    and context assembly once, then the profile-specific LLM stages fan out under
+    `concurrency` (default BATCH_CONCURRENCY). With `astream(stream_mode="custom")`
+    it emits a 'group_retrieval' event per group and a 'result' or 'error' event
+    per profile (with its index in the input) as soon as that profile finishes.
+    """
+    writer = get_stream_writer()
+    profiles = cohort["profiles"]
+    semaphore = asyncio.Semaphore(cohort.get("concurrency") or BATCH_CONCURRENCY)
+    events = [None] * len(profiles)
+    groups = defaultdict(list)
+    for index, profile in enumerate(profiles):
+        groups[cohort_key(profile)].append(index)
+
+    def emit(event: dict) -> None:
+        events[event["index"]] = event
+        writer(event)
+
+    async def personalize(index: int, retrieval_result: dict, retrieval_seconds: float, group_size: int):
+        async with semaphore:
+            start = time.perf_counter()
+            stage_timings = {"retrieval": retrieval_seconds}
+            try:
+                pathway = await _personalize(profiles[index], retrieval_result, stage_timings,
+                                             start - retrieval_seconds, lambda event: None)
+                pathway["metadata"]["cohort"] = {"group_size": group_size, "shared_retrieval": True}
+                emit({"event": "result", "index": index, "pathway": pathway})
+            except Exception as e:
+                print(f"Cohort pathway {index} failed: {e}")
+                emit({"event": "error", "index": index, "detail": str(e)})
+
+    async def run_group(indices: list):
+        start = time.perf_counter()
+        try:
+            retrieval_result = await perform_group_retrieval([profiles[i] for i in indices])
+        except Exception as e:
+            print(f"Cohort retrieval failed: {e}")
+            for index in indices:
+                emit({"event": "error", "index": index, "detail": str(e)})
+            return
+        retrieval_seconds = round(time.perf_counter() - start, 3)
+        writer({
+            "event": "group_retrieval",
+            "indices": indices,
+            "query_timings": retrieval_result.get("timings", {}),
+            "seconds": retrieval_seconds,
+        })
+        await asyncio.gather(*(
+            personalize(index, retrieval_result, retrieval_seconds, len(indices)) for index in indices
+        ))
+
+    await asyncio.gather(*(run_group(indices) for indices in groups.values()))
+    return events
+
+
+async def generate_pathway(student_profile: dict) -> dict:
+    """
+    Serves a pathway from the content-addressed pathway cache, running
+    adaptive_learning_agent only on a miss (or in the background when the
+    cached entry is stale).
+    """
+    return await pathway_cache.get_or_generate(student_profile, adaptive_learning_agent.ainvoke)
+
+
+async def stream_pathway_events(student_profile: dict):
+    """
+    Async generator of pipeline events for the streaming API.
+    A cached pathway is emitted as a single 'complete' event (a stale one is
+    refreshed in the background, as in generate_pathway); otherwise each
+    stage (and each phase of the structured pathway) is emitted as it finishes
+    and the final pathway is cached.
+    """
+    cached = await pathway_cache.peek(student_profile, adaptive_learning_agent.ainvoke)
+    if cached is not None:
+        yield {"event": "complete", "pathway": cached, "stage_timings": {}, "cached": True}
+        return
+
+    student_profile = {**student_profile, "stream_phases": True}
+    async for event in adaptive_learning_agent.astream(student_profile, stream_mode="custom"):
+        if event.get("event") == "complete":
+            await pathway_cache.put(student_profile, event["pathway"])
+        yield event
+
+
+async def stream_cohort_events(profiles: list, concurrency: int = None):
+    """
+    Async generator of per-profile events for the batch API. Cached pathways
+    are emitted first as 'result' events with 'cached': True; the remaining
+    profiles run through cohort_learning_agent and their pathways are cached.
+    Every event's 'index' refers to the position in `profiles`.
+    """
+    pending = []
+    for index, profile in enumerate(profiles):
+        cached = await pathway_cache.peek(profile, adaptive_learning_agent.ainvoke)
+        if cached is not None:
+            yield {"event": "result", "index": index, "pathway": cached, "cached": True}
+        else:
+            pending.append(index)
+    if not pending:
+        return
+
+    cohort = {"profiles": [profiles[i] for i in pending], "concurrency": concurrency}
+    async for event in cohort_learning_agent.astream(cohort, stream_mode="custom"):
+        if event.get("event") == "group_retrieval":
+            event = {**event, "indices": [pending[i] for i in event["indices"]]}
+        else:
+            event = {**event, "index": pending[event["index"]]}
+            if event["event"] == "result":
+                await pathway_cache.put(profiles[event["index"]], event["pathway"])
+        yield event
@@ -1,9 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Literal, Optional
+import hashlib
+import json
 import os
 from dotenv import load_dotenv
-from agent import adaptive_learning_agent
+from agent import generate_pathway, stream_cohort_events, stream_pathway_events
+from jobs import JOB_QUEUE_SIZE, JOB_WORKERS, JobManager, JobQueueFull, create_job_store
+from pathway_cache import is_degraded, pathway_cache, profile_key
+from response_encoding import EncodedBody, encode_json, etag_matches, negotiate_encoding
+from artifact_store import artifact_store
+from retrieval import retrieval_cache
+from singleflight import SingleFlight
+from client_pool import client_registry
+from metrics import register_stats, render_metrics
+from rate_limit import limiter_stats
+from call_policy import policy_stats
+from model_routing import resolve_tier
+import telemetry
 import logging
 from contextlib import asynccontextmanager
 
@@ -17,6 +33,69 @@ load_dotenv()
 # Health check state
 health_check_passed = False
 
+# Largest cohort accepted by the batch endpoint
+BATCH_MAX_PROFILES = int(os.getenv("BATCH_MAX_PROFILES", "100"))
+
+# Coalesces concurrent requests for the same canonical profile into one pipeline run
+generation_flight = SingleFlight()
+
+# Background pathway jobs, drained by a bounded pool of in-process workers
+job_manager = JobManager(stream_pathway_events, create_job_store(), workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE)
+
+register_stats("retrieval_cache", retrieval_cache.stats)
+register_stats("pathway_cache", pathway_cache.stats)
+register_stats("artifact_store", artifact_store.stats)
+register_stats("coalescing", generation_flight.stats)
+register_stats("client_pool", client_registry.stats)
+register_stats("jobs", job_manager.stats)
+register_stats("gemini_limiter", lambda: limiter_stats("gemini"))
+register_stats("tavily_limiter", lambda: limiter_stats("tavily"))
+register_stats("call_policy", policy_stats)
+
+def credentials_key(student_profile: dict) -> str:
+    """Hash of the profile's API keys, so only callers with the same credentials share a run"""
+    credentials = f"{student_profile.get('google_api_key') or ''}\0{student_profile.get('tavily_api_key') or ''}"
+    return hashlib.sha256(credentials.encode("utf-8")).hexdigest()[:16]
+
+async def coalesced_generate_pathway(student_profile: dict) -> EncodedBody:
+    """
+    Runs generate_pathway once per distinct in-flight profile and credentials and
+    shares the encoded result. Direct callers bring their own API keys, so a run
+    (its quota and any bad-key error) is only shared between callers with the same keys.
+    """
+    key = profile_key(student_profile)
+    flight_key = f"{key}:{credentials_key(student_profile)}"
+    if student_profile.get("bypass_cache"):
+        flight_key += ":fresh"
+    return await generation_flight.do(flight_key, lambda: _generate_encoded(student_profile, key))
+
+async def _generate_encoded(student_profile: dict, key: str) -> EncodedBody:
+    pathway = await generate_pathway(student_profile)
+    if is_degraded(pathway):
+        # Not cached, so an earlier entry for this profile must not be served in its place
+        return encode_json(pathway)
+    # The cached entry's body is serialized and compressed once, not per response
+    return await pathway_cache.encoded(key) or encode_json(pathway)
+
+def pathway_response(request: Request, body: EncodedBody, pathway_id: str) -> Response:
+    """
+    Pre-serialized pathway in the best encoding the client accepts, with a
+    strong ETag and the opaque pathway id for GET /api/pathways/{id}.
+    Conditional GETs whose If-None-Match matches get a bodiless 304.
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), body.variants)
+    headers = {
+        "ETag": body.etag(encoding),
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+        "X-Pathway-Id": pathway_id,
+    }
+    if request.method == "GET" and etag_matches(request.headers.get("if-none-match", ""), body.digest):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body.body(encoding), media_type="application/json", headers=headers)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events for Cloud Run optimization"""
@@ -29,6 +108,7 @@ async def lifespan(app: FastAPI):
     try:
         # You can add startup validations here
         health_check_passed = True
+        job_manager.start()
         logger.info("Startup completed successfully")
     except Exception as e:
         logger.error(f"Startup failed: {e}")
@@ -38,6 +118,7 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Adaptive Learning Agent API...")
+    await job_manager.stop()
 
 app = FastAPI(
     title="Adaptive Learning Agent API", 
@@ -63,6 +144,8 @@ class StudentProfile(BaseModel):
     domain: str
     google_api_key: str
     tavily_api_key: str
+    bypass_cache: bool = False
+    tier: Optional[Literal["express", "standard", "quality"]] = None
 
 class ReactLearningPreferences(BaseModel):
     """Model for React frontend format"""
@@ -70,6 +153,13 @@ class ReactLearningPreferences(BaseModel):
     topic: str
     hobbies: str
     domain: str
+    bypassCache: bool = False
+    tier: Optional[Literal["express", "standard", "quality"]] = None
+
+class CohortRequest(BaseModel):
+    """Batch of React frontend profiles, e.g. a whole cohort onboarding at once"""
+    profiles: List[ReactLearningPreferences]
+    concurrency: Optional[int] = None
 
 @app.get("/")
 async def root():
@@ -82,7 +172,13 @@ async def root():
         "health": "/health",
         "endpoints": {
             "generate_pathway": "/api/generate-pathway",
-            "generate_pathway_direct": "/api/generate-pathway-direct"
+            "generate_pathway_stream": "/api/generate-pathway/stream",
+            "generate_pathway_direct": "/api/generate-pathway-direct",
+            "generate_pathways_batch": "/api/generate-pathways/batch",
+            "jobs": "/api/jobs",
+            "pathways": "/api/pathways/{pathway_id}",
+            "cache_stats": "/api/cache/stats",
+            "metrics": "/metrics"
         }
     }
 
@@ -99,36 +195,51 @@ async def health_check():
     else:
         raise HTTPException(status_code=503, detail="Service not ready")
 
+def build_react_profile(preferences: ReactLearningPreferences) -> dict:
+    """Maps the React frontend format to the backend profile, using the server's API keys"""
+    # Get API keys from environment variables
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    tavily_api_key = os.getenv("TAVILY_API_KEY")
+    
+    if not google_api_key or not tavily_api_key:
+        logger.error("API keys not found in environment variables")
+        raise HTTPException(
+            status_code=500, 
+            detail="Server configuration error: API keys not configured on server."
+        )
+    
+    # Map React frontend format to backend format with environment API keys
+    return {
+        "learning_style": preferences.learningStyle,
+        "progress": preferences.topic,  # React uses 'topic', backend uses 'progress'
+        "hobby": preferences.hobbies,
+        "domain": preferences.domain,
+        "google_api_key": google_api_key,
+        "tavily_api_key": tavily_api_key,
+        "bypass_cache": preferences.bypassCache,
+        # Latency/quality tier: "express" is one call without enhancement
+        "tier": resolve_tier({"tier": preferences.tier})
+    }
+
+def encode_stream_event(event: dict, stream_format: str) -> str:
+    """Serializes one pipeline event as an NDJSON line or an SSE message"""
+    payload = json.dumps(event)
+    if stream_format == "sse":
+        return f"event: {event.get('event', 'message')}\ndata: {payload}\n\n"
+    return payload + "\n"
+
 @app.post("/api/generate-pathway")
-async def generate_pathway_api(preferences: ReactLearningPreferences):
+async def generate_pathway_api(preferences: ReactLearningPreferences, request: Request):
     """API endpoint for React frontend - maps React format to backend format"""
     try:
         logger.info(f"Received pathway generation request for topic: {preferences.topic}")
         
-        # Get API keys from environment variables
-        google_api_key = os.getenv("GOOGLE_API_KEY")
-        tavily_api_key = os.getenv("TAVILY_API_KEY")
-        
-        if not google_api_key or not tavily_api_key:
-            logger.error("API keys not found in environment variables")
-            raise HTTPException(
-                status_code=500, 
-                detail="Server configuration error: API keys not configured on server."
-            )
+        student_profile = build_react_profile(preferences)
         
-        # Map React frontend format to backend format with environment API keys
-        student_profile = {
-            "learning_style": preferences.learningStyle,
-            "progress": preferences.topic,  # React uses 'topic', backend uses 'progress'
-            "hobby": preferences.hobbies,
-            "domain": preferences.domain,
-            "google_api_key": google_api_key,
-            "tavily_api_key": tavily_api_key
-        }
-        
-        result = adaptive_learning_agent.invoke(student_profile)
+        with telemetry.track_request("generate-pathway"):
+            result = await coalesced_generate_pathway(student_profile)
         logger.info("Pathway generation completed successfully")
-        return result
+        return pathway_response(request, result, await pathway_cache.pathway_id(profile_key(student_profile)))
         
     except HTTPException:
         raise
@@ -136,8 +247,38 @@ async def generate_pathway_api(preferences: ReactLearningPreferences):
         logger.error(f"Error generating pathway: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/generate-pathway/stream")
+async def generate_pathway_stream_api(
+    preferences: ReactLearningPreferences,
+    stream_format: Literal["ndjson", "sse"] = Query("ndjson", alias="format")
+):
+    """
+    Streaming variant of /api/generate-pathway for the React frontend.
+    Emits 'retrieval', one 'phase' / 'milestone' / 'explanation_section' event per
+    element as Gemini produces it, 'structured_pathway', 'enhanced_explanations' and
+    a final 'complete' event (with per-stage timings) as NDJSON lines or SSE messages.
+    """
+    logger.info(f"Received streaming pathway request for topic: {preferences.topic}")
+    student_profile = build_react_profile(preferences)
+    
+    async def event_stream():
+        try:
+            async for event in stream_pathway_events(student_profile):
+                yield encode_stream_event(event, stream_format)
+            logger.info("Streaming pathway generation completed successfully")
+        except Exception as e:
+            logger.error(f"Error streaming pathway: {str(e)}")
+            yield encode_stream_event({"event": "error", "detail": str(e)}, stream_format)
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/generate-pathway-direct")
-async def generate_pathway_direct_api(profile: StudentProfile):
+async def generate_pathway_direct_api(profile: StudentProfile, request: Request):
     """API endpoint for direct calls with full profile including API keys"""
     try:
         logger.info(f"Received direct pathway generation request for: {profile.progress}")
@@ -151,6 +292,8 @@ async def generate_pathway_direct_api(profile: StudentProfile):
         if not student_profile.get("tavily_api_key"):
             student_profile["tavily_api_key"] = os.getenv("TAVILY_API_KEY")
         
+        student_profile["tier"] = resolve_tier(student_profile)
+        
         # Validate API keys are available
         if not student_profile["google_api_key"] or not student_profile["tavily_api_key"]:
             raise HTTPException(
@@ -158,14 +301,121 @@ async def generate_pathway_direct_api(profile: StudentProfile):
                 detail="Server configuration error: API keys not available."
             )
         
-        result = adaptive_learning_agent.invoke(student_profile)
+        with telemetry.track_request("generate-pathway-direct"):
+            result = await coalesced_generate_pathway(student_profile)
         logger.info("Direct pathway generation completed successfully")
-        return result
+        return pathway_response(request, result, await pathway_cache.pathway_id(profile_key(student_profile)))
         
     except Exception as e:
         logger.error(f"Error in direct pathway generation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/generate-pathways/batch")
+async def generate_pathways_batch_api(request: CohortRequest):
+    """
+    Generates pathways for a cohort and streams them back as NDJSON.
+    Profiles with the same topic and domain share one retrieval; each line is a
+    'group_retrieval', 'result' or 'error' event whose 'index' is the profile's
+    position in the request, followed by a final 'summary' line.
+    """
+    if not request.profiles:
+        raise HTTPException(status_code=400, detail="No profiles provided.")
+    if len(request.profiles) > BATCH_MAX_PROFILES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_PROFILES} profiles per batch.")
+    logger.info(f"Received batch pathway request for {len(request.profiles)} profiles")
+    profiles = [build_react_profile(preferences) for preferences in request.profiles]
+    concurrency = max(1, request.concurrency) if request.concurrency else None
+
+    async def event_stream():
+        summary = {"event": "summary", "profiles": len(profiles), "groups": 0,
+                   "succeeded": 0, "failed": 0, "cached": 0}
+        finished = set()
+        try:
+            with telemetry.track_request("generate-pathways-batch"):
+                async for event in stream_cohort_events(profiles, concurrency):
+                    if event["event"] == "group_retrieval":
+                        summary["groups"] += 1
+                    elif event["event"] == "result":
+                        summary["succeeded"] += 1
+                        summary["cached"] += bool(event.get("cached"))
+                        finished.add(event["index"])
+                    else:
+                        summary["failed"] += 1
+                        finished.add(event["index"])
+                    yield encode_stream_event(event, "ndjson")
+            logger.info(f"Batch pathway generation completed: {summary}")
+        except Exception as e:
+            logger.error(f"Error in batch pathway generation: {str(e)}")
+            # Every profile without a result or error of its own failed with the batch
+            unfinished = [index for index in range(len(profiles)) if index not in finished]
+            summary["failed"] += len(unfinished)
+            yield encode_stream_event({"event": "error", "indices": unfinished, "detail": str(e)}, "ndjson")
+        yield encode_stream_event(summary, "ndjson")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/jobs", status_code=202)
+async def create_job_api(preferences: ReactLearningPreferences):
+    """
+    Enqueues a pathway generation job and returns its ID immediately.
+    Poll GET /api/jobs/{job_id} for progress and the result. Responds 429 with
+    Retry-After when the queue is full.
+    """
+    student_profile = build_react_profile(preferences)
+    try:
+        job = job_manager.submit(student_profile)
+    except JobQueueFull as e:
+        logger.warning(f"Rejected job for topic {preferences.topic}: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many pathway jobs in progress, please retry later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    logger.info(f"Queued job {job['id']} for topic: {preferences.topic}")
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/api/jobs/{job['id']}"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_api(job_id: str):
+    """Job status ('queued', 'running', 'succeeded' or 'failed'), per-stage progress and the result"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/pathways/{pathway_id}")
+async def get_pathway_api(pathway_id: str, request: Request):
+    """
+    A stored pathway by the id returned in the X-Pathway-Id header. Supports
+    If-None-Match (304 when unchanged) and gzip/brotli Accept-Encoding.
+    """
+    body = await pathway_cache.encoded_by_id(pathway_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Pathway not found")
+    return pathway_response(request, body, pathway_id)
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the server-side caches, request coalescing, client reuse, upstream rate limits, retries and hedges"""
+    return {
+        "retrieval": retrieval_cache.stats(),
+        "pathway": pathway_cache.stats(),
+        "artifacts": artifact_store.stats(),
+        "coalescing": generation_flight.stats(),
+        "clients": client_registry.stats(),
+        "rate_limits": {"gemini": limiter_stats("gemini"), "tavily": limiter_stats("tavily")},
+        "call_policies": policy_stats()
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: per-stage latency, in-flight stages, upstream errors, tokens and cache counters"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/api/health")
 async def api_health_check():
     """API health check endpoint"""
@@ -175,7 +425,13 @@ async def api_health_check():
         "version": "1.0.0",
         "endpoints": [
             "/api/generate-pathway",
+            "/api/generate-pathway/stream",
             "/api/generate-pathway-direct",
+            "/api/generate-pathways/batch",
+            "/api/jobs",
+            "/api/pathways/{pathway_id}",
+            "/api/cache/stats",
+            "/metrics",
             "/docs",
             "/health"
         ],
@@ -68,7 +68,7 @@ async def generate_pathway_api(preferences: ReactLearningPreferences):
             "domain": preferences.domain,
         }
         
-        result = adaptive_learning_agent.invoke(student_profile)
+        result = await adaptive_learning_agent.ainvoke(student_profile)
         return result
         
     except Exception as e:
@@ -81,7 +81,7 @@ async def generate_pathway_direct_api(profile: StudentProfile):
         # Convert to dict for the agent
         student_profile = profile.dict()
         
-        result = adaptive_learning_agent.invoke(student_profile)
+        result = await adaptive_learning_agent.ainvoke(student_profile)
         return result
         
     except Exception as e:
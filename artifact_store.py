@@ -0,0 +1,116 @@
+"""
+Per-stage artifacts of pathway runs, for incremental regeneration.
+
+Each stage's output is stored under a key built from only the profile fields
+that stage reads, plus the key of the artifact it was built from:
+
+    retrieval           topic, domain, learning style
+    structured_pathway  the retrieved context it was generated from, topic,
+                        domain, learning style, tier and model
+    enhancement         the structured pathway it rewrote, hobby and the other
+                        prompt fields, and model
+
+so a resubmitted profile reruns only the stages whose inputs changed. For
+tiers that run enhancement the structured pathway prompts leave out the hobby
+(model_routing.pathway_uses_hobby), so a hobby-only change reuses retrieval
+and phase generation and reruns enhancement, which writes the hobby-specific
+explanation sections. Tiers that skip enhancement make hobby a
+structured_pathway field instead.
+
+Retrieval artifacts expire with the retrieval cache (RETRIEVAL_CACHE_TTL) when
+that is shorter than ARTIFACT_STORE_TTL, so search results are not kept longer
+than the retrieval cache would keep them.
+"""
+import copy
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from cache import TieredCache
+from model_routing import model_for, pathway_uses_hobby, resolve_tier
+from pathway_cache import canonical_profile
+
+STAGES = ("retrieval", "structured_pathway", "enhancement")
+
+# Profile fields each stage reads
+STAGE_FIELDS = {
+    "retrieval": ("progress", "domain", "learning_style"),
+    "structured_pathway": ("progress", "domain", "learning_style"),
+    "enhancement": ("progress", "domain", "learning_style", "hobby"),
+}
+
+
+def stage_fields(stage: str, student_profile: dict) -> tuple:
+    """Profile fields `stage` depends on for this profile's tier"""
+    fields = STAGE_FIELDS[stage]
+    if stage == "structured_pathway" and pathway_uses_hobby(student_profile):
+        fields += ("hobby",)
+    return fields
+
+
+def stage_key(stage: str, student_profile: dict, upstream: str = "") -> str:
+    """Content hash of a stage's inputs: its profile fields, tier, model and upstream artifact key"""
+    canonical = canonical_profile(student_profile)
+    inputs = {field: canonical.get(field) for field in stage_fields(stage, student_profile)}
+    if stage != "retrieval":
+        inputs.update(tier=resolve_tier(student_profile), model=model_for(stage, student_profile))
+    payload = json.dumps({"stage": stage, "upstream": upstream, "inputs": inputs},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """TieredCache of stage artifacts with per-stage reuse counters"""
+
+    def __init__(self, ttl: float = 86400, maxsize: int = 512, path: Optional[str] = None,
+                 stage_ttls: Optional[Dict[str, float]] = None):
+        self.store = TieredCache("artifacts", maxsize=maxsize, ttl=ttl, path=path)
+        # Stages whose artifacts expire before the store's ttl
+        self.stage_ttls = {stage: min(ttl, stage_ttl) for stage, stage_ttl in (stage_ttls or {}).items()}
+        self.counters = {f"{stage}_{outcome}": 0 for stage in STAGES for outcome in ("reused", "computed")}
+
+    def get(self, stage: str, key: str, student_profile: dict) -> Optional[Any]:
+        """The stored artifact, or None on a miss or when the profile bypasses caches"""
+        if student_profile.get("bypass_cache"):
+            self.store.record_bypass()
+            return None
+        return self._reuse(stage, self.store.get_entry(f"{stage}:{key}"))
+
+    async def aget(self, stage: str, key: str, student_profile: dict) -> Optional[Any]:
+        """get() reading the disk tier in a worker thread, for use on the event loop"""
+        if student_profile.get("bypass_cache"):
+            self.store.record_bypass()
+            return None
+        return self._reuse(stage, await self.store.aget_entry(f"{stage}:{key}"))
+
+    def put(self, stage: str, key: str, artifact: Any) -> None:
+        self.counters[f"{stage}_computed"] += 1
+        self.store.set(f"{stage}:{key}", copy.deepcopy(artifact))
+
+    async def aput(self, stage: str, key: str, artifact: Any) -> None:
+        """put() writing the disk tier in a worker thread"""
+        self.counters[f"{stage}_computed"] += 1
+        await self.store.aset(f"{stage}:{key}", copy.deepcopy(artifact))
+
+    def _reuse(self, stage: str, entry: Optional[tuple]) -> Optional[Any]:
+        if entry is None:
+            return None
+        artifact, stored_at = entry
+        if time.time() - stored_at > self.stage_ttls.get(stage, self.store.ttl):
+            return None
+        self.counters[f"{stage}_reused"] += 1
+        return copy.deepcopy(artifact)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.store.stats(), **self.counters}
+
+
+artifact_store = ArtifactStore(
+    ttl=float(os.getenv("ARTIFACT_STORE_TTL", "86400")),
+    maxsize=int(os.getenv("ARTIFACT_STORE_MAX_ENTRIES", "512")),
+    path=os.getenv("ARTIFACT_STORE_PATH") or None,
+    # Same default as retrieval.retrieval_cache
+    stage_ttls={"retrieval": float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))},
+)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the in-process BM25 reranker.
+
+Builds a synthetic retrieval result (default: 30 documents, ~10 chunks each)
+and times index construction + scoring for the three profile queries.
+
+Usage: python benchmarks/bench_reranker.py [--docs 30] [--words 1200] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reranker import rerank_documents
+
+VOCABULARY = (
+    "agent graph node edge state memory tool retrieval prompt model langgraph workflow "
+    "planner executor checkpoint stream async function call vector embedding search "
+    "healthcare patient cricket batting bowling example project practice tutorial "
+    "concept theory history milestone pipeline evaluation latency cost token context"
+).split()
+
+
+def synthetic_docs(count: int, words: int, seed: int = 7):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        sentences = []
+        for _ in range(words // 12):
+            sentences.append(" ".join(rng.choice(VOCABULARY) for _ in range(12)).capitalize() + ".")
+        docs.append(SimpleNamespace(
+            page_content=" ".join(sentences),
+            metadata={"source": f"https://example.com/{i}"},
+        ))
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=30)
+    parser.add_argument("--words", type=int, default=1200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    docs = synthetic_docs(args.docs, args.words)
+    queries = [("Agentic AI using LangGraph", 1.0), ("healthcare", 0.5), ("hands-on examples", 0.5)]
+
+    timings = []
+    result = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = rerank_documents(docs, queries)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    print(f"Chunks scored per run: {result['stats']['chunks_scored']}")
+    print(f"Runs: {args.repeat}")
+    print(f"p50: {statistics.median(timings):.2f} ms")
+    print(f"p95: {timings[int(0.95 * (len(timings) - 1))]:.2f} ms")
+    print(f"max: {timings[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Latency comparison of the monolithic and decomposed pathway generation modes.
+
+Runs both modes on the same profile and context (GOOGLE_API_KEY must be set)
+and prints wall-clock time per run and the per-part timings of decomposed mode.
+
+Usage: python benchmarks/compare_pathway_modes.py [--runs 3] [--topic "LangGraph"]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from context_handle import ContextHandle
+from structured_agent import _generate_decomposed, _generate_monolithic
+
+SAMPLE_CONTEXT = (
+    "LangGraph is a library for building stateful, multi-actor applications with LLMs. "
+    "It models agent workflows as graphs of nodes and edges with shared state, supports "
+    "cycles, persistence via checkpointers, human-in-the-loop interrupts and streaming."
+)
+
+
+async def run(args):
+    profile = {
+        "learning_style": args.learning_style,
+        "progress": args.topic,
+        "hobby": args.hobby,
+        "domain": args.domain,
+    }
+    context = await ContextHandle(SAMPLE_CONTEXT).bind(os.getenv("GOOGLE_API_KEY"), "gemini-2.5-flash")
+
+    results = {"monolithic": [], "decomposed": []}
+    for i in range(args.runs):
+        start = time.perf_counter()
+        await _generate_monolithic(context, profile)
+        results["monolithic"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pathway = await _generate_decomposed(context, profile)
+        results["decomposed"].append(time.perf_counter() - start)
+        print(f"Run {i + 1} decomposed parts: {pathway['metadata']['structured_generation']['part_seconds']}")
+
+    for mode, timings in results.items():
+        print(f"{mode:>11}: median {statistics.median(timings):.2f}s, "
+              f"min {min(timings):.2f}s, max {max(timings):.2f}s")
+    speedup = statistics.median(results["monolithic"]) / statistics.median(results["decomposed"])
+    print(f"Decomposed speedup: {speedup:.2f}x")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--topic", default="Agentic AI using LangGraph")
+    parser.add_argument("--domain", default="health care")
+    parser.add_argument("--hobby", default="Cricket")
+    parser.add_argument("--learning-style", default="intuitive and real-world examples")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the pathway API.
+
+Replays student profiles from a JSONL file against app_cloudrun.app, either
+in-process (default) or over HTTP (--url), at a fixed concurrency (closed
+loop) or a fixed arrival rate (open loop, Poisson arrivals). With
+--fake-upstreams the Gemini and Tavily clients are pointed at the local
+fakes from fake_upstreams.py, so runs are reproducible offline.
+
+Reports throughput, p50/p95/p99 latency, a per-stage breakdown (from the
+response's metadata.stage_timings) and error rates, optionally saves the
+report and diffs it against a saved baseline. A relative throughput or latency
+regression beyond --max-regression, or an error-rate increase beyond
+--max-error-rate-increase percentage points, exits non-zero, so the script can
+gate serving-path changes.
+
+Usage:
+    python benchmarks/loadtest.py --fake-upstreams fast --concurrency 20 --requests 200
+    python benchmarks/loadtest.py --fake-upstreams fast --rate 5 --duration 60 \\
+        --baseline benchmarks/baseline.json
+    python benchmarks/loadtest.py --url http://localhost:8080 --concurrency 10
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_PROFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.jsonl")
+
+# Metrics compared against the baseline, and whether higher is better
+GATED_METRICS = {
+    "throughput_rps": True,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "error_rate": False,
+}
+
+
+def load_profiles(path: str) -> List[Dict[str, Any]]:
+    """Reads React-format profiles; backend-format lines (progress/hobby) are mapped"""
+    profiles = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            profiles.append({
+                "learningStyle": row.get("learningStyle", row.get("learning_style")),
+                "topic": row.get("topic", row.get("progress")),
+                "hobbies": row.get("hobbies", row.get("hobby")),
+                "domain": row.get("domain"),
+            })
+    return profiles
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return round(ordered[rank], 4)
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, profiles, endpoint: str, bypass_cache: bool):
+        self.client = client
+        self.profiles = itertools.cycle(profiles)
+        self.endpoint = endpoint
+        self.bypass_cache = bypass_cache
+        self.samples: List[Dict[str, Any]] = []
+
+    async def one_request(self) -> None:
+        payload = dict(next(self.profiles), bypassCache=self.bypass_cache)
+        start = time.perf_counter()
+        sample = {"status": None, "stages": {}}
+        try:
+            response = await self.client.post(self.endpoint, json=payload)
+            sample["status"] = response.status_code
+            if response.status_code == 200:
+                sample["stages"] = response.json().get("metadata", {}).get("stage_timings", {})
+        except Exception as e:
+            sample["status"] = type(e).__name__
+        sample["latency"] = time.perf_counter() - start
+        self.samples.append(sample)
+
+    async def run_closed_loop(self, concurrency: int, total: int, duration: Optional[float]) -> None:
+        issued = itertools.count()
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def worker():
+            while next(issued) < total and (deadline is None or time.perf_counter() < deadline):
+                await self.one_request()
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def run_open_loop(self, rate: float, total: int, duration: Optional[float], seed: int) -> None:
+        rng = random.Random(seed)
+        deadline = time.perf_counter() + duration if duration else None
+        tasks = []
+        for _ in range(total):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            tasks.append(asyncio.create_task(self.one_request()))
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        latencies = [s["latency"] for s in self.samples]
+        ok = [s for s in self.samples if s["status"] == 200]
+        statuses = Counter(str(s["status"]) for s in self.samples)
+        stages = defaultdict(list)
+        for sample in ok:
+            for stage, seconds in sample["stages"].items():
+                stages[stage].append(seconds)
+        return {
+            "requests": len(self.samples),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_rps": round(len(ok) / wall_seconds, 4) if wall_seconds else 0.0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "error_rate": round(1 - len(ok) / len(self.samples), 4) if self.samples else 0.0,
+            "status_counts": dict(statuses),
+            "stages": {
+                stage: {"p50": percentile(values, 50), "p95": percentile(values, 95),
+                        "p99": percentile(values, 99)}
+                for stage, values in sorted(stages.items())
+            },
+        }
+
+
+def diff_against_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float,
+                          max_error_rate_increase: float = 0.01) -> List[str]:
+    """
+    Prints a comparison table and returns the metrics that regressed past the
+    tolerance: a relative change beyond max_regression for throughput and
+    latency, an absolute increase beyond max_error_rate_increase for error_rate.
+    """
+    regressions = []
+    print("\nBaseline comparison:")
+    for metric, higher_is_better in GATED_METRICS.items():
+        old, new = baseline.get(metric), report.get(metric)
+        if old is None or new is None:
+            continue
+        if metric == "error_rate":
+            worse = new - old
+            shown = f"{worse * 100:+.2f} pp"
+            tolerance = max_error_rate_increase
+        elif old:
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            shown = f"{change:+.1%}"
+            tolerance = max_regression
+        else:
+            # No relative change from a zero baseline
+            worse, shown, tolerance = 0.0, "no baseline", max_regression
+        flag = ""
+        if worse > tolerance:
+            regressions.append(metric)
+            flag = "  <-- REGRESSION"
+        print(f"  {metric:>15}: {old} -> {new} ({shown}){flag}")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Requests: {report['requests']} in {report['wall_seconds']}s")
+    print(f"Throughput: {report['throughput_rps']} successful req/s")
+    print(f"Latency p50/p95/p99: {report['latency_p50']}s / {report['latency_p95']}s / {report['latency_p99']}s")
+    print(f"Error rate: {report['error_rate']:.2%} {report['status_counts']}")
+    if report["stages"]:
+        print("Per-stage latency (p50 / p95 / p99, seconds):")
+        for stage, values in report["stages"].items():
+            print(f"  {stage:>20}: {values['p50']} / {values['p95']} / {values['p99']}")
+
+
+async def run(args) -> Dict[str, Any]:
+    profiles = load_profiles(args.profiles)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        import app_cloudrun
+        app_cloudrun.health_check_passed = True
+        transport = httpx.ASGITransport(app=app_cloudrun.app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout)
+
+    async with client:
+        test = LoadTest(client, profiles, args.endpoint, args.bypass_cache)
+        start = time.perf_counter()
+        if args.rate:
+            await test.run_open_loop(args.rate, args.requests, args.duration, args.seed)
+        else:
+            await test.run_closed_loop(args.concurrency, args.requests, args.duration)
+        return test.report(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default=DEFAULT_PROFILES, help="JSONL file of student profiles")
+    parser.add_argument("--url", help="Base URL of a running server (default: drive the app in-process)")
+    parser.add_argument("--endpoint", default="/api/generate-pathway")
+    parser.add_argument("--concurrency", type=int, default=10, help="Closed-loop concurrent clients")
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate in requests/second")
+    parser.add_argument("--requests", type=int, default=100, help="Maximum number of requests")
+    parser.add_argument("--duration", type=float, help="Stop issuing requests after this many seconds")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--bypass-cache", action="store_true", help="Ask the server to skip its caches")
+    parser.add_argument("--fake-upstreams", metavar="PRESET", help="Run against fake_upstreams.py with this preset")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Allowed relative regression of throughput and latency (default 10%%)")
+    parser.add_argument("--max-error-rate-increase", type=float, default=0.01,
+                        help="Allowed absolute error-rate increase (default 0.01, i.e. 1 percentage point)")
+    args = parser.parse_args()
+
+    fakes = contextlib.nullcontext()
+    if args.fake_upstreams:
+        from fake_upstreams import PRESETS, running_fake_upstreams
+        preset = PRESETS[args.fake_upstreams]
+        fakes = running_fake_upstreams(preset["gemini"], preset["tavily"], seed=args.seed)
+
+    with fakes:
+        report = asyncio.run(run(args))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = diff_against_baseline(report, json.load(f), args.max_regression,
+                                                args.max_error_rate_increase)
+        if regressions:
+            print(f"\nFAILED: regression in {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
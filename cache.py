@@ -0,0 +1,191 @@
+"""
+Reusable TTL caches for the adaptive learning agent.
+
+A TieredCache combines a bounded in-memory LRU tier with an optional
+SQLite-backed tier, so several instances mounting the same volume can
+share entries. Values must be JSON-serializable. The async accessors
+(aget/aset) run the SQLite tier in a thread so callers on the event loop do
+not block on disk I/O.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TTLCache:
+    """Bounded in-memory LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Returns (value, stored_at) or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        self._entries[key] = (value, stored_at if stored_at is not None else time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """File-backed cache tier shared by every process that opens the same path"""
+
+    def __init__(self, path: str, ttl: float = 3600, table: str = "cache"):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        # The connection is shared by the event loop and the threads running aget/aset
+        self._lock = threading.RLock()
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.ttl:
+                self.delete(key)
+                return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), stored_at if stored_at is not None else time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+class TieredCache:
+    """
+    Memory LRU tier in front of an optional SQLite tier, with hit/miss counters.
+    Disk hits are promoted into memory.
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl: float = 3600, path: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk = SQLiteCache(path, ttl=ttl, table=name) if path else None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "sets": 0}
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self._memory_entry(key)
+        if entry is None and self.disk is not None:
+            entry = self._promote(key, self._read_disk(key))
+        if entry is None:
+            self.counters["misses"] += 1
+        return entry
+
+    async def aget_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """get_entry() with the disk read run in a thread"""
+        entry = self._memory_entry(key)
+        if entry is None and self.disk is not None:
+            entry = self._promote(key, await asyncio.to_thread(self._read_disk, key))
+        if entry is None:
+            self.counters["misses"] += 1
+        return entry
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    async def aget(self, key: str) -> Optional[Any]:
+        entry = await self.aget_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        stored_at = self._set_memory(key, value)
+        if self.disk is not None:
+            self._write_disk(key, value, stored_at)
+
+    async def aset(self, key: str, value: Any) -> None:
+        """set() with the disk write run in a thread"""
+        stored_at = self._set_memory(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self._write_disk, key, value, stored_at)
+
+    def _memory_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self.memory.get_entry(key)
+        if entry is not None:
+            self.counters["memory_hits"] += 1
+        return entry
+
+    def _read_disk(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            return self.disk.get_entry(key)
+        except sqlite3.Error as e:
+            print(f"{self.name} cache disk read failed: {e}")
+            return None
+
+    def _promote(self, key: str, entry: Optional[Tuple[Any, float]]) -> Optional[Tuple[Any, float]]:
+        """Counts a disk hit and copies it into memory"""
+        if entry is not None:
+            self.counters["disk_hits"] += 1
+            self.memory.set(key, entry[0], stored_at=entry[1])
+        return entry
+
+    def _set_memory(self, key: str, value: Any) -> float:
+        stored_at = time.time()
+        self.counters["sets"] += 1
+        self.memory.set(key, value, stored_at=stored_at)
+        return stored_at
+
+    def _write_disk(self, key: str, value: Any, stored_at: float) -> None:
+        try:
+            self.disk.set(key, value, stored_at=stored_at)
+        except sqlite3.Error as e:
+            print(f"{self.name} cache disk write failed: {e}")
+
+    def record_bypass(self) -> None:
+        self.counters["bypassed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_enabled": self.disk is not None,
+            "ttl_seconds": self.ttl,
+        }
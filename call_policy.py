@@ -0,0 +1,188 @@
+"""
+Deadlines, retries and hedging for upstream calls.
+
+A CallPolicy wraps one kind of upstream call (a Tavily search, a structured
+pathway call, an enhancement call). Every attempt gets its own timeout and the
+whole call an overall deadline; retryable failures (timeouts, 429s, 5xx and
+connection errors) are retried with full-jitter exponential backoff while the
+deadline allows. With hedging on, an attempt still running after the observed
+p95 latency gets a duplicate request and whichever finishes first wins.
+
+Each attempt is a fresh call of the supplied factory; guarded_call() takes a
+rate_limit.upstream_limiter slot inside every attempt, so retries and hedges
+are rate limited like first attempts.
+
+Per policy, from the environment (e.g. RETRIEVAL_CALL_TIMEOUT):
+    <NAME>_CALL_TIMEOUT     seconds allowed per attempt
+    <NAME>_CALL_DEADLINE    seconds allowed for all attempts together
+    <NAME>_CALL_RETRIES     retries after the first attempt
+    <NAME>_CALL_HEDGE       1 to hedge slow attempts, 0 to disable
+"""
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import record_hedge, record_retry
+from rate_limit import is_rate_limited, upstream_limiter
+
+# (attempt timeout, deadline, retries, hedge) per policy; hedging LLM calls doubles their cost
+DEFAULT_POLICIES = {
+    "retrieval": (8.0, 15.0, 2, True),
+    "structured_pathway": (120.0, 180.0, 1, False),
+    "enhancement": (90.0, 150.0, 1, False),
+    "explanation": (90.0, 150.0, 1, False),
+}
+
+RETRYABLE_ERRORS = (
+    "TimeoutError", "ConnectError", "ConnectTimeout", "ReadTimeout", "ReadError", "WriteError",
+    "RemoteProtocolError", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+    "ServerError", "ConnectionError", "ConnectionResetError",
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, rate limits, 5xx responses and dropped connections"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)) or is_rate_limited(error):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+class CallPolicy:
+    """Timeout, jittered retries and optional p95 hedging for one kind of upstream call"""
+
+    def __init__(self, name: str, timeout: float, deadline: float, retries: int = 1, hedge: bool = False,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, hedge_quantile: float = 0.95,
+                 min_samples: int = 20, window: int = 200):
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge = hedge
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self.counters = {"calls": 0, "retries": 0, "hedges_fired": 0, "hedges_won": 0, "failures": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Observed latency quantile after which a hedge is fired, once enough samples exist"""
+        if not self.hedge or len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[max(0, math.ceil(self.hedge_quantile * len(ordered)) - 1)]
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number `attempt` (from 1)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def run(self, factory: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        """
+        Awaits factory() under the policy and returns the first successful result.
+        Raises asyncio.TimeoutError once the deadline passes, or the last error.
+        """
+        self.counters["calls"] += 1
+        give_up_at = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        attempt = 0
+        while True:
+            remaining = give_up_at - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"{self.name} deadline exceeded")
+                return await self._attempt(factory, min(self.timeout, remaining))
+            except Exception as e:
+                pause = self.backoff(attempt + 1)
+                if (attempt >= self.retries or not is_retryable(e)
+                        or time.monotonic() + pause >= give_up_at):
+                    self.counters["failures"] += 1
+                    raise
+                attempt += 1
+                self.counters["retries"] += 1
+                record_retry(self.name)
+                print(f"Retrying {self.name} call ({attempt}/{self.retries}) after {type(e).__name__}")
+                await asyncio.sleep(pause)
+
+    async def _attempt(self, factory: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        start = time.monotonic()
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            result = await asyncio.wait_for(factory(), timeout)
+        else:
+            result = await asyncio.wait_for(self._hedged(factory, delay), timeout)
+        self._latencies.append(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, factory: Callable[[], Awaitable[Any]], delay: float) -> Any:
+        """Runs factory(), adding a duplicate after `delay` seconds; the first success wins"""
+        primary = asyncio.ensure_future(factory())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                hedge = asyncio.ensure_future(factory())
+                tasks.add(hedge)
+                self.counters["hedges_fired"] += 1
+                record_hedge(self.name, "fired")
+            error = None
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.counters["hedges_won"] += 1
+                            record_hedge(self.name, "won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        return {**self.counters, "hedge_delay_seconds": round(delay, 3) if delay is not None else 0.0}
+
+
+def _policy_from_env(name: str) -> CallPolicy:
+    timeout, deadline, retries, hedge = DEFAULT_POLICIES.get(name, (60.0, 120.0, 1, False))
+    prefix = name.upper()
+    return CallPolicy(
+        name,
+        timeout=float(os.getenv(f"{prefix}_CALL_TIMEOUT", timeout)),
+        deadline=float(os.getenv(f"{prefix}_CALL_DEADLINE", deadline)),
+        retries=int(os.getenv(f"{prefix}_CALL_RETRIES", retries)),
+        hedge=os.getenv(f"{prefix}_CALL_HEDGE", "1" if hedge else "0") == "1",
+    )
+
+
+_policies: Dict[str, CallPolicy] = {}
+
+
+def call_policy(name: str) -> CallPolicy:
+    """Process-wide policy for a kind of call, configured from the environment on first use"""
+    if name not in _policies:
+        _policies[name] = _policy_from_env(name)
+    return _policies[name]
+
+
+async def guarded_call(policy: str, provider: str, factory: Callable[[], Awaitable[Any]],
+                       deadline: Optional[float] = None) -> Any:
+    """Runs factory() under the named call policy, each attempt holding a rate-limiter slot for `provider`"""
+    async def attempt():
+        async with upstream_limiter(provider).slot():
+            return await factory()
+    return await call_policy(policy).run(attempt, deadline=deadline)
+
+
+def policy_stats() -> Dict[str, Any]:
+    """Counters of every policy used so far, flattened as <policy>_<counter>"""
+    return {f"{name}_{key}": value for name, policy in _policies.items() for key, value in policy.stats().items()}
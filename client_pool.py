@@ -0,0 +1,215 @@
+"""
+Registry of warm, reusable upstream clients.
+
+Constructing a ChatGoogleGenerativeAI or a Tavily retriever per call also
+means new TLS/HTTP connections per call. Clients are instead cached by
+(provider, model, API key hash, options) in a bounded LRU, so requests that
+share credentials - including per-user keys on /api/generate-pathway-direct -
+reuse the same client and its connection pool.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from google.ai.generativelanguage_v1beta.types import GenerateContentResponse
+from google.protobuf import json_format
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+# Request building and response parsing of the pinned langchain_google_genai
+from langchain_google_genai.chat_models import _response_to_result
+
+# Maximum number of distinct clients kept warm
+CLIENT_POOL_MAX_SIZE = int(os.getenv("CLIENT_POOL_MAX_SIZE", "32"))
+
+
+def _key_hash(api_key: Optional[str]) -> str:
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ClientRegistry:
+    """Bounded LRU of constructed clients with reuse counters"""
+
+    def __init__(self, maxsize: int = CLIENT_POOL_MAX_SIZE):
+        self.maxsize = maxsize
+        self._clients: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self.counters = {"created": 0, "reused": 0, "evicted": 0}
+
+    def get(self, provider: str, model: str, api_key: Optional[str],
+            factory: Callable[[], Any], options: Optional[Dict[str, Any]] = None) -> Any:
+        """Returns the pooled client for this key, building it with `factory` on a miss"""
+        key = (provider, model, _key_hash(api_key), tuple(sorted((options or {}).items())))
+        client = self._clients.get(key)
+        if client is not None:
+            self.counters["reused"] += 1
+            self._clients.move_to_end(key)
+            return client
+        client = factory()
+        self.counters["created"] += 1
+        self._clients[key] = client
+        while len(self._clients) > self.maxsize:
+            self._clients.popitem(last=False)
+            self.counters["evicted"] += 1
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["created"] + self.counters["reused"]
+        return {
+            **self.counters,
+            "size": len(self._clients),
+            "max_size": self.maxsize,
+            "reuse_rate": round(self.counters["reused"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+client_registry = ClientRegistry()
+
+
+def pooled_client(provider: str, model: str, api_key: Optional[str],
+                  factory: Callable[[], Any], **options) -> Any:
+    """Shortcut for client_registry.get"""
+    return client_registry.get(provider, model, api_key, factory, options)
+
+
+class RestChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """
+    Gemini client for a custom REST endpoint (GEMINI_API_ENDPOINT, e.g. the fakes in
+    fake_upstreams.py). The async gRPC client cannot talk to a REST endpoint, and the
+    SDK's fallback runs the sync REST transport on the default thread pool (cpu + 4
+    threads), which caps concurrent calls. Async calls are instead posted to the
+    endpoint over shared_http_client(), using the SDK's own request and response
+    conversions.
+    """
+
+    @property
+    def async_client(self):
+        return None
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        response = await self._post("generateContent", self._rest_request(messages, stop, kwargs))
+        return _response_to_result(_parse_response(response.json()))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        body = self._rest_request(messages, stop, kwargs)
+        url = f"{self._endpoint()}/v1beta/{self.model}:streamGenerateContent"
+        async with shared_http_client().stream("POST", url, headers=self._headers(), json=body,
+                                               timeout=self._timeout()) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            previous_usage = None
+            async for chunk in _json_array_items(response.aiter_text()):
+                result = _response_to_result(_parse_response(chunk), stream=True, prev_usage=previous_usage)
+                generation = result.generations[0]
+                # Gemini reports cumulative token counts; each chunk carries the difference
+                usage = generation.message.usage_metadata or {}
+                previous_usage = usage if previous_usage is None else {
+                    key: previous_usage.get(key, 0) + usage.get(key, 0)
+                    for key in ("input_tokens", "output_tokens", "total_tokens")
+                }
+                if run_manager:
+                    await run_manager.on_llm_new_token(generation.text)
+                yield generation
+
+    def _rest_request(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                      options: Dict[str, Any]) -> Dict[str, Any]:
+        request = self._prepare_request(
+            messages,
+            stop=stop,
+            tools=options.get("tools"),
+            functions=options.get("functions"),
+            safety_settings=options.get("safety_settings"),
+            tool_config=options.get("tool_config"),
+            generation_config=options.get("generation_config"),
+            cached_content=options.get("cached_content") or self.cached_content,
+            tool_choice=options.get("tool_choice"),
+        )
+        # The same JSON the REST transport sends; the model goes in the URL
+        body = json_format.MessageToDict(type(request).pb(request), use_integers_for_enums=True)
+        body.pop("model", None)
+        return body
+
+    async def _post(self, action: str, body: Dict[str, Any]) -> httpx.Response:
+        response = await shared_http_client().post(
+            f"{self._endpoint()}/v1beta/{self.model}:{action}",
+            headers=self._headers(), json=body, timeout=self._timeout(),
+        )
+        response.raise_for_status()
+        return response
+
+    def _endpoint(self) -> str:
+        endpoint = (self.client_options or {}).get("api_endpoint") or os.environ["GEMINI_API_ENDPOINT"]
+        if "://" not in endpoint:
+            endpoint = f"https://{endpoint}"
+        return endpoint.rstrip("/")
+
+    def _headers(self) -> Dict[str, str]:
+        api_key = self.google_api_key.get_secret_value() if self.google_api_key else ""
+        return {"x-goog-api-key": api_key}
+
+    def _timeout(self) -> httpx.Timeout:
+        # Generations can exceed the shared client's 30s read timeout; call_policy enforces the real deadline
+        return httpx.Timeout(self.timeout or 180.0, connect=5.0)
+
+
+def _parse_response(payload: Dict[str, Any]) -> GenerateContentResponse:
+    response = GenerateContentResponse()
+    json_format.ParseDict(payload, GenerateContentResponse.pb(response), ignore_unknown_fields=True)
+    return response
+
+
+async def _json_array_items(text_chunks: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    """Yields the objects of a streamed JSON array (streamGenerateContent) as each one completes"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    async for text in text_chunks:
+        buffer += text
+        while True:
+            buffer = buffer.lstrip(" \t\r\n[,")
+            if not buffer or buffer.startswith("]"):
+                break
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+            yield item
+            buffer = buffer[end:]
+
+
+def get_chat_model(api_key: Optional[str], model: str = "gemini-2.5-flash", **options) -> ChatGoogleGenerativeAI:
+    """Warm Gemini chat client for this model, key and options"""
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+
+    def build():
+        if endpoint:
+            return RestChatGoogleGenerativeAI(model=model, api_key=api_key, transport="rest",
+                                              client_options={"api_endpoint": endpoint}, **options)
+        return ChatGoogleGenerativeAI(model=model, api_key=api_key, **options)
+
+    return pooled_client("google", model, api_key, build, endpoint=endpoint, **options)
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop = None
+
+
+def shared_http_client() -> httpx.AsyncClient:
+    """
+    Process-wide keep-alive HTTP client for the current event loop, used for
+    upstream REST calls made outside the provider SDKs.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+        _http_client_loop = loop
+    return _http_client
@@ -0,0 +1,166 @@
+"""
+Context assembly for the retrieved documents.
+
+Turns the raw Tavily documents into the `combined_text` passed to the pathway
+prompt:
+  1. exact dedupe by source URL and content hash
+  2. near-duplicate removal with word shingles and a bottom-k MinHash sketch
+  3. boilerplate stripping (cookie banners, nav links, share prompts, ...)
+  4. greedy packing of the best passages into a token budget
+and reports how many tokens were saved compared with plain concatenation.
+"""
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+# Token budget for the assembled context (approximate tokens, see estimate_tokens)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+
+# Estimated Jaccard similarity above which a document counts as a near-duplicate
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+SHINGLE_SIZE = 5
+SKETCH_SIZE = 64
+# Smallest remainder worth filling with a truncated passage
+MIN_PARTIAL_TOKENS = 100
+
+BOILERPLATE_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r"^\s*(accept|reject|manage)( all)? cookies\b.*$",
+        r"^.*\bwe use cookies\b.*$",
+        r"^.*\ball rights reserved\b.*$",
+        r"^\s*(skip to (main )?content|back to top|table of contents)\s*$",
+        r"^\s*(sign up|sign in|log in|subscribe)( now| today| for free)?[.!]?\s*$",
+        r"^\s*(share|tweet|pin it|print|email)( this( article| post)?)?[:.]?\s*$",
+        r"^\s*(previous|next)( (post|article|page))?\s*$",
+        r"^\s*!?\[[^\]]*\]\([^)]*\)\s*$",  # lines that are only a markdown link or image
+    )
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English prose)"""
+    return (len(text) + 3) // 4
+
+
+def strip_boilerplate(text: str) -> str:
+    """Removes boilerplate lines and collapses runs of blank lines"""
+    lines = [
+        line.rstrip() for line in text.splitlines()
+        if not any(pattern.match(line) for pattern in BOILERPLATE_PATTERNS)
+    ]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash_sketch(text: str, shingle_size: int = SHINGLE_SIZE, sketch_size: int = SKETCH_SIZE) -> List[int]:
+    """Bottom-k MinHash sketch over lowercase word shingles"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < shingle_size:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    return sorted(_hash64(s) for s in shingles)[:sketch_size]
+
+
+def estimate_jaccard(a: Sequence[int], b: Sequence[int], sketch_size: int = SKETCH_SIZE) -> float:
+    """Estimates Jaccard similarity of two bottom-k sketches"""
+    if not a or not b:
+        return 0.0
+    set_a, set_b = set(a), set(b)
+    union_sketch = sorted(set_a | set_b)[:sketch_size]
+    shared = sum(1 for h in union_sketch if h in set_a and h in set_b)
+    return shared / len(union_sketch)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens, preferring a sentence boundary"""
+    cut = text[:max_tokens * 4]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary + 1]
+    return cut.rstrip()
+
+
+def assemble_context(
+    docs: Sequence[Any],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    scores: Optional[Sequence[float]] = None,
+    tokens_before: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Builds the prompt context from retrieved documents (objects with
+    `page_content` and `metadata`). Passages are packed best-first, by `scores`
+    when given, else by the retriever's own score, else by retrieval order.
+    Pass `tokens_before` when `docs` is already a subset of what was retrieved.
+    Returns {"combined_text": str, "stats": {...}}.
+    """
+    raw_text = "\n\n".join(doc.page_content for doc in docs)
+    stats = {
+        "documents_in": len(docs),
+        "url_duplicates": 0,
+        "content_duplicates": 0,
+        "near_duplicates": 0,
+        "documents_packed": 0,
+        "documents_truncated": 0,
+        "tokens_before": tokens_before if tokens_before is not None else estimate_tokens(raw_text),
+    }
+
+    if scores is None:
+        scores = [doc.metadata.get("score") or 0.0 for doc in docs]
+    ranked = sorted(range(len(docs)), key=lambda i: (-scores[i], i))
+
+    seen_urls = set()
+    seen_hashes = set()
+    sketches: List[List[int]] = []
+    candidates = []
+    for i in ranked:
+        doc = docs[i]
+        # Chunks of the same page share a URL, so dedupe on (url, chunk)
+        url = doc.metadata.get("source")
+        if url:
+            url = (url, doc.metadata.get("chunk"))
+        if url and url in seen_urls:
+            stats["url_duplicates"] += 1
+            continue
+        text = strip_boilerplate(doc.page_content)
+        if not text:
+            continue
+        content_hash = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+        if content_hash in seen_hashes:
+            stats["content_duplicates"] += 1
+            continue
+        sketch = minhash_sketch(text)
+        if any(estimate_jaccard(sketch, other) >= NEAR_DUPLICATE_THRESHOLD for other in sketches):
+            stats["near_duplicates"] += 1
+            continue
+        if url:
+            seen_urls.add(url)
+        seen_hashes.add(content_hash)
+        sketches.append(sketch)
+        candidates.append(text)
+
+    packed = []
+    remaining = token_budget
+    for text in candidates:
+        tokens = estimate_tokens(text)
+        if tokens <= remaining:
+            packed.append(text)
+            remaining -= tokens
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            packed.append(_truncate_to_tokens(text, remaining))
+            stats["documents_truncated"] += 1
+            remaining = 0
+        if remaining < MIN_PARTIAL_TOKENS:
+            break
+
+    combined_text = "\n\n".join(packed)
+    stats["documents_packed"] = len(packed)
+    stats["tokens_after"] = estimate_tokens(combined_text)
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    stats["token_budget"] = token_budget
+    return {"combined_text": combined_text, "stats": stats}
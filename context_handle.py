@@ -0,0 +1,147 @@
+"""
+Shared context handles for the LLM stages of a request.
+
+A ContextHandle is the static instructions plus the retrieved context and
+source links, assembled once after retrieval. Every LLM stage binds the handle
+for its model and sends only its own task prompt on top of it:
+
+- "gemini": the prefix is uploaded once per (handle, model) as a Gemini
+  cachedContents resource and calls reference it by name, so the retrieved
+  text is not re-sent or re-billed at the full input rate per stage.
+- "local": the prefix is prepended to each task prompt. Every stage sends a
+  byte-identical prefix, which also lets Gemini's implicit prefix caching
+  apply. This is the stand-in used with fake upstreams and in tests.
+
+CONTEXT_CACHE_BACKEND=auto (default) uses "gemini" against the real API when
+the prefix is at least CONTEXT_CACHE_MIN_TOKENS long, and "local" otherwise
+or if creating the cache fails. Handles are cached by content hash, so
+repeated requests and cohort members with the same retrieval share one.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from cache import TTLCache
+from client_pool import get_chat_model, shared_http_client
+from context_budget import estimate_tokens
+from metrics import record_upstream_error
+
+CONTEXT_CACHE_BACKEND = os.getenv("CONTEXT_CACHE_BACKEND", "auto")  # auto | gemini | local
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "900"))
+# Gemini rejects explicit caches below its minimum prompt size
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com"
+
+CONTEXT_INSTRUCTIONS = """You are an "Agentic AI Learning Assistant". You curate the best resources, design
+comprehensive personalized "Adaptive Learning Pathways" and explain each step clearly.
+Ground your answers in the retrieved context below: use it to enrich plans and explanations
+with diverse perspectives and comprehensive coverage, and take reference links from its sources.
+Each request that follows describes one learner and one task."""
+
+
+def build_prefix(combined_text: str, relevant_links: Sequence[str] = ()) -> str:
+    """Static instructions, retrieved context and source links, in a stable order"""
+    links = "\n".join(f"- {link}" for link in sorted(relevant_links))
+    return (
+        f"{CONTEXT_INSTRUCTIONS}\n\n"
+        f"## Retrieved context\n{combined_text}\n\n"
+        f"## Sources\n{links or '- none'}\n\n"
+    )
+
+
+class BoundContext(NamedTuple):
+    """A handle bound to one chat model"""
+    model: Any
+    prefix: str
+    cached_content: Optional[str] = None
+
+    def prompt(self, task: str) -> str:
+        """The text to send for a task: the task alone when the prefix is cached upstream"""
+        return task if self.cached_content else self.prefix + task
+
+    @property
+    def structured_method(self) -> str:
+        # Gemini rejects tools alongside cachedContents, so structured output uses a response schema
+        return "json_mode" if self.cached_content else "function_calling"
+
+
+class ContextHandle:
+    """Per-request prompt prefix with lazily created provider-side caches, one per model"""
+
+    def __init__(self, combined_text: str, relevant_links: Sequence[str] = (), backend: str = CONTEXT_CACHE_BACKEND):
+        self.prefix = build_prefix(combined_text, relevant_links)
+        self.key = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()
+        self.tokens = estimate_tokens(self.prefix)
+        self.backend = backend
+        self._caches: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.counters = {"binds": 0, "provider_cached_binds": 0, "prefix_tokens_sent": 0}
+
+    def _use_provider_cache(self) -> bool:
+        if self.backend == "local":
+            return False
+        if self.backend == "gemini":
+            return True
+        return not os.getenv("GEMINI_API_ENDPOINT") and self.tokens >= CONTEXT_CACHE_MIN_TOKENS
+
+    async def bind(self, api_key: Optional[str], model: str, **options) -> BoundContext:
+        """Chat model and prompt builder for `model`, uploading the prefix on first use"""
+        self.counters["binds"] += 1
+        name = None
+        if self._use_provider_cache():
+            name = await self._cached_content(api_key, model)
+        if name:
+            self.counters["provider_cached_binds"] += 1
+            return BoundContext(get_chat_model(api_key, model=model, cached_content=name, **options), self.prefix, name)
+        self.counters["prefix_tokens_sent"] += self.tokens
+        return BoundContext(get_chat_model(api_key, model=model, **options), self.prefix)
+
+    def stats(self) -> Dict[str, Any]:
+        """Handle key prefix, prefix size and bind counters, recorded in the pathway metadata"""
+        return {"key": self.key[:16], "prefix_tokens": self.tokens, **self.counters}
+
+    async def _cached_content(self, api_key: Optional[str], model: str) -> Optional[str]:
+        # Cached contents belong to the project that created them, so uploads are per (model, API key);
+        # concurrent stages with the same pair share one upload
+        cache_key = (model, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest())
+        task = self._caches.get(cache_key)
+        if task is None:
+            task = self._caches[cache_key] = asyncio.ensure_future(self._create_cache(api_key, model))
+        name = await asyncio.shield(task)
+        # A failed upload is retried by the next bind instead of pinning the handle to inline context
+        if name is None and self._caches.get(cache_key) is task:
+            del self._caches[cache_key]
+        return name
+
+    async def _create_cache(self, api_key: Optional[str], model: str) -> Optional[str]:
+        base = os.getenv("GEMINI_API_ENDPOINT") or GEMINI_API_BASE
+        try:
+            response = await shared_http_client().post(
+                f"{base.rstrip('/')}/v1beta/cachedContents",
+                headers={"x-goog-api-key": api_key or ""},
+                json={
+                    "model": f"models/{model}",
+                    "contents": [{"role": "user", "parts": [{"text": self.prefix}]}],
+                    "ttl": f"{CONTEXT_CACHE_TTL}s",
+                },
+            )
+            response.raise_for_status()
+            return response.json()["name"]
+        except Exception as e:
+            print(f"Context cache creation failed for {model}, sending the context inline: {e}")
+            record_upstream_error("context_cache", e, provider="gemini")
+            return None
+
+
+# Handles outlive a request so identical retrievals share them, but not their provider caches
+_handles = TTLCache(maxsize=64, ttl=max(60, CONTEXT_CACHE_TTL - 60))
+
+
+def open_context(retrieval_result: dict) -> ContextHandle:
+    """The shared handle for a retrieval result's combined_text and relevant_links"""
+    handle = ContextHandle(retrieval_result["combined_text"], retrieval_result.get("relevant_links", ()))
+    entry = _handles.get_entry(handle.key)
+    if entry is not None:
+        return entry[0]
+    _handles.set(handle.key, handle)
+    return handle
@@ -1,124 +1,262 @@
 #!/usr/bin/env python3
 """
-Google Cloud Run Free Tier Calculator
-Estimate your usage against free tier limits
+Google Cloud Run Capacity Planner
+Size the service from recorded telemetry instead of guesses
+
+Reads the per-request telemetry written when TELEMETRY_PATH is set (see
+telemetry.py; benchmarks/loadtest.py with --fake-upstreams is a cheap way to
+produce it), computes the real latency, CPU, memory and LLM token
+distributions, and recommends containerConcurrency, memory and maxScale for
+cloudrun-service.yaml at a target request rate, with the resulting monthly
+vCPU-seconds, GiB-seconds and cost against the free tier.
+
+Usage:
+    python cost-calculator.py telemetry.jsonl --rate 0.5
+    python cost-calculator.py telemetry.jsonl --monthly-requests 100000 --json
 """
+import argparse
+import json
+import math
+import statistics
+import sys
+
+# Free tier limits (per month)
+CPU_LIMIT = 180000  # vCPU-seconds
+MEMORY_LIMIT = 360000  # GiB-seconds
+REQUEST_LIMIT = 2000000  # requests
+
+# Pricing (us-central1)
+CPU_PRICE = 0.000024  # per vCPU-second
+MEMORY_PRICE = 0.0000025  # per GiB-second
+REQUEST_PRICE = 0.40 / 1000000  # per request
+
+# Gemini 2.5 Flash pricing (USD per 1M tokens)
+PROMPT_TOKEN_PRICE = 0.30
+COMPLETION_TOKEN_PRICE = 2.50
+
+SECONDS_PER_MONTH = 30 * 24 * 3600
+
+# Cloud Run memory sizes (MiB) and the largest allowed concurrency
+MEMORY_TIERS_MIB = [512, 1024, 2048, 4096, 8192]
+MAX_CONCURRENCY = 1000
+
+# Keep this much of the instance's CPU and memory unused at peak
+HEADROOM = 0.8
+
+
+def load_telemetry(path):
+    """Reads successful pipeline requests from a telemetry JSONL file"""
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("status") == "ok":
+                    records.append(record)
+    return records
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def distribution(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "mean": round(statistics.fmean(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def per_request_memory_mb(records):
+    """
+    Memory attributable to one in-flight request: growth of the process
+    high-water mark over the idle baseline, divided by the requests in flight.
+    """
+    baseline = min(r["max_rss_mb"] for r in records)
+    samples = [
+        (r["max_rss_mb"] - baseline) / (r["in_flight"] + 1)
+        for r in records if r["max_rss_mb"] > baseline
+    ]
+    return baseline, (percentile(samples, 95) if samples else 1.0)
+
+
+def plan(records, rate, cpu=1.0, prompt_price=PROMPT_TOKEN_PRICE, completion_price=COMPLETION_TOKEN_PRICE):
+    """Computes usage distributions and Cloud Run recommendations at `rate` requests/second"""
+    latency = [r["latency_seconds"] for r in records]
+    stage_names = sorted({stage for r in records for stage in r.get("stage_timings", {})})
+    stages = {s: distribution([r["stage_timings"].get(s) for r in records]) for s in stage_names}
+    # A request's CPU share: CPU time per second of wall-clock it spends in flight
+    cpu_share = statistics.fmean(
+        min(1.0, r["cpu_seconds"] / (r["in_flight"] + 1) / r["latency_seconds"])
+        for r in records if r["latency_seconds"] > 0
+    )
+    baseline_mb, request_mb = per_request_memory_mb(records)
+
+    # Little's law for the mean in-flight count, plus three standard deviations of Poisson arrivals
+    mean_latency = statistics.fmean(latency)
+    in_flight = rate * mean_latency
+    peak_in_flight = in_flight + 3 * math.sqrt(in_flight)
+
+    cpu_bound = math.floor(HEADROOM * cpu / cpu_share) if cpu_share > 0 else MAX_CONCURRENCY
+    concurrency = None
+    memory_mib = MEMORY_TIERS_MIB[-1]
+    for tier in MEMORY_TIERS_MIB:
+        memory_bound = math.floor((HEADROOM * tier - baseline_mb) / request_mb)
+        candidate = max(1, min(cpu_bound, memory_bound, MAX_CONCURRENCY))
+        # Smallest tier whose concurrency fits the peak on one instance, or that is CPU-bound anyway
+        if memory_bound >= 1 and (candidate >= peak_in_flight or candidate == min(cpu_bound, MAX_CONCURRENCY)):
+            concurrency, memory_mib = candidate, tier
+            break
+    if concurrency is None:
+        concurrency = max(1, min(cpu_bound, math.floor((HEADROOM * memory_mib - baseline_mb) / request_mb)))
+
+    instances_at_peak = max(1, math.ceil(peak_in_flight / concurrency))
+    max_scale = max(instances_at_peak, math.ceil(instances_at_peak * 1.5))
 
-def calculate_free_tier_usage():
-    print("🧮 Google Cloud Run Free Tier Usage Calculator")
+    # With CPU throttling an instance is billed while it has a request in flight:
+    # a single instance is busy a fraction 1 - e^-L of the time (M/G/inf), and at
+    # higher load the busy instances approach L / concurrency.
+    busy_instances = max(1 - math.exp(-in_flight), in_flight / concurrency)
+    monthly_requests = rate * SECONDS_PER_MONTH
+    instance_seconds = busy_instances * SECONDS_PER_MONTH
+    vcpu_seconds = instance_seconds * cpu
+    gib_seconds = instance_seconds * memory_mib / 1024
+
+    prompt_tokens = [r.get("prompt_tokens", 0) for r in records]
+    completion_tokens = [r.get("completion_tokens", 0) for r in records]
+    token_cost = [
+        p / 1e6 * prompt_price + c / 1e6 * completion_price
+        for p, c in zip(prompt_tokens, completion_tokens)
+    ]
+
+    cloud_run_cost = (
+        max(0, vcpu_seconds - CPU_LIMIT) * CPU_PRICE
+        + max(0, gib_seconds - MEMORY_LIMIT) * MEMORY_PRICE
+        + max(0, monthly_requests - REQUEST_LIMIT) * REQUEST_PRICE
+    )
+
+    return {
+        "samples": len(records),
+        "target_rate_rps": rate,
+        "monthly_requests": round(monthly_requests),
+        "latency_seconds": distribution(latency),
+        "stage_seconds": stages,
+        "cpu_share_per_request": round(cpu_share, 4),
+        "memory_baseline_mb": baseline_mb,
+        "memory_per_request_mb": round(request_mb, 2),
+        "prompt_tokens": distribution(prompt_tokens),
+        "completion_tokens": distribution(completion_tokens),
+        "llm_cost_per_request_usd": distribution(token_cost),
+        "in_flight_mean": round(in_flight, 2),
+        "in_flight_peak": round(peak_in_flight, 2),
+        "recommendation": {
+            "containerConcurrency": concurrency,
+            "memory": f"{memory_mib}Mi" if memory_mib < 1024 else f"{memory_mib // 1024}Gi",
+            "cpu": cpu,
+            "maxScale": max_scale,
+            "limited_by": "cpu" if concurrency == cpu_bound else "memory",
+        },
+        "monthly": {
+            "vcpu_seconds": round(vcpu_seconds),
+            "gib_seconds": round(gib_seconds),
+            "cpu_free_tier_percent": round(vcpu_seconds / CPU_LIMIT * 100, 1),
+            "memory_free_tier_percent": round(gib_seconds / MEMORY_LIMIT * 100, 1),
+            "request_free_tier_percent": round(monthly_requests / REQUEST_LIMIT * 100, 1),
+            "cloud_run_cost_usd": round(cloud_run_cost, 2),
+            "llm_cost_usd": round(statistics.fmean(token_cost) * monthly_requests, 2),
+        },
+    }
+
+
+def status_icon(percent):
+    if percent <= 50:
+        return "✅"
+    elif percent <= 80:
+        return "⚠️"
+    else:
+        return "❌"
+
+
+def print_plan(result):
+    print("🧮 Google Cloud Run Capacity Planner")
     print("=" * 50)
-    
-    # Free tier limits
-    CPU_LIMIT = 180000  # vCPU-seconds per month
-    MEMORY_LIMIT = 360000  # GiB-seconds per month
-    REQUEST_LIMIT = 2000000  # requests per month
-    NETWORK_LIMIT = 1  # GiB per month
-    
-    # Your app configuration
-    CPU_ALLOCATION = 1  # vCPUs
-    MEMORY_ALLOCATION = 0.5  # GiB (512 MiB)
-    
-    print(f"📊 Your Configuration:")
-    print(f"   CPU: {CPU_ALLOCATION} vCPU")
-    print(f"   Memory: {MEMORY_ALLOCATION} GiB")
-    print(f"   Min Instances: 0 (scales to zero)")
-    print(f"   Max Instances: 10")
+    print(f"📊 Telemetry: {result['samples']} successful requests")
+    print(f"🎯 Target: {result['target_rate_rps']} req/s ({result['monthly_requests']:,} requests/month)")
+    print()
+
+    print("⏱️ Latency (seconds):")
+    print("-" * 30)
+    rows = {"request": result["latency_seconds"], **result["stage_seconds"]}
+    for name, d in rows.items():
+        print(f"   {name:>20}: p50 {d['p50']:.2f}  p95 {d['p95']:.2f}  p99 {d['p99']:.2f}")
+    print()
+
+    print("🔢 Per-request resources:")
+    print("-" * 30)
+    print(f"   CPU share while in flight: {result['cpu_share_per_request']:.1%} of a vCPU")
+    print(f"   Memory: {result['memory_baseline_mb']:.0f} MB baseline + {result['memory_per_request_mb']:.1f} MB per request")
+    print(f"   Prompt tokens: p50 {result['prompt_tokens']['p50']:,.0f}  p95 {result['prompt_tokens']['p95']:,.0f}")
+    print(f"   Completion tokens: p50 {result['completion_tokens']['p50']:,.0f}  p95 {result['completion_tokens']['p95']:,.0f}")
+    print(f"   LLM cost: p50 ${result['llm_cost_per_request_usd']['p50']:.4f}  p95 ${result['llm_cost_per_request_usd']['p95']:.4f}")
+    print(f"   In flight at target rate: {result['in_flight_mean']} mean, {result['in_flight_peak']} peak")
+    print()
+
+    rec = result["recommendation"]
+    print("💡 Recommended cloudrun-service.yaml settings:")
+    print("-" * 30)
+    print(f"        autoscaling.knative.dev/maxScale: \"{rec['maxScale']}\"")
+    print(f"        run.googleapis.com/memory: {rec['memory']}")
+    print(f"        run.googleapis.com/cpu: \"{rec['cpu']:g}\"")
+    print(f"      containerConcurrency: {rec['containerConcurrency']}")
+    print(f"   (concurrency limited by {rec['limited_by']})")
+    print()
+
+    monthly = result["monthly"]
+    print("🎯 Monthly Free Tier Check:")
+    print("-" * 30)
+    print(f"{status_icon(monthly['cpu_free_tier_percent'])} CPU: {monthly['cpu_free_tier_percent']}% ({monthly['vcpu_seconds']:,}/{CPU_LIMIT:,} vCPU-seconds)")
+    print(f"{status_icon(monthly['memory_free_tier_percent'])} Memory: {monthly['memory_free_tier_percent']}% ({monthly['gib_seconds']:,}/{MEMORY_LIMIT:,} GiB-seconds)")
+    print(f"{status_icon(monthly['request_free_tier_percent'])} Requests: {monthly['request_free_tier_percent']}%")
     print()
-    
-    # Get user input for usage estimation
-    try:
-        print("📝 Estimate Your Usage:")
-        avg_processing_time = float(input("   Average request processing time (seconds): "))
-        monthly_requests = int(input("   Expected monthly requests: "))
-        
-        print()
-        print("🔢 Calculations:")
-        print("-" * 30)
-        
-        # Calculate resource usage
-        total_cpu_seconds = monthly_requests * avg_processing_time * CPU_ALLOCATION
-        total_memory_seconds = monthly_requests * avg_processing_time * MEMORY_ALLOCATION
-        
-        print(f"CPU Usage: {total_cpu_seconds:,.0f} vCPU-seconds")
-        print(f"Memory Usage: {total_memory_seconds:,.0f} GiB-seconds")
-        print(f"Request Count: {monthly_requests:,} requests")
-        print()
-        
-        # Check against limits
-        print("🎯 Free Tier Limit Check:")
-        print("-" * 30)
-        
-        cpu_percent = (total_cpu_seconds / CPU_LIMIT) * 100
-        memory_percent = (total_memory_seconds / MEMORY_LIMIT) * 100
-        request_percent = (monthly_requests / REQUEST_LIMIT) * 100
-        
-        def status_icon(percent):
-            if percent <= 50:
-                return "✅"
-            elif percent <= 80:
-                return "⚠️"
-            else:
-                return "❌"
-        
-        print(f"{status_icon(cpu_percent)} CPU: {cpu_percent:.1f}% of limit ({total_cpu_seconds:,.0f}/{CPU_LIMIT:,})")
-        print(f"{status_icon(memory_percent)} Memory: {memory_percent:.1f}% of limit ({total_memory_seconds:,.0f}/{MEMORY_LIMIT:,})")
-        print(f"{status_icon(request_percent)} Requests: {request_percent:.1f}% of limit ({monthly_requests:,}/{REQUEST_LIMIT:,})")
-        print()
-        
-        # Determine bottleneck
-        bottleneck = "CPU" if cpu_percent >= memory_percent else "Memory"
-        max_percent = max(cpu_percent, memory_percent, request_percent)
-        
-        if max_percent <= 100:
-            print("🎉 RESULT: You're within the free tier limits!")
-        else:
-            print("⚠️ RESULT: You may exceed free tier limits.")
-            print(f"   Bottleneck: {bottleneck} usage")
-            
-        print()
-        print("💡 Free Tier Capacity:")
-        print("-" * 30)
-        
-        # Calculate maximum requests within free tier
-        max_requests_cpu = CPU_LIMIT // (avg_processing_time * CPU_ALLOCATION)
-        max_requests_memory = MEMORY_LIMIT // (avg_processing_time * MEMORY_ALLOCATION)
-        max_requests_limit = REQUEST_LIMIT
-        
-        max_requests = min(max_requests_cpu, max_requests_memory, max_requests_limit)
-        
-        print(f"Max monthly requests (free): {max_requests:,.0f}")
-        print(f"Max daily requests (free): {max_requests/30:,.0f}")
-        print(f"Max hourly requests (free): {max_requests/(30*24):,.0f}")
-        
-        # Cost estimation if exceeded
-        if max_percent > 100:
-            print()
-            print("💰 Estimated Monthly Cost (if exceeded):")
-            print("-" * 40)
-            
-            # Pricing (us-central1)
-            CPU_PRICE = 0.000024  # per vCPU-second
-            MEMORY_PRICE = 0.0000025  # per GiB-second
-            REQUEST_PRICE = 0.40 / 1000000  # per request
-            
-            excess_cpu = max(0, total_cpu_seconds - CPU_LIMIT)
-            excess_memory = max(0, total_memory_seconds - MEMORY_LIMIT)
-            excess_requests = max(0, monthly_requests - REQUEST_LIMIT)
-            
-            cpu_cost = excess_cpu * CPU_PRICE
-            memory_cost = excess_memory * MEMORY_PRICE
-            request_cost = excess_requests * REQUEST_PRICE
-            total_cost = cpu_cost + memory_cost + request_cost
-            
-            print(f"CPU overage cost: ${cpu_cost:.4f}")
-            print(f"Memory overage cost: ${memory_cost:.4f}")
-            print(f"Request overage cost: ${request_cost:.4f}")
-            print(f"Total estimated cost: ${total_cost:.2f}")
-            
-    except ValueError:
-        print("❌ Invalid input. Please enter numeric values.")
-    except KeyboardInterrupt:
-        print("\n👋 Calculator exited.")
+    print("💰 Estimated Monthly Cost:")
+    print("-" * 30)
+    print(f"Cloud Run (beyond free tier): ${monthly['cloud_run_cost_usd']:.2f}")
+    print(f"LLM tokens: ${monthly['llm_cost_usd']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("telemetry", help="Telemetry JSONL file written via TELEMETRY_PATH")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--rate", type=float, help="Target request rate (requests/second)")
+    target.add_argument("--monthly-requests", type=int, help="Target requests per month")
+    parser.add_argument("--cpu", type=float, default=1.0, help="vCPUs per instance (default 1)")
+    parser.add_argument("--prompt-price", type=float, default=PROMPT_TOKEN_PRICE, help="USD per 1M prompt tokens")
+    parser.add_argument("--completion-price", type=float, default=COMPLETION_TOKEN_PRICE, help="USD per 1M completion tokens")
+    parser.add_argument("--json", action="store_true", help="Print the plan as JSON")
+    args = parser.parse_args()
+
+    records = load_telemetry(args.telemetry)
+    if not records:
+        print(f"❌ No successful requests found in {args.telemetry}")
+        sys.exit(1)
+
+    rate = args.rate if args.rate is not None else args.monthly_requests / SECONDS_PER_MONTH
+    result = plan(records, rate, args.cpu, args.prompt_price, args.completion_price)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_plan(result)
+
 
 if __name__ == "__main__":
-    calculate_free_tier_usage()
+    main()
@@ -17,6 +17,10 @@ class ExplanationSection(BaseModel):
     title: str = Field(description="The concept being explained")
     content: str = Field(description="Detailed explanation using analogies from user's hobbies")
 
+class EnhancedExplanations(BaseModel):
+    """Explanation sections written by the enhancement stage"""
+    explanation_and_kickstart_examples: List[ExplanationSection] = Field(description="One detailed explanation section per concept or phase")
+
 class Milestone(BaseModel):
     year: int = Field(description="The year of the milestone")
     description: str = Field(description="Description of the milestone")
@@ -38,3 +42,17 @@ class LearningPathway(BaseModel):
     history_and_milestones: List[Milestone] = Field(description="Key historical moments and milestones")
     next_steps: NextStepsSection = Field(description="Suggestions for what to do after completing the pathway")
     relevant_links: List[str] = Field(description="List of useful URLs for further reading")
+
+# Sub-schemas used by the decomposed generation mode, which generates the
+# independent parts of a LearningPathway concurrently and then assembles them.
+
+class PathwayOutline(BaseModel):
+    """Title, introduction, phases and explanations of a learning pathway"""
+    title: str = Field(description="Catchy and relevant title for the learning pathway")
+    introduction: str = Field(description="Brief, welcoming introduction to the learning pathway")
+    phases: List[PathwayPhase] = Field(description="Main learning phases, broken down into logical sections")
+    explanation_and_kickstart_examples: List[ExplanationSection] = Field(description="Detailed explanations with hobby-specific examples")
+
+class PathwayHistory(BaseModel):
+    """Historical milestones of the learning topic"""
+    history_and_milestones: List[Milestone] = Field(description="Key historical moments and milestones")
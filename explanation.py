@@ -1,15 +1,112 @@
 from langgraph.func import task
-from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import ValidationError
 from typing import Dict, Any, List
+from client_pool import get_chat_model
+from context_handle import BoundContext, ContextHandle
+from data_models import EnhancedExplanations, ExplanationSection
+from model_routing import model_for
+from metrics import instrument_stage, record_llm_output, record_tokens, record_upstream_error
+from partial_json import extract_json, salvage_items
+from call_policy import guarded_call
+import asyncio
+import json
+import os
+
+# "per_phase" fans out one call per phase and returns one explanation section per phase, in
+# phase order, replacing the structured pathway's concept sections; "single" writes 5-7
+# concept sections in one call
+ENHANCEMENT_MODE = os.getenv("ENHANCEMENT_MODE", "per_phase")
+
+# Maximum number of concurrent per-phase enhancement calls for one pathway
+ENHANCEMENT_CONCURRENCY = int(os.getenv("ENHANCEMENT_CONCURRENCY", "4"))
+
+# Where complete sections can be recovered from in raw output: a bare array or the wrapper object
+SECTION_PATHS = [("*",), ("explanation_and_kickstart_examples", "*")]
+
+
+def _coerce_sections(value: Any) -> List[Dict[str, str]]:
+    """Valid sections from a parsed value: an array, the wrapper object or a single section"""
+    if isinstance(value, dict):
+        if "explanation_and_kickstart_examples" in value:
+            value = value["explanation_and_kickstart_examples"]
+        else:
+            value = [value]
+    sections = []
+    for item in value if isinstance(value, list) else []:
+        try:
+            sections.append(ExplanationSection.model_validate(item).model_dump())
+        except ValidationError:
+            continue
+    return [section for section in sections if section["title"] and section["content"]]
+
+
+def repair_sections(text: str) -> List[Dict[str, str]]:
+    """
+    Recovers explanation sections from raw model text: strips code fences and
+    surrounding prose, and when the JSON is truncated or invalid keeps every
+    section that closed before the break.
+    """
+    try:
+        sections = _coerce_sections(extract_json(text))
+    except ValueError:
+        sections = []
+    return sections or _coerce_sections(salvage_items(text, SECTION_PATHS))
+
+
+def _raw_text(message: Any) -> str:
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        return json.dumps(tool_calls[0].get("args", {}))
+    return str(message.content) if hasattr(message, "content") else str(message)
+
+
+async def invoke_sections(model, schema, prompt: str, method: str = "function_calling") -> List[Dict[str, str]]:
+    """
+    Structured-output call for explanation sections. When the response fails
+    schema validation the raw text is repaired instead of discarded; only a
+    response with no usable section is counted as wasted and raises.
+    """
+    structured_model = model.with_structured_output(schema, include_raw=True, method=method)
+    result = await guarded_call("enhancement", "gemini", lambda: structured_model.ainvoke(prompt))
+    record_tokens("enhancement", result["raw"])
+    if result.get("parsing_error") is None and result.get("parsed") is not None:
+        sections = _coerce_sections(result["parsed"].model_dump())
+        if sections:
+            record_llm_output("enhancement", "parsed")
+            return sections
+    sections = repair_sections(_raw_text(result["raw"]))
+    if sections:
+        record_llm_output("enhancement", "repaired")
+        return sections
+    record_llm_output("enhancement", "wasted")
+    raise ValueError(f"No usable {schema.__name__} in enhancement output")
 
 @task
-def enhance_structured_explanations(structured_pathway: Dict[str, Any], student_profile: dict) -> Dict[str, Any]:
+@instrument_stage("enhancement")
+async def enhance_structured_explanations(structured_pathway: Dict[str, Any], student_profile: dict,
+                                          context: ContextHandle) -> Dict[str, Any]:
     """
     Enhances the explanation sections of a structured pathway with detailed phase-by-phase explanations.
-    Takes the structured pathway and enriches the explanation_and_kickstart_examples with comprehensive content.
+    Takes the structured pathway and enriches the explanation_and_kickstart_examples with comprehensive content,
+    grounded in the same retrieved context the pathway was generated from.
+    In "per_phase" mode each phase gets its own concurrent model call and the result has one
+    section per phase (7+), titled after the concept the phase covers; in "single" mode one
+    call writes 5-7 concept sections. Either way the original sections are replaced.
     """
-    model = ChatGoogleGenerativeAI(model="gemini-2.5-flash",
-                                   api_key=student_profile.get("google_api_key"))
+    return await _enhance(structured_pathway, student_profile, context)
+
+
+async def _enhance(structured_pathway: Dict[str, Any], student_profile: dict,
+                   context: ContextHandle) -> Dict[str, Any]:
+    if ENHANCEMENT_MODE == "per_phase" and structured_pathway.get("phases"):
+        return await _enhance_per_phase(structured_pathway, student_profile, context)
+    return await _enhance_in_single_call(structured_pathway, student_profile, context)
+
+
+async def _enhance_in_single_call(structured_pathway: Dict[str, Any], student_profile: dict,
+                                  context: ContextHandle) -> Dict[str, Any]:
+    """Asks one model call for 5-7 explanation sections covering the whole pathway"""
+    bound = await context.bind(student_profile.get("google_api_key"), model_for("enhancement", student_profile))
     
     # Extract phases for reference
     phases_text = ""
@@ -48,50 +145,114 @@ def enhance_structured_explanations(structured_pathway: Dict[str, Any], student_
     - Include specific examples from their hobbies throughout
     - Focus on "why" and "how" rather than just "what"
     - Make each section standalone but connected to the overall journey
+    - Ground facts and examples in the retrieved context above where it is relevant
 
-    Generate 5-7 comprehensive explanation sections that will replace the current basic explanations.
-    Return ONLY a JSON array of objects with "title" and "content" fields:
-
-    [
-        {{
-            "title": "Concept Title",
-            "content": "Detailed markdown explanation with hobby examples..."
-        }},
-        ...
-    ]
+    Generate 5-7 comprehensive explanation sections that will replace the current basic explanations,
+    each with a "title" and a markdown "content" field.
     """
 
     try:
-        result = model.invoke(enhancement_prompt)
-        content = str(result.content) if hasattr(result, 'content') else str(result)
-        
-        # Try to parse the JSON response
-        import json
-        try:
-            enhanced_explanations = json.loads(content)
-            if isinstance(enhanced_explanations, list):
-                # Update the structured pathway with enhanced explanations
-                enhanced_pathway = structured_pathway.copy()
-                enhanced_pathway["explanation_and_kickstart_examples"] = enhanced_explanations
-                return enhanced_pathway
-        except json.JSONDecodeError:
-            # If JSON parsing fails, fall back to creating explanations manually
-            pass
-            
+        enhanced_explanations = await invoke_sections(bound.model, EnhancedExplanations, bound.prompt(enhancement_prompt),
+                                                      method=bound.structured_method)
+        # Update the structured pathway with enhanced explanations
+        enhanced_pathway = structured_pathway.copy()
+        enhanced_pathway["explanation_and_kickstart_examples"] = enhanced_explanations
+        return enhanced_pathway
     except Exception as e:
         print(f"Enhancement failed: {e}")
+        record_upstream_error("enhancement", e)
     
     # Fallback: return original pathway if enhancement fails
-    return structured_pathway
+    return _with_fallbacks(structured_pathway, max(1, len(structured_pathway.get("explanation_and_kickstart_examples", []))))
+
+
+def _with_fallbacks(pathway: Dict[str, Any], fallbacks: int) -> Dict[str, Any]:
+    """Records how many sections kept their original content because enhancement failed"""
+    return {**pathway, "metadata": {**pathway.get("metadata", {}), "enhancement_fallbacks": fallbacks}}
+
+
+def _phase_fallback_section(structured_pathway: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """Original content for a phase: its title, description and steps as a section"""
+    phase = structured_pathway["phases"][index]
+    steps = "\n".join(f"- **{step['title']}**: {step.get('content', '')}" for step in phase.get("steps", []))
+    content = f"{phase['description']}\n\n{steps}" if steps else phase["description"]
+    return {"title": phase["title"], "content": content}
+
+
+async def _enhance_phase(context: BoundContext, phase: Dict[str, Any], phase_number: int, total_phases: int,
+                         student_profile: dict) -> Dict[str, Any]:
+    """Writes the explanation section for a single phase"""
+    steps_text = "\n".join(
+        f"  {j}. {step['title']}: {step.get('content', '')}"
+        for j, step in enumerate(phase.get("steps", []), 1)
+    )
+    phase_prompt = f"""
+    You are an expert educator specializing in creating comprehensive, engaging explanations. 
+    
+    **Student Profile:**
+    - Learning Style: {student_profile.get('learning_style')}
+    - Hobbies/Interests: {student_profile.get('hobby')}
+    - Domain: {student_profile.get('domain')}
+    - Topic: {student_profile.get('progress')}
+
+    **Phase {phase_number} of {total_phases}: {phase['title']}**
+    {phase['description']}
+{steps_text}
+
+    **Task:** Write the explanation section for this phase. It should include:
+
+    1. **Deep Concept Analysis**: Break down complex concepts into digestible parts
+    2. **Hobby-Connected Examples**: Use analogies from {student_profile.get('hobby')} to make concepts relatable
+    3. **Real-World Applications**: Show practical applications in {student_profile.get('domain')}
+    4. **Common Pitfalls**: Explain what learners typically struggle with and how to avoid it
+    5. **Progressive Building**: Show how this phase builds on the earlier phases
+    6. **Hands-On Insights**: Provide actionable understanding that goes beyond theory
+
+    The explanation should be 200-400 words of markdown, in clear, engaging language that matches
+    the student's learning style, focusing on "why" and "how" rather than just "what", and
+    grounded in the retrieved context above where it is relevant.
+    Give the section a "title" naming the concept and put the explanation in "content".
+    """
+    sections = await invoke_sections(context.model, ExplanationSection, context.prompt(phase_prompt),
+                                     method=context.structured_method)
+    return sections[0]
+
+
+async def _enhance_per_phase(structured_pathway: Dict[str, Any], student_profile: dict,
+                             context: ContextHandle) -> Dict[str, Any]:
+    """
+    Fans out one model call per phase under ENHANCEMENT_CONCURRENCY and reassembles the
+    sections in phase order. A phase whose call fails keeps its original content and
+    is counted in metadata["enhancement_fallbacks"].
+    """
+    bound = await context.bind(student_profile.get("google_api_key"), model_for("enhancement", student_profile))
+    phases = structured_pathway["phases"]
+    semaphore = asyncio.Semaphore(ENHANCEMENT_CONCURRENCY)
+    fallbacks = 0
+
+    async def enhance(index: int) -> Dict[str, Any]:
+        nonlocal fallbacks
+        async with semaphore:
+            try:
+                return await _enhance_phase(bound, phases[index], index + 1, len(phases), student_profile)
+            except Exception as e:
+                print(f"Enhancement failed for phase {index + 1}: {e}")
+                record_upstream_error("enhancement", e)
+                fallbacks += 1
+                return _phase_fallback_section(structured_pathway, index)
+
+    sections = await asyncio.gather(*(enhance(i) for i in range(len(phases))))
+    enhanced_pathway = _with_fallbacks(structured_pathway, fallbacks)
+    enhanced_pathway["explanation_and_kickstart_examples"] = list(sections)
+    return enhanced_pathway
 
 @task
-def generate_explanation(pathway: str, student_profile: dict) -> str:
+async def generate_explanation(pathway: str, student_profile: dict) -> str:
     """
     Generates a comprehensive, detailed explanation for each phase in the learning pathway.
     Provides in-depth coverage with hobby-specific examples and practical insights.
     """
-    model = ChatGoogleGenerativeAI(model="gemini-2.5-flash",
-                                   api_key=student_profile.get("google_api_key"))
+    model = get_chat_model(student_profile.get("google_api_key"), model=model_for("explanation", student_profile))
     
     explanation_template = f"""
     You are an expert educator and learning facilitator. Based on the adaptive learning pathway provided, 
@@ -164,5 +325,6 @@ def generate_explanation(pathway: str, student_profile: dict) -> str:
     Now generate the comprehensive phase-by-phase explanations following the structure above for EVERY phase in the pathway.
     """
 
-    result = model.invoke(explanation_template)
+    result = await guarded_call("explanation", "gemini", lambda: model.ainvoke(explanation_template))
+    record_tokens("explanation", result)
     return str(result.content) if hasattr(result, 'content') else str(result)
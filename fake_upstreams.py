@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Local stand-in servers for Gemini and Tavily.
+
+The real clients in structured_agent.py, explanation.py and retrieval.py are
+pointed at these servers with two environment variables:
+
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8091   (Gemini REST transport)
+    TAVILY_BASE_URL=http://127.0.0.1:8092
+
+Each fake has a configurable latency distribution, error rate, periodic 429
+bursts and response size, and Gemini returns schema-valid LearningPathway
+(or sub-schema) payloads, so throughput and tail-latency experiments can be
+reproduced offline without spending quota.
+
+Usage:
+    python fake_upstreams.py --profile realistic
+    python fake_upstreams.py --gemini-median-ms 2000 --gemini-error-rate 0.05 \\
+        --tavily-burst-every 30 --tavily-burst-duration 5
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Iterator, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+import data_models
+
+WORDS = (
+    "learn build agent graph state node edge practice example project concept idea "
+    "pattern workflow memory tool model prompt context signal insight step progress "
+    "analogy match innings strategy team skill habit routine design review test"
+).split()
+
+
+@dataclass
+class UpstreamProfile:
+    """Behaviour of one fake upstream"""
+    latency: str = "lognormal"       # fixed | uniform | lognormal
+    median_ms: float = 50.0
+    spread: float = 0.5              # lognormal sigma, or +/- fraction for uniform
+    error_rate: float = 0.0          # fraction of requests answered with HTTP 500
+    burst_every_s: float = 0.0       # period of 429 bursts (0 disables)
+    burst_duration_s: float = 0.0    # length of each 429 burst
+    size: float = 1.0                # response size multiplier
+    stream_chunks: int = 20          # chunks per streamed Gemini response
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """Latency in seconds for one request"""
+        median = self.median_ms / 1000
+        if self.latency == "fixed":
+            return median
+        if self.latency == "uniform":
+            return max(0.0, rng.uniform(median * (1 - self.spread), median * (1 + self.spread)))
+        return rng.lognormvariate(math.log(max(median, 1e-6)), self.spread)
+
+
+PRESETS = {
+    "instant": {
+        "gemini": UpstreamProfile(latency="fixed", median_ms=0),
+        "tavily": UpstreamProfile(latency="fixed", median_ms=0),
+    },
+    "fast": {
+        "gemini": UpstreamProfile(median_ms=200, spread=0.3),
+        "tavily": UpstreamProfile(median_ms=50, spread=0.3),
+    },
+    "realistic": {
+        "gemini": UpstreamProfile(median_ms=15000, spread=0.4, size=1.0),
+        "tavily": UpstreamProfile(median_ms=1200, spread=0.5),
+    },
+    "degraded": {
+        "gemini": UpstreamProfile(median_ms=25000, spread=0.8, error_rate=0.05,
+                                  burst_every_s=60, burst_duration_s=10),
+        "tavily": UpstreamProfile(median_ms=3000, spread=1.0, error_rate=0.05,
+                                  burst_every_s=30, burst_duration_s=5),
+    },
+}
+
+
+class _Behaviour:
+    """Applies an UpstreamProfile to incoming requests"""
+
+    def __init__(self, profile: UpstreamProfile, seed: Optional[int] = None):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.counters = {"requests": 0, "errors": 0, "throttled": 0}
+
+    async def gate(self) -> Optional[JSONResponse]:
+        """Sleeps for the sampled latency; returns an error response when one is due"""
+        self.counters["requests"] += 1
+        profile = self.profile
+        if profile.burst_every_s > 0:
+            phase = (time.monotonic() - self.started) % profile.burst_every_s
+            if phase < profile.burst_duration_s:
+                self.counters["throttled"] += 1
+                retry_after = math.ceil(profile.burst_duration_s - phase)
+                return JSONResponse(
+                    {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}},
+                    status_code=429, headers={"Retry-After": str(retry_after)},
+                )
+        await asyncio.sleep(profile.sample_latency(self.rng))
+        if self.rng.random() < profile.error_rate:
+            self.counters["errors"] += 1
+            return JSONResponse(
+                {"error": {"code": 500, "message": "Internal error", "status": "INTERNAL"}},
+                status_code=500,
+            )
+        return None
+
+
+# --- Schema-driven fake content ----------------------------------------------
+
+ARRAY_LENGTHS = {
+    "phases": 7, "steps": 3, "explanation_and_kickstart_examples": 6,
+    "history_and_milestones": 6, "relevant_links": 8,
+}
+LONG_TEXT_FIELDS = {"content", "description", "introduction", "benefit", "practical_focus"}
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, count)))
+
+
+def fake_from_schema(schema: Dict[str, Any], rng: random.Random, size: float = 1.0,
+                     defs: Optional[Dict[str, Any]] = None, name: str = "") -> Any:
+    """Builds a value that validates against a pydantic-generated JSON schema"""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return fake_from_schema(defs[schema["$ref"].split("/")[-1]], rng, size, defs, name)
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+        return fake_from_schema(options[0], rng, size, defs, name)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            prop: fake_from_schema(prop_schema, rng, size, defs, prop)
+            for prop, prop_schema in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        count = ARRAY_LENGTHS.get(name, 3)
+        return [fake_from_schema(schema.get("items", {}), rng, size, defs, name) for _ in range(count)]
+    if kind == "integer":
+        return rng.randint(1950, 2025) if name == "year" else rng.randint(1, 10)
+    if kind == "number":
+        return round(rng.random(), 3)
+    if kind == "boolean":
+        return True
+    if name in ("relevant_links", "url", "source"):
+        return f"https://example.com/{_words(rng, 3).replace(' ', '-')}"
+    if name in LONG_TEXT_FIELDS:
+        return f"**{_words(rng, 3).title()}**\n\n" + _words(rng, int(60 * size))
+    return _words(rng, 5).title()
+
+
+def fake_model_payload(model_name: str, rng: random.Random, size: float = 1.0) -> Dict[str, Any]:
+    """Fake instance of a pydantic model by class name (data_models or known wrappers)"""
+    model = getattr(data_models, model_name, None)
+    if not (isinstance(model, type) and issubclass(model, BaseModel)):
+        return {}
+    payload = fake_from_schema(model.model_json_schema(), rng, size)
+    return model.model_validate(payload).model_dump()
+
+
+# --- Gemini ----------------------------------------------------------------
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    return "\n".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def _function_name(body: Dict[str, Any]) -> Optional[str]:
+    for tool in body.get("tools", []):
+        declarations = tool.get("functionDeclarations") or tool.get("function_declarations") or []
+        if declarations:
+            return declarations[0].get("name")
+    return None
+
+
+def _fake_gemini_parts(body: Dict[str, Any], rng: random.Random, size: float):
+    """Returns (parts, output_text) for a generateContent request"""
+    function_name = _function_name(body)
+    if function_name:
+        args = fake_model_payload(function_name, rng, size)
+        return [{"functionCall": {"name": function_name, "args": args}}], json.dumps(args)
+
+    prompt = _prompt_text(body)
+    config = body.get("generationConfig") or body.get("generation_config") or {}
+    json_mode = (config.get("responseMimeType") or config.get("response_mime_type")) == "application/json"
+    if json_mode and "JSON schema" in prompt:
+        text = json.dumps(fake_model_payload("LearningPathway", rng, size))
+    elif re.search(r"JSON array", prompt):
+        text = json.dumps([fake_model_payload("ExplanationSection", rng, size) for _ in range(6)])
+    elif re.search(r"JSON object", prompt):
+        text = json.dumps(fake_model_payload("ExplanationSection", rng, size))
+    else:
+        text = "## Overview\n\n" + _words(rng, int(300 * size))
+    return [{"text": text}], text
+
+
+def _usage(prompt: str, output: str) -> Dict[str, int]:
+    prompt_tokens, output_tokens = len(prompt) // 4, len(output) // 4
+    return {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens}
+
+
+def create_gemini_app(profile: Optional[UpstreamProfile] = None, seed: Optional[int] = None) -> FastAPI:
+    """Fake of the Gemini REST API (generateContent and streamGenerateContent)"""
+    behaviour = _Behaviour(profile or UpstreamProfile(), seed)
+    app = FastAPI(title="Fake Gemini")
+    app.state.behaviour = behaviour
+
+    @app.post("/v1beta/models/{model_action:path}")
+    async def generate(model_action: str, request: Request):
+        body = await request.json()
+        error = await behaviour.gate()
+        if error is not None:
+            return error
+        parts, output = _fake_gemini_parts(body, behaviour.rng, behaviour.profile.size)
+        usage = _usage(_prompt_text(body), output)
+
+        if not model_action.endswith(":streamGenerateContent"):
+            return {
+                "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": 0}],
+                "usageMetadata": usage,
+            }
+
+        # Streamed responses: split text into chunks; function calls arrive whole
+        if "text" in parts[0]:
+            text = parts[0]["text"]
+            step = max(1, math.ceil(len(text) / behaviour.profile.stream_chunks))
+            chunks = [[{"text": text[i:i + step]}] for i in range(0, len(text), step)]
+        else:
+            chunks = [parts]
+
+        async def stream():
+            yield "["
+            for i, chunk_parts in enumerate(chunks):
+                last = i == len(chunks) - 1
+                chunk = {"candidates": [{"content": {"role": "model", "parts": chunk_parts}, "index": 0,
+                                         **({"finishReason": "STOP"} if last else {})}]}
+                if last:
+                    chunk["usageMetadata"] = usage
+                yield ("," if i else "") + json.dumps(chunk)
+                await asyncio.sleep(0)
+            yield "]"
+
+        return StreamingResponse(stream(), media_type="application/json")
+
+    @app.get("/stats")
+    async def stats():
+        return behaviour.counters
+
+    return app
+
+
+# --- Tavily ----------------------------------------------------------------
+
+def create_tavily_app(profile: Optional[UpstreamProfile] = None, seed: Optional[int] = None) -> FastAPI:
+    """Fake of the Tavily /search API"""
+    behaviour = _Behaviour(profile or UpstreamProfile(), seed)
+    app = FastAPI(title="Fake Tavily")
+    app.state.behaviour = behaviour
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        error = await behaviour.gate()
+        if error is not None:
+            return error
+        query = body.get("query", "")
+        slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-")[:40]
+        rng = behaviour.rng
+        results = [
+            {
+                "title": f"{query} - {_words(rng, 3).title()}",
+                "url": f"https://example.com/{slug}/{i}",
+                "content": f"{query}. " + _words(rng, int(150 * behaviour.profile.size)),
+                "score": round(1 - i / 20, 3),
+                "raw_content": None,
+            }
+            for i in range(int(body.get("max_results", 5)))
+        ]
+        return {"query": query, "results": results, "images": [], "answer": None,
+                "response_time": round(behaviour.profile.median_ms / 1000, 2)}
+
+    @app.get("/stats")
+    async def stats():
+        return behaviour.counters
+
+    return app
+
+
+# --- Running the fakes -----------------------------------------------------
+
+def _serve_in_thread(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Fake upstream on port {port} did not start")
+        time.sleep(0.01)
+    return server
+
+
+@contextmanager
+def running_fake_upstreams(
+    gemini: Optional[UpstreamProfile] = None,
+    tavily: Optional[UpstreamProfile] = None,
+    gemini_port: int = 8091,
+    tavily_port: int = 8092,
+    seed: Optional[int] = None,
+) -> Iterator[Dict[str, str]]:
+    """
+    Starts both fakes on background threads and points the real clients at them
+    for the duration of the block (sets GEMINI_API_ENDPOINT / TAVILY_BASE_URL and
+    placeholder API keys when none are configured).
+    """
+    servers = [
+        _serve_in_thread(create_gemini_app(gemini, seed), gemini_port),
+        _serve_in_thread(create_tavily_app(tavily, seed), tavily_port),
+    ]
+    endpoints = {
+        "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{gemini_port}",
+        "TAVILY_BASE_URL": f"http://127.0.0.1:{tavily_port}",
+    }
+    overrides = {**endpoints, "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY") or "fake-key",
+                 "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY") or "fake-key"}
+    previous = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield endpoints
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        for server in servers:
+            server.should_exit = True
+
+
+def _profile_from_args(base: UpstreamProfile, args, prefix: str) -> UpstreamProfile:
+    overrides = {}
+    for field in ("latency", "median_ms", "spread", "error_rate", "burst_every_s", "burst_duration_s", "size"):
+        value = getattr(args, f"{prefix}_{field}")
+        if value is not None:
+            overrides[field] = value
+    return replace(base, **overrides)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PRESETS), default="fast")
+    parser.add_argument("--gemini-port", type=int, default=8091)
+    parser.add_argument("--tavily-port", type=int, default=8092)
+    parser.add_argument("--seed", type=int, default=None)
+    for prefix in ("gemini", "tavily"):
+        parser.add_argument(f"--{prefix}-latency", choices=["fixed", "uniform", "lognormal"])
+        parser.add_argument(f"--{prefix}-median-ms", type=float)
+        parser.add_argument(f"--{prefix}-spread", type=float)
+        parser.add_argument(f"--{prefix}-error-rate", type=float)
+        parser.add_argument(f"--{prefix}-burst-every", dest=f"{prefix}_burst_every_s", type=float)
+        parser.add_argument(f"--{prefix}-burst-duration", dest=f"{prefix}_burst_duration_s", type=float)
+        parser.add_argument(f"--{prefix}-size", type=float)
+    args = parser.parse_args()
+
+    preset = PRESETS[args.profile]
+    gemini = _profile_from_args(preset["gemini"], args, "gemini")
+    tavily = _profile_from_args(preset["tavily"], args, "tavily")
+
+    with running_fake_upstreams(gemini, tavily, args.gemini_port, args.tavily_port, args.seed) as endpoints:
+        print("Fake upstreams running. Point the agent at them with:")
+        for key, value in endpoints.items():
+            print(f"  export {key}={value}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("\nStopping fake upstreams.")
+
+
+if __name__ == "__main__":
+    main()
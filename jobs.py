@@ -0,0 +1,279 @@
+"""
+Asynchronous pathway generation jobs.
+
+POST /api/jobs enqueues a profile on a bounded queue and returns a job ID at
+once; a fixed pool of in-process workers runs the pipeline and records
+per-stage progress and the result in a JobStore that GET /api/jobs/{id}
+reads. When the queue is full, submit() raises JobQueueFull with a
+Retry-After estimate instead of accepting work the instance cannot finish.
+
+The store is pluggable: InMemoryJobStore for a single instance, or
+SQLiteJobStore (JOB_STORE_PATH) so job status survives restarts and can be
+read by any process sharing the volume. Workers write progress to a
+blocking store from a thread, off the event loop. API keys never reach the store.
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import telemetry
+from model_routing import runs_stage
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))  # seconds a finished job stays readable
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH")
+
+# Pipeline events that mark a finished stage, and the stage each one finishes
+STAGE_EVENTS = {
+    "retrieval": "retrieval",
+    "structured_pathway": "structured_pathway",
+    "enhanced_explanations": "enhancement",
+}
+# Events streamed while the structured pathway is being generated
+ITEM_EVENTS = ("phase", "milestone", "explanation_section")
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when the queue is at capacity"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InMemoryJobStore:
+    """Job records in a dict; finished jobs are pruned after `ttl` seconds"""
+    blocking = False
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    def prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        expired = [k for k, job in self._jobs.items() if job.get("finished_at") is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Job records in a SQLite table shared by every process that opens the same path"""
+    # Writes hit the disk, so JobManager runs them in a thread
+    blocking = True
+
+    def __init__(self, path: str, ttl: float = 3600, table: str = "jobs"):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(id TEXT PRIMARY KEY, data TEXT NOT NULL, finished_at REAL)"
+        )
+        self._conn.commit()
+        # The connection is shared by the event loop and writer threads
+        self._lock = threading.RLock()
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._write(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT data FROM {self.table} WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self.get(job_id)
+            if job is not None:
+                job.update(fields)
+                self._write(job)
+
+    def prune(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE finished_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+    def _write(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (id, data, finished_at) VALUES (?, ?, ?)",
+                (job["id"], json.dumps(job), job.get("finished_at")),
+            )
+            self._conn.commit()
+
+
+class JobManager:
+    """
+    Bounded queue of pathway jobs drained by `workers` asyncio tasks.
+    `runner(profile)` is an async iterator of pipeline events, as produced by
+    agent.stream_pathway_events; its 'complete' event carries the result.
+    """
+
+    def __init__(self, runner: Callable[[dict], AsyncIterator[dict]], store=None,
+                 workers: int = 4, max_queue: int = 32):
+        self.runner = runner
+        self.store = store if store is not None else InMemoryJobStore()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._tasks: List[asyncio.Task] = []
+        self._loop = None
+        self._running = 0
+        # Moving average of job durations, used for the Retry-After estimate
+        self._avg_seconds = 30.0
+        self.counters = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    def start(self) -> None:
+        """Starts the worker tasks on the running loop (idempotent)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues and tasks are bound to one event loop, e.g. per test client
+            self._loop = loop
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for worker in self._tasks:
+            worker.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up: one job finishes every avg/workers seconds"""
+        return max(1, math.ceil(self._avg_seconds / max(1, self.workers)))
+
+    def submit(self, student_profile: dict) -> Dict[str, Any]:
+        """Enqueues a profile and returns its job record, or raises JobQueueFull"""
+        self.start()
+        if self.queue.full():
+            self.counters["rejected"] += 1
+            raise JobQueueFull(self.retry_after())
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "topic": student_profile.get("progress"),
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "current_stage": None,
+            "stage_timings": {},
+            "items_generated": 0,
+            "result": None,
+            "error": None,
+        }
+        self.store.create(job)
+        self.queue.put_nowait((job["id"], student_profile))
+        self.counters["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job is not None and job["status"] == "queued":
+            job["queue_depth"] = self.queue.qsize()
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, student_profile = await self.queue.get()
+            self._running += 1
+            try:
+                await self._run(job_id, student_profile)
+            finally:
+                self._running -= 1
+                self.queue.task_done()
+
+    async def _run(self, job_id: str, student_profile: dict) -> None:
+        started = time.time()
+        stage_timings: Dict[str, float] = {}
+        next_stage = {"retrieval": "structured_pathway"}
+        if runs_stage("enhancement", student_profile):
+            next_stage["structured_pathway"] = "enhancement"
+        items = 0
+        completed = False
+        try:
+            await self._update(job_id, status="running", started_at=started, current_stage="retrieval")
+            with telemetry.track_request("job"):
+                async for event in self.runner(student_profile):
+                    name = event.get("event")
+                    if name in STAGE_EVENTS:
+                        stage_timings[STAGE_EVENTS[name]] = event.get("seconds")
+                        await self._update(job_id, stage_timings=dict(stage_timings),
+                                           current_stage=next_stage.get(STAGE_EVENTS[name]))
+                    elif name in ITEM_EVENTS:
+                        items += 1
+                        if items % 5 == 0:
+                            await self._update(job_id, items_generated=items)
+                    elif name == "complete":
+                        completed = True
+                        await self._update(
+                            job_id, status="succeeded", result=event["pathway"], current_stage=None,
+                            stage_timings=event.get("stage_timings") or stage_timings,
+                            items_generated=items, cached=bool(event.get("cached")), finished_at=time.time(),
+                        )
+            if not completed:
+                raise RuntimeError("Pipeline finished without a result")
+            self.counters["succeeded"] += 1
+        except asyncio.CancelledError:
+            # Worker stopped mid-job (shutdown); written directly so the record
+            # is not left "running" even if the loop is closing
+            print(f"Job {job_id} cancelled")
+            self.store.update(job_id, status="failed", error="Job cancelled before it finished",
+                              current_stage=None, finished_at=time.time())
+            self.counters["failed"] += 1
+            raise
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            await self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+            self.counters["failed"] += 1
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.time() - started)
+        if getattr(self.store, "blocking", False):
+            await asyncio.to_thread(self.store.prune)
+        else:
+            self.store.prune()
+
+    async def _update(self, job_id: str, **fields) -> None:
+        if getattr(self.store, "blocking", False):
+            await asyncio.to_thread(self.store.update, job_id, **fields)
+        else:
+            self.store.update(job_id, **fields)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queued": self.queue.qsize(),
+            "running": self._running,
+            "workers": self.workers,
+            "capacity": self.queue.maxsize,
+            "avg_job_seconds": round(self._avg_seconds, 2),
+        }
+
+
+def create_job_store():
+    """SQLite store when JOB_STORE_PATH is set, otherwise in memory"""
+    if JOB_STORE_PATH:
+        return SQLiteJobStore(JOB_STORE_PATH, ttl=JOB_TTL)
+    return InMemoryJobStore(ttl=JOB_TTL)
@@ -1,3 +1,4 @@
+import asyncio
 from agent import adaptive_learning_agent
 
 if __name__ == "__main__":
@@ -23,7 +24,7 @@ if __name__ == "__main__":
     }
     
     # Call the adaptive learning agent with the provided student profile.
-    result = adaptive_learning_agent.invoke(student_profile)
+    result = asyncio.run(adaptive_learning_agent.ainvoke(student_profile))
     
     print("\n### Final Output:")
     print("Relevant Links:")
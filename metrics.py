@@ -0,0 +1,195 @@
+"""
+Prometheus instrumentation for the adaptive learning agent.
+
+Exposes per-stage latency histograms, in-flight gauges, upstream error
+counters, LLM token counters, LLM output outcomes (parsed, repaired or
+wasted; the wasted-call rate is wasted / all outcomes), upstream queueing
+delay, retries and hedges, and retrieval volume counters, plus the
+stats() counters of the caches and pools registered with register_stats().
+Served in the Prometheus text format from /metrics.
+"""
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+import telemetry
+
+# Which upstream each stage talks to
+STAGE_PROVIDERS = {
+    "retrieval": "tavily",
+    "structured_pathway": "gemini",
+    "enhancement": "gemini",
+    "pipeline": "all",
+    "cohort": "all",
+}
+
+# Stages whose failures are counted as upstream errors; "pipeline" and "cohort"
+# only re-raise what their provider-facing stages already counted
+UPSTREAM_STAGES = {stage for stage, provider in STAGE_PROVIDERS.items() if provider != "all"}
+
+# Top-level packages of the upstream client libraries
+UPSTREAM_ERROR_MODULES = ("httpx", "httpcore", "google", "langchain_google_genai", "tavily", "requests")
+
+STAGE_LATENCY = Histogram(
+    "pathway_stage_duration_seconds",
+    "Latency of each pipeline stage",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 240),
+)
+STAGE_IN_FLIGHT = Gauge(
+    "pathway_stage_in_flight",
+    "Pipeline stages currently executing",
+    ["stage"],
+)
+UPSTREAM_ERRORS = Counter(
+    "pathway_upstream_errors_total",
+    "Failed upstream calls by provider, stage and error type",
+    ["provider", "stage", "error"],
+)
+LLM_TOKENS = Counter(
+    "pathway_llm_tokens_total",
+    "LLM tokens consumed by stage",
+    ["stage", "kind"],
+)
+LLM_OUTPUTS = Counter(
+    "pathway_llm_outputs_total",
+    "LLM responses by stage and outcome: parsed, repaired from raw text, or wasted (discarded)",
+    ["stage", "outcome"],
+)
+UPSTREAM_QUEUE_DELAY = Histogram(
+    "pathway_upstream_queue_seconds",
+    "Time upstream calls waited for a rate-limit token and concurrency slot",
+    ["provider"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+UPSTREAM_RETRIES = Counter(
+    "pathway_upstream_retries_total",
+    "Upstream call attempts retried after a retryable error, by call policy",
+    ["policy"],
+)
+UPSTREAM_HEDGES = Counter(
+    "pathway_upstream_hedges_total",
+    "Hedged duplicate requests fired after the p95 latency, and those that won",
+    ["policy", "outcome"],
+)
+RETRIEVED_DOCUMENTS = Counter(
+    "pathway_retrieved_documents_total",
+    "Documents returned by retrieval queries",
+    ["source"],
+)
+RETRIEVED_BYTES = Counter(
+    "pathway_retrieved_bytes_total",
+    "Bytes of page content returned by retrieval queries",
+    ["source"],
+)
+
+
+def is_upstream_error(error: BaseException) -> bool:
+    """Timeouts, dropped connections, HTTP errors and errors raised by the upstream client libraries"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if getattr(error, "status_code", None) is not None or getattr(error, "response", None) is not None:
+        return True
+    return type(error).__module__.split(".")[0] in UPSTREAM_ERROR_MODULES
+
+
+@contextmanager
+def track_stage(stage: str):
+    """
+    Times a stage, tracks it as in flight and, for a provider-facing stage,
+    counts the exception type if it fails with an upstream error
+    """
+    STAGE_IN_FLIGHT.labels(stage).inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if stage in UPSTREAM_STAGES and is_upstream_error(e):
+            record_upstream_error(stage, e)
+        raise
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+        STAGE_IN_FLIGHT.labels(stage).dec()
+
+
+def instrument_stage(stage: str):
+    """Decorator form of track_stage for async stage functions (place it under @task)"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track_stage(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_upstream_error(stage: str, error: Any, provider: str = None) -> None:
+    """Counts a failed upstream call; `error` is an exception or a short label"""
+    label = error if isinstance(error, str) else type(error).__name__
+    UPSTREAM_ERRORS.labels(provider or STAGE_PROVIDERS.get(stage, "unknown"), stage, label).inc()
+
+
+def record_tokens(stage: str, message: Any) -> None:
+    """Adds the prompt/completion token usage reported on a LangChain message"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    telemetry.add_tokens(usage.get("input_tokens") or 0, usage.get("output_tokens") or 0)
+    if usage.get("input_tokens"):
+        LLM_TOKENS.labels(stage, "prompt").inc(usage["input_tokens"])
+    if usage.get("output_tokens"):
+        LLM_TOKENS.labels(stage, "completion").inc(usage["output_tokens"])
+
+
+def record_llm_output(stage: str, outcome: str) -> None:
+    """Counts what became of a model response: parsed, repaired or wasted"""
+    LLM_OUTPUTS.labels(stage, outcome).inc()
+
+
+def record_queue_delay(provider: str, seconds: float) -> None:
+    UPSTREAM_QUEUE_DELAY.labels(provider).observe(seconds)
+
+
+def record_retry(policy: str) -> None:
+    UPSTREAM_RETRIES.labels(policy).inc()
+
+
+def record_hedge(policy: str, outcome: str) -> None:
+    """Counts a hedge that was "fired" or that "won" (returned before the original)"""
+    UPSTREAM_HEDGES.labels(policy, outcome).inc()
+
+
+def record_retrieved(docs, source: str = "tavily") -> None:
+    RETRIEVED_DOCUMENTS.labels(source).inc(len(docs))
+    RETRIEVED_BYTES.labels(source).inc(sum(len(doc.page_content.encode("utf-8")) for doc in docs))
+
+
+class _StatsCollector:
+    """Exports registered stats() dicts as gauges named pathway_<component>_<stat>"""
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def collect(self):
+        for component, stats in self.sources.items():
+            for name, value in stats().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                yield GaugeMetricFamily(f"pathway_{component}_{name}", f"{component} {name}", value=value)
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def register_stats(component: str, stats: Callable[[], Dict[str, Any]]) -> None:
+    """Publishes a component's stats() counters on /metrics"""
+    _stats_collector.sources[component] = stats
+
+
+def render_metrics():
+    """Returns (body, content_type) for the /metrics endpoint"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
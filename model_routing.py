@@ -0,0 +1,71 @@
+"""
+Per-stage model routing and latency/quality tiers.
+
+A request picks a tier with the profile's 'tier' field (DEFAULT_TIER otherwise):
+    express   one structured-output call produces the complete LearningPathway;
+              enhancement is skipped
+    standard  structured pathway, then explanation enhancement
+    quality   as standard, with a stronger model for the structured pathway
+
+Each (tier, stage) maps to a Gemini model, overridable from the environment as
+<TIER>_<STAGE>_MODEL, e.g. STANDARD_ENHANCEMENT_MODEL=gemini-2.5-flash-lite.
+"""
+import os
+from typing import Dict
+
+TIERS = ("express", "standard", "quality")
+
+DEFAULT_TIER = os.getenv("DEFAULT_TIER", "standard")
+
+DEFAULT_MODELS = {
+    "express": {"structured_pathway": "gemini-2.5-flash-lite"},
+    "standard": {"structured_pathway": "gemini-2.5-flash", "enhancement": "gemini-2.5-flash",
+                 "explanation": "gemini-2.5-flash"},
+    "quality": {"structured_pathway": "gemini-2.5-pro", "enhancement": "gemini-2.5-flash",
+                "explanation": "gemini-2.5-flash"},
+}
+
+# Stages each tier runs after retrieval
+TIER_STAGES = {
+    "express": ("structured_pathway",),
+    "standard": ("structured_pathway", "enhancement"),
+    "quality": ("structured_pathway", "enhancement"),
+}
+
+FALLBACK_MODEL = "gemini-2.5-flash"
+
+
+def resolve_tier(student_profile: dict) -> str:
+    """The profile's tier, or DEFAULT_TIER when it is missing or unknown"""
+    tier = (student_profile.get("tier") or DEFAULT_TIER).lower()
+    return tier if tier in TIERS else "standard"
+
+
+def model_for(stage: str, student_profile: dict) -> str:
+    """Gemini model that serves `stage` for this profile's tier"""
+    tier = resolve_tier(student_profile)
+    default = DEFAULT_MODELS[tier].get(stage) or DEFAULT_MODELS["standard"].get(stage, FALLBACK_MODEL)
+    return os.getenv(f"{tier.upper()}_{stage.upper()}_MODEL", default)
+
+
+def runs_stage(stage: str, student_profile: dict) -> bool:
+    return stage in TIER_STAGES[resolve_tier(student_profile)]
+
+
+def pathway_uses_hobby(student_profile: dict) -> bool:
+    """
+    Whether the structured pathway prompts include the learner's hobby. Tiers
+    that run enhancement leave hobby personalization to it, so a hobby-only
+    change can reuse the structured pathway (see artifact_store).
+    """
+    return not runs_stage("enhancement", student_profile)
+
+
+def routing_metadata(student_profile: dict, seconds: float) -> Dict[str, object]:
+    """Tier, per-stage models and end-to-end latency recorded in the pathway metadata"""
+    stages = TIER_STAGES[resolve_tier(student_profile)]
+    return {
+        "tier": resolve_tier(student_profile),
+        "models": {stage: model_for(stage, student_profile) for stage in stages},
+        "seconds": seconds,
+    }
@@ -0,0 +1,129 @@
+"""
+Incremental JSON scanning for streamed model output.
+
+IncrementalJSONParser consumes text chunks as they arrive and returns every
+object or array that has fully closed at one of the watched paths, e.g.
+("phases", "*") for each element of the top-level "phases" array. Text before
+the root value (such as a ```json fence) is ignored.
+
+extract_json and salvage_items recover usable JSON from complete model
+responses that arrive wrapped in fences or prose, or truncated mid-value.
+"""
+import json
+import re
+from typing import Any, List, Sequence, Tuple
+
+Path = Tuple[Any, ...]
+
+_FENCE_OPEN = re.compile(r"^\s*```[\w-]*[ \t]*\n?")
+_FENCE_CLOSE = re.compile(r"\n?[ \t]*```\s*$")
+
+
+def _matches(path: Path, pattern: Sequence[Any]) -> bool:
+    if len(path) != len(pattern):
+        return False
+    return all(p == "*" or p == part for part, p in zip(path, pattern))
+
+
+class IncrementalJSONParser:
+    """Streaming scanner that yields completed containers at watched paths"""
+
+    def __init__(self, watch: Sequence[Sequence[Any]]):
+        self.watch = [tuple(pattern) for pattern in watch]
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[dict] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """Appends a chunk and returns (path, value) for each watched container that closed"""
+        self.buffer += chunk
+        completed = []
+        while self._pos < len(self.buffer) and not self._done:
+            char = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._close_string()
+            elif char == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = self._pos
+            elif char in "{[":
+                self._open(char)
+            elif char in "}]":
+                if self._stack:
+                    item = self._close()
+                    if item is not None:
+                        completed.append(item)
+            elif char == ":" and self._stack:
+                self._stack[-1]["expect_key"] = False
+            elif char == "," and self._stack:
+                top = self._stack[-1]
+                if top["type"] == "object":
+                    top["expect_key"] = True
+                else:
+                    top["index"] += 1
+            self._pos += 1
+        return completed
+
+    def _path(self) -> Path:
+        path = []
+        for parent in self._stack:
+            path.append(parent["key"] if parent["type"] == "object" else parent["index"])
+        return tuple(path)
+
+    def _open(self, char: str) -> None:
+        self._stack.append({
+            "type": "object" if char == "{" else "array",
+            "start": self._pos,
+            "path": self._path() if self._stack else (),
+            "key": None,
+            "index": 0,
+            "expect_key": True,
+        })
+
+    def _close_string(self) -> None:
+        top = self._stack[-1]
+        if top["type"] == "object" and top["expect_key"]:
+            top["key"] = json.loads(self.buffer[self._string_start:self._pos + 1])
+
+    def _close(self):
+        container = self._stack.pop()
+        if not self._stack:
+            self._done = True
+        path = container["path"]
+        if any(_matches(path, pattern) for pattern in self.watch):
+            raw = self.buffer[container["start"]:self._pos + 1]
+            try:
+                return path, json.loads(raw)
+            except json.JSONDecodeError:
+                return None
+        return None
+
+
+def strip_code_fences(text: str) -> str:
+    """Removes a surrounding markdown code fence, e.g. ```json ... ```"""
+    return _FENCE_CLOSE.sub("", _FENCE_OPEN.sub("", text, count=1), count=1)
+
+
+def extract_json(text: str) -> Any:
+    """Parses the first JSON object or array in the text, ignoring fences and surrounding prose"""
+    text = strip_code_fences(text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("No JSON value found")
+    value, _ = json.JSONDecoder().raw_decode(text, min(starts))
+    return value
+
+
+def salvage_items(text: str, watch: Sequence[Sequence[Any]]) -> List[Any]:
+    """Every container at a watched path that closed before the text was cut off"""
+    return [value for _, value in IncrementalJSONParser(watch).feed(strip_code_fences(text))]
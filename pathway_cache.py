@@ -0,0 +1,206 @@
+"""
+Content-addressed cache of complete generated pathways.
+
+Entries are keyed on a canonical hash of the student profile (API keys and
+request flags excluded) and served with stale-while-revalidate semantics:
+within PATHWAY_CACHE_TTL an entry is fresh; for a further
+PATHWAY_CACHE_STALE_TTL it is still served immediately while a background
+task regenerates it. Refreshes run with 'bypass_cache' set, so they recompute
+every stage instead of reusing stored artifacts.
+
+Each stored pathway also keeps its pre-serialized, compressed response body
+(response_encoding), built on first request and reused until the entry changes.
+
+Pathways are fetched back by an opaque id, an HMAC of the profile key under
+PATHWAY_ID_SECRET (random per process when unset), so ids cannot be derived
+from a profile. Issued ids are indexed next to the pathways, in the same
+SQLite file when PATHWAY_CACHE_PATH is set.
+
+Degraded pathways (enhancement sections that fell back to the original content,
+or retrieval queries that timed out or failed) are returned but not stored, so
+the next request for the profile regenerates them instead of being served the
+degraded copy until it expires.
+"""
+import asyncio
+import copy
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from cache import TTLCache, TieredCache
+from response_encoding import EncodedBody, encode_json
+
+# Profile fields that do not affect the generated content
+NON_CONTENT_FIELDS = {"google_api_key", "tavily_api_key", "bypass_cache", "stream_phases"}
+
+
+def canonical_profile(student_profile: dict) -> Dict[str, Any]:
+    """Drops credentials/flags and normalizes case and whitespace of string fields"""
+    canonical = {}
+    for field, value in student_profile.items():
+        if field in NON_CONTENT_FIELDS or value is None:
+            continue
+        if isinstance(value, str):
+            value = " ".join(value.casefold().split())
+        canonical[field] = value
+    return canonical
+
+
+def profile_key(student_profile: dict) -> str:
+    """Stable content hash of a student profile"""
+    payload = json.dumps(canonical_profile(student_profile), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cohort_key(student_profile: dict) -> tuple:
+    """Normalized (topic, domain) shared by profiles whose retrieval can be shared"""
+    canonical = canonical_profile(student_profile)
+    return canonical.get("progress", ""), canonical.get("domain", "")
+
+
+def is_degraded(pathway: dict) -> bool:
+    """Whether a pathway was built around an upstream failure and should not be cached"""
+    metadata = pathway.get("metadata") or {}
+    statuses = (metadata.get("query_statuses") or {}).values()
+    return bool(metadata.get("enhancement_fallbacks")) or any(s not in ("ok", "cached") for s in statuses)
+
+
+class PathwayCache:
+    """TieredCache wrapper adding stale-while-revalidate refreshes"""
+
+    def __init__(self, ttl: float = 3600, stale_ttl: float = 86400, maxsize: int = 128, path: Optional[str] = None,
+                 id_secret: Optional[str] = None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = TieredCache("pathway", maxsize=maxsize, ttl=ttl + stale_ttl, path=path)
+        # Opaque pathway id -> profile key
+        self.ids = TieredCache("pathway_ids", maxsize=maxsize, ttl=ttl + stale_ttl, path=path)
+        self._id_secret = id_secret.encode("utf-8") if id_secret else os.urandom(32)
+        self.counters = {"stale_served": 0, "refreshes": 0, "refresh_failures": 0, "encodes": 0, "encoded_hits": 0,
+                         "degraded_skipped": 0}
+        # Encoded bodies are stamped with their pathway's stored_at, so a refreshed entry is re-encoded
+        self._encoded = TTLCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self._refreshing: Set[str] = set()
+        self._background: Set[asyncio.Task] = set()
+
+    async def get_or_generate(
+        self,
+        student_profile: dict,
+        generate: Callable[[dict], Awaitable[dict]],
+    ) -> dict:
+        """
+        Returns the cached pathway for this profile, generating it on a miss.
+        Stale entries are returned immediately and refreshed in the background.
+        """
+        key = profile_key(student_profile)
+        if student_profile.get("bypass_cache"):
+            self.store.record_bypass()
+            entry = None
+        else:
+            entry = await self.store.aget_entry(key)
+
+        if entry is not None:
+            pathway, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                self.counters["stale_served"] += 1
+                self._schedule_refresh(key, student_profile, generate)
+            return copy.deepcopy(pathway)
+
+        pathway = await generate(student_profile)
+        await self._store(key, pathway)
+        return copy.deepcopy(pathway)
+
+    async def peek(self, student_profile: dict,
+             generate: Optional[Callable[[dict], Awaitable[dict]]] = None) -> Optional[dict]:
+        """
+        Returns the cached pathway (fresh or stale) without generating it on a
+        miss. A stale entry is refreshed in the background when `generate` is given.
+        """
+        if student_profile.get("bypass_cache"):
+            self.store.record_bypass()
+            return None
+        key = profile_key(student_profile)
+        entry = await self.store.aget_entry(key)
+        if entry is None:
+            return None
+        pathway, stored_at = entry
+        if generate is not None and time.time() - stored_at > self.ttl:
+            self.counters["stale_served"] += 1
+            self._schedule_refresh(key, student_profile, generate)
+        return copy.deepcopy(pathway)
+
+    async def put(self, student_profile: dict, pathway: dict) -> None:
+        await self._store(profile_key(student_profile), pathway)
+
+    async def encoded(self, key: str) -> Optional[EncodedBody]:
+        """Pre-serialized response body of the stored pathway (fresh or stale) with this profile key"""
+        entry = await self.store.aget_entry(key)
+        if entry is None:
+            return None
+        pathway, stored_at = entry
+        cached = self._encoded.get_entry(key)
+        if cached is not None and cached[1] == stored_at:
+            self.counters["encoded_hits"] += 1
+            return cached[0]
+        self.counters["encodes"] += 1
+        body = encode_json(pathway)
+        self._encoded.set(key, body, stored_at=stored_at)
+        return body
+
+    async def pathway_id(self, key: str) -> str:
+        """Opaque id under which the pathway with this profile key can be fetched"""
+        pathway_id = hmac.new(self._id_secret, key.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+        if await self.ids.aget(pathway_id) != key:
+            await self.ids.aset(pathway_id, key)
+        return pathway_id
+
+    async def encoded_by_id(self, pathway_id: str) -> Optional[EncodedBody]:
+        """encoded() for an id issued by pathway_id()"""
+        key = await self.ids.aget(pathway_id)
+        return await self.encoded(key) if key is not None else None
+
+    async def _store(self, key: str, pathway: dict) -> None:
+        if is_degraded(pathway):
+            self.counters["degraded_skipped"] += 1
+            return
+        await self.store.aset(key, pathway)
+
+    def _schedule_refresh(self, key: str, student_profile: dict, generate) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, dict(student_profile), generate))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _refresh(self, key: str, student_profile: dict, generate) -> None:
+        try:
+            self.counters["refreshes"] += 1
+            pathway = await generate({**student_profile, "bypass_cache": True})
+            await self._store(key, pathway)
+        except Exception as e:
+            self.counters["refresh_failures"] += 1
+            print(f"Background pathway refresh failed: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.store.stats(),
+            **self.counters,
+            "fresh_ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "refreshing": len(self._refreshing),
+        }
+
+
+pathway_cache = PathwayCache(
+    ttl=float(os.getenv("PATHWAY_CACHE_TTL", "3600")),
+    stale_ttl=float(os.getenv("PATHWAY_CACHE_STALE_TTL", "86400")),
+    maxsize=int(os.getenv("PATHWAY_CACHE_MAX_ENTRIES", "128")),
+    path=os.getenv("PATHWAY_CACHE_PATH") or None,
+    id_secret=os.getenv("PATHWAY_ID_SECRET") or None,
+)
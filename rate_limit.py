@@ -0,0 +1,181 @@
+"""
+Per-upstream rate limiting and adaptive concurrency control.
+
+Every Gemini and Tavily call runs inside `async with upstream_limiter(provider).slot():`
+which first waits for a concurrency slot and then for a token-bucket token.
+The concurrency limit adapts AIMD-style: it grows by one slot per window of
+successful calls, holds on other failures (timeouts, 5xx, cancelled hedges)
+and halves whenever the upstream answers with a rate-limit error, so bursts
+queue here instead of turning into 429 storms. Time spent
+waiting is exported as pathway_upstream_queue_seconds.
+
+Limits come from the environment, per provider (GEMINI_*, TAVILY_*):
+    <P>_RATE_LIMIT           sustained requests/second (0 disables the bucket)
+    <P>_BURST                bucket size
+    <P>_CONCURRENCY          initial concurrency limit
+    <P>_MAX_CONCURRENCY      ceiling for the adaptive limit
+    <P>_MIN_CONCURRENCY      floor for the adaptive limit
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from metrics import record_queue_delay
+
+DEFAULT_LIMITS = {
+    "gemini": {"rate": 10.0, "burst": 20, "concurrency": 16, "max_concurrency": 64, "min_concurrency": 2},
+    "tavily": {"rate": 20.0, "burst": 40, "concurrency": 32, "max_concurrency": 128, "min_concurrency": 4},
+}
+
+# Substrings that mark an upstream overload response
+RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "rate limit", "too many requests", "quota")
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """True for 429 / RESOURCE_EXHAUSTED style errors from either upstream"""
+    response = getattr(error, "response", None)
+    if getattr(error, "status_code", None) == 429 or getattr(response, "status_code", None) == 429:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    AIMD concurrency limit: +1 slot after `limit` successes, multiplied by
+    `backoff` on a rate-limit error and unchanged by any other failure,
+    within [minimum, maximum].
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, backoff: float = 0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff = backoff
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, rate_limited: bool = False, succeeded: bool = True) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class UpstreamLimiter:
+    """Token bucket plus adaptive concurrency limit for one upstream provider"""
+
+    def __init__(self, provider: str, rate: float, burst: int, concurrency: int,
+                 max_concurrency: int, min_concurrency: int = 1):
+        self.provider = provider
+        self.loop = asyncio.get_running_loop()
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrencyLimit(concurrency, min_concurrency, max_concurrency)
+        self.counters = {"calls": 0, "rate_limited": 0, "queued": 0}
+        self._queue_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a concurrency slot and one rate token for the duration of an upstream call"""
+        start = time.perf_counter()
+        await self.concurrency.acquire()
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            await self.concurrency.release(succeeded=False)
+            raise
+        waited = time.perf_counter() - start
+        record_queue_delay(self.provider, waited)
+        self._queue_seconds += waited
+        self.counters["calls"] += 1
+        if waited >= 0.001:
+            self.counters["queued"] += 1
+        rate_limited = succeeded = False
+        try:
+            yield
+            succeeded = True
+        except Exception as e:
+            rate_limited = is_rate_limited(e)
+            if rate_limited:
+                self.counters["rate_limited"] += 1
+            raise
+        finally:
+            await self.concurrency.release(rate_limited, succeeded)
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.counters["calls"]
+        return {
+            **self.counters,
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "avg_queue_seconds": round(self._queue_seconds / calls, 4) if calls else 0.0,
+        }
+
+
+def _limits_from_env(provider: str) -> Dict[str, Any]:
+    prefix = provider.upper()
+    defaults = DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS["gemini"])
+    return {
+        "rate": float(os.getenv(f"{prefix}_RATE_LIMIT", defaults["rate"])),
+        "burst": int(os.getenv(f"{prefix}_BURST", defaults["burst"])),
+        "concurrency": int(os.getenv(f"{prefix}_CONCURRENCY", defaults["concurrency"])),
+        "max_concurrency": int(os.getenv(f"{prefix}_MAX_CONCURRENCY", defaults["max_concurrency"])),
+        "min_concurrency": int(os.getenv(f"{prefix}_MIN_CONCURRENCY", defaults["min_concurrency"])),
+    }
+
+
+_limiters: Dict[str, UpstreamLimiter] = {}
+
+
+def upstream_limiter(provider: str) -> UpstreamLimiter:
+    """
+    Limiter shared by every call to a provider on the running event loop,
+    configured from the environment on first use.
+    """
+    limiter = _limiters.get(provider)
+    # asyncio primitives are bound to one loop, so a new loop gets a fresh limiter
+    if limiter is None or limiter.loop is not asyncio.get_running_loop():
+        limiter = _limiters[provider] = UpstreamLimiter(provider, **_limits_from_env(provider))
+    return limiter
+
+
+def limiter_stats(provider: str) -> Dict[str, Any]:
+    """stats() of a provider's limiter, or {} before its first call"""
+    limiter = _limiters.get(provider)
+    return limiter.stats() if limiter is not None else {}
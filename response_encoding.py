@@ -0,0 +1,91 @@
+"""
+Pre-serialized, pre-compressed JSON bodies for pathway responses.
+
+A pathway is serialized once with orjson and compressed once per content
+coding (gzip always, brotli when the Brotli package is installed), so serving
+it again is a dictionary lookup instead of a JSON encode plus compression.
+Each body carries a strong ETag computed from its serialized content; the
+compressed variants get their own suffixed ETags since their bytes differ.
+"""
+import gzip
+import hashlib
+from typing import Dict, NamedTuple, Optional
+
+import orjson
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Bodies are compressed once per stored pathway, on the request path, so
+# levels trade a few milliseconds once for smaller bodies on every response
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Preferred content codings when the client accepts several equally
+PREFERRED_ENCODINGS = ("br", "gzip")
+
+
+class EncodedBody(NamedTuple):
+    """A JSON body with its compressed variants and content digest"""
+    identity: bytes
+    variants: Dict[str, bytes]
+    digest: str
+
+    def body(self, encoding: Optional[str]) -> bytes:
+        return self.variants[encoding] if encoding else self.identity
+
+    def etag(self, encoding: Optional[str]) -> str:
+        """Strong ETag of the representation sent with `encoding`"""
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+def encode_json(value) -> EncodedBody:
+    """Serializes `value` with orjson and precomputes the gzip and brotli variants"""
+    identity = orjson.dumps(value)
+    variants = {"gzip": gzip.compress(identity, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(identity, quality=BROTLI_QUALITY)
+    # Tiny bodies can grow when compressed
+    variants = {encoding: data for encoding, data in variants.items() if len(data) < len(identity)}
+    return EncodedBody(identity, variants, hashlib.sha256(identity).hexdigest()[:32])
+
+
+def negotiate_encoding(accept_encoding: str, available) -> Optional[str]:
+    """Best available content coding for an Accept-Encoding header, or None for identity"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in PREFERRED_ENCODINGS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if coding in available and weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def etag_matches(if_none_match: str, digest: str) -> bool:
+    """
+    Whether an If-None-Match header matches the body with `digest` in any
+    encoding. Uses weak comparison, as RFC 9110 requires for If-None-Match.
+    """
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-")[0] == digest:
+            return True
+    return False
@@ -1,6 +1,16 @@
 from dotenv import load_dotenv
+from typing import Dict, List, Tuple
+import asyncio
 import os
+import time
 from langgraph.func import task
+from langchain_core.documents import Document
+from cache import TieredCache
+from context_budget import assemble_context, estimate_tokens
+from reranker import rerank_documents
+from client_pool import pooled_client, shared_http_client
+from metrics import instrument_stage, record_retrieved, record_upstream_error
+from call_policy import guarded_call
 # from langchain.retrievers.tavily_search_api import TavilySearchAPIRetriever
 from langchain_community.retrievers import TavilySearchAPIRetriever
 
@@ -10,45 +20,236 @@ load_dotenv()
 # Retrieve the Tavily API key from the environment
 # tavily_api_key = os.getenv("TAVILY_API_KEY")
 
+# Per-query timeout (seconds) for each Tavily search in the fan-out
+RETRIEVAL_QUERY_TIMEOUT = float(os.getenv("RETRIEVAL_QUERY_TIMEOUT", "15"))
 
-@task
-def perform_retrieval(student_profile: dict) -> dict:
+# Number of documents fetched per query
+RETRIEVAL_K = 10
+
+# Shared cache of Tavily results keyed on the normalized query and k.
+# Set RETRIEVAL_CACHE_PATH to a file on a shared volume to share hits across instances.
+retrieval_cache = TieredCache(
+    "retrieval",
+    maxsize=int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "256")),
+    ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "3600")),
+    path=os.getenv("RETRIEVAL_CACHE_PATH") or None,
+)
+
+
+class PooledTavilyRetriever(TavilySearchAPIRetriever):
     """
-    Uses TavilySearchAPIRetriever to search for documents based on a combined query that includes:
-      - Learning Topic (from 'progress')
-      - Domain
-      - Learning Style
-    Returns a dictionary with 'combined_text' (concatenated text from the retrieved documents)
-    and 'relevant_links' (a list of source URLs).
+    Tavily retriever whose async path posts to the search API over the shared
+    keep-alive HTTP client instead of building a new Tavily client per query.
+    Set TAVILY_BASE_URL to target another endpoint (e.g. fake_upstreams.py).
     """
-    queries = {
-        "Learning Topic": student_profile.get("progress"),
-        "domain": student_profile.get("domain") + f" with respect to {student_profile.get('progress')}",
-        "learning_style": student_profile.get("learning_style") + f" with respect to {student_profile.get('progress')}"
+    base_url: str = "https://api.tavily.com"
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None):
+        api_key = self.api_key or os.environ["TAVILY_API_KEY"]
+        response = await shared_http_client().post(
+            f"{self.base_url}/search",
+            headers={"Authorization": f"Bearer {api_key}"},
+            json={
+                "query": query,
+                "max_results": self.k if not self.include_generated_answer else self.k - 1,
+                "search_depth": self.search_depth.value,
+                "include_answer": self.include_generated_answer,
+                "include_raw_content": self.include_raw_content,
+                "include_images": self.include_images,
+                "include_domains": self.include_domains or [],
+                "exclude_domains": self.exclude_domains or [],
+                **(self.kwargs or {}),
+            },
+        )
+        response.raise_for_status()
+        payload = response.json()
+        return [
+            Document(
+                page_content=result.get("raw_content" if self.include_raw_content else "content") or "",
+                metadata={
+                    "title": result.get("title", ""),
+                    "source": result.get("url", ""),
+                    **{k: v for k, v in result.items() if k not in ("content", "title", "url", "raw_content")},
+                    "images": payload.get("images"),
+                },
+            )
+            for result in payload.get("results", [])
+        ]
+
+
+def get_retriever(api_key, k: int = RETRIEVAL_K) -> PooledTavilyRetriever:
+    """Warm retriever from the client registry"""
+    base_url = os.getenv("TAVILY_BASE_URL") or "https://api.tavily.com"
+    return pooled_client("tavily", "search", api_key,
+                         lambda: PooledTavilyRetriever(k=k, api_key=api_key, base_url=base_url),
+                         k=k, base_url=base_url)
+
+
+def retrieval_cache_key(query: str, k: int) -> str:
+    """Normalizes a query (case and whitespace) so equivalent searches share an entry"""
+    normalized = " ".join(query.lower().split())
+    return f"{k}:{normalized}"
+
+
+async def _run_query(retriever, field: str, query: str, timeout: float, use_cache: bool = True):
+    """
+    Runs a single retrieval query under its own timeout, serving it from the
+    retrieval cache when possible.
+    Returns (field, docs, timing) and never raises, so one slow or failing
+    query cannot sink the other queries in the fan-out.
+    """
+    start = time.perf_counter()
+    cache_key = retrieval_cache_key(query, retriever.k)
+    cached = await retrieval_cache.aget(cache_key) if use_cache else None
+    if cached is not None:
+        docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in cached]
+        timing = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "status": "cached",
+            "documents": len(docs),
+        }
+        return field, docs, timing
+
+    print(f"Performing retrieval for {field}: {query}")
+    try:
+        # Retries and hedges share the per-query deadline, including time spent rate limited
+        docs = await guarded_call("retrieval", "tavily", lambda: retriever.ainvoke(query), deadline=timeout)
+        status = "ok"
+        record_retrieved(docs)
+        if docs:
+            await retrieval_cache.aset(
+                cache_key,
+                [{"page_content": d.page_content, "metadata": d.metadata} for d in docs],
+            )
+    except asyncio.TimeoutError:
+        print(f"Retrieval for {field} timed out after {timeout}s")
+        record_upstream_error("retrieval", "timeout")
+        docs, status = [], "timeout"
+    except Exception as e:
+        print(f"Retrieval for {field} failed: {e}")
+        record_upstream_error("retrieval", e)
+        docs, status = [], "error"
+    timing = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "status": status,
+        "documents": len(docs),
     }
-    
-    
-    retriever = TavilySearchAPIRetriever(k=10,
-                                         api_key=student_profile.get("tavily_api_key"))
+    return field, docs, timing
+
+
+async def _retrieve_context(queries: Dict[str, str], weighted_queries: List[Tuple[str, float]],
+                            tavily_api_key: str, use_cache: bool = True) -> dict:
+    """
+    Runs the queries concurrently, then reranks and assembles the retrieved
+    passages into one token-budgeted context. Shared by single-profile and
+    cohort retrieval.
+    """
+    retriever = get_retriever(tavily_api_key)
+    if not use_cache:
+        # One bypass per request, however many queries it fans out to
+        retrieval_cache.record_bypass()
     all_docs = []
     all_links = []
+    timings = {}
     
-    for field, query in queries.items():
-        print(f"Performing retrieval for {field}: {query}")
-        retrieved_docs = retriever.invoke(query)
+    pending = [
+        _run_query(retriever, field, query, RETRIEVAL_QUERY_TIMEOUT, use_cache=use_cache)
+        for field, query in queries.items()
+    ]
+    # Merge each query's results as soon as it completes
+    for finished in asyncio.as_completed(pending):
+        field, retrieved_docs, timing = await finished
+        timings[field] = timing
         all_docs.extend(retrieved_docs)
         field_links = [doc.metadata.get("source") for doc in retrieved_docs if doc.metadata.get("source")]
         all_links.extend(field_links)
     
+    if all(timing["status"] not in ("ok", "cached") for timing in timings.values()):
+        raise RuntimeError("All retrieval queries failed or timed out")
+    
     # Remove duplicate links
     all_links = list(set(all_links))
     
-    # Combine text from all retrieved documents.
-    document_texts = [doc.page_content for doc in all_docs]
-    combined_text = "\n\n".join(document_texts)
+    # Score chunked passages against the profile and keep only the top-N
+    reranked = rerank_documents(all_docs, weighted_queries)
+    
+    # Dedupe, strip boilerplate and pack the best passages into the token budget
+    context = assemble_context(
+        reranked["documents"],
+        scores=reranked["scores"],
+        tokens_before=estimate_tokens("\n\n".join(doc.page_content for doc in all_docs)),
+    )
+    context["stats"].update(reranked["stats"])
+    combined_text = context["combined_text"]
+    print(f"Context assembly saved {context['stats']['tokens_saved']} tokens "
+          f"({context['stats']['tokens_before']} -> {context['stats']['tokens_after']})")
 
     # print("Relevant Links: \n\n ", all_links)
     # print("Document Text: \n\n ", document_texts)
     # print("\n" + "=" * 50 + "\n")
     
-    return {"combined_text": combined_text, "relevant_links": all_links}
+    return {
+        "combined_text": combined_text,
+        "relevant_links": all_links,
+        "timings": timings,
+        "context_stats": context["stats"],
+    }
+
+
+@task
+@instrument_stage("retrieval")
+async def perform_retrieval(student_profile: dict) -> dict:
+    """
+    Uses TavilySearchAPIRetriever to search for documents based on a combined query that includes:
+      - Learning Topic (from 'progress')
+      - Domain
+      - Learning Style
+    The three queries run concurrently, each with its own timeout; a query that times out
+    or fails contributes no documents instead of failing the request.
+    Results are cached per query; set 'bypass_cache' in the profile to force fresh searches.
+    Returns a dictionary with 'combined_text' (deduplicated, token-budgeted text from the
+    retrieved documents), 'relevant_links' (a list of source URLs), 'timings' (per-query
+    latency and status) and 'context_stats' (dedupe counts and tokens saved).
+    """
+    queries = {
+        "Learning Topic": student_profile.get("progress"),
+        "domain": student_profile.get("domain") + f" with respect to {student_profile.get('progress')}",
+        "learning_style": student_profile.get("learning_style") + f" with respect to {student_profile.get('progress')}"
+    }
+    return await _retrieve_context(
+        queries,
+        [
+            (student_profile.get("progress"), 1.0),
+            (student_profile.get("domain"), 0.5),
+            (student_profile.get("learning_style"), 0.5),
+        ],
+        student_profile.get("tavily_api_key"),
+        use_cache=not student_profile.get("bypass_cache"),
+    )
+
+
+@task
+@instrument_stage("retrieval")
+async def perform_group_retrieval(profiles: List[dict]) -> dict:
+    """
+    Retrieval shared by a cohort of profiles with the same topic and domain:
+    one topic query, one domain query and one query per distinct learning
+    style, assembled into a single context. The styles share the weight a
+    single profile's style query gets in reranking.
+    """
+    first = profiles[0]
+    topic, domain = first.get("progress"), first.get("domain")
+    styles = sorted({profile.get("learning_style") for profile in profiles if profile.get("learning_style")})
+    queries = {
+        "Learning Topic": topic,
+        "domain": f"{domain} with respect to {topic}",
+    }
+    for style in styles:
+        queries[f"learning_style: {style}"] = f"{style} with respect to {topic}"
+    weighted_queries = [(topic, 1.0), (domain, 0.5)] + [(style, 0.5 / len(styles)) for style in styles]
+    return await _retrieve_context(
+        queries,
+        weighted_queries,
+        first.get("tavily_api_key"),
+        use_cache=not any(profile.get("bypass_cache") for profile in profiles),
+    )
@@ -0,0 +1,42 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+Concurrent callers that ask for the same key await one shared execution and
+all receive its result (or its exception).
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Runs at most one execution per key at a time and shares it with every waiter"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {"executions": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self.counters["executions"] += 1
+            task.add_done_callback(lambda t: self._finish(key, t))
+        # Shield so one waiter disconnecting does not cancel the shared execution
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.counters["executions"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "in_flight": len(self._inflight),
+            "collapse_rate": round(self.counters["coalesced"] / total, 4) if total else 0.0,
+        }
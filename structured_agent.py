@@ -1,37 +1,67 @@
+from langgraph.config import get_stream_writer
 from langgraph.func import task
-from langchain_google_genai import ChatGoogleGenerativeAI
-from data_models import LearningPathway
-from typing import Dict, Any
+from data_models import (
+    LearningPathway, PathwayPhase, Milestone, ExplanationSection,
+    PathwayOutline, PathwayHistory, NextStepsSection,
+)
+from partial_json import IncrementalJSONParser
+from rate_limit import upstream_limiter
+from call_policy import guarded_call, is_retryable
+from context_handle import BoundContext, ContextHandle
+from model_routing import model_for, pathway_uses_hobby, resolve_tier
+from metrics import instrument_stage, record_llm_output, record_tokens
+from typing import Dict, Any, AsyncIterator
+import asyncio
 import json
+import os
+import time
 
-@task  
-def generate_structured_pathway(student_profile: dict, combined_text: str) -> Dict[str, Any]:
-    """
-    Generates a complete structured learning pathway matching React frontend expectations
+# "monolithic" generates the whole LearningPathway in one call; "decomposed" generates
+# the independent sub-schemas concurrently and assembles them
+PATHWAY_GENERATION_MODE = os.getenv("PATHWAY_GENERATION_MODE", "monolithic")
+
+# Express requests skip enhancement, so this single call writes the final explanations
+EXPRESS_PROMPT_SUFFIX = """
+    This pathway is final: no later pass will expand it. Make each explanation section a complete
+    150-300 word explanation covering the concept, a hobby-based analogy, a real-world application
+    in the user's domain and a common pitfall.
     """
-    model = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        api_key=student_profile.get("google_api_key")
-    )
-    
-    # Use structured output with Pydantic model
-    structured_model = model.with_structured_output(LearningPathway)
-    
-    prompt = f"""
+
+# Seconds the pathway stream may go without a chunk before it is abandoned for a structured call
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", "30"))
+
+# Schema element produced for each watched array in the streamed pathway JSON
+STREAMED_ITEMS = {
+    "phases": ("phase", PathwayPhase),
+    "history_and_milestones": ("milestone", Milestone),
+    "explanation_and_kickstart_examples": ("explanation_section", ExplanationSection),
+}
+
+
+def _hobby_line(student_profile: dict) -> str:
+    return f"\n    - Hobbies: {student_profile.get('hobby')}" if pathway_uses_hobby(student_profile) else ""
+
+
+def _section_examples(student_profile: dict) -> str:
+    return "hobby-specific analogies" if pathway_uses_hobby(student_profile) else "practical, domain-relevant examples"
+
+
+def build_pathway_prompt(student_profile: dict) -> str:
+    """Task prompt shared by the monolithic and streaming pathway generators; the context comes from the handle"""
+    examples = ("Rich examples customized around the user's hobbies" if pathway_uses_hobby(student_profile)
+                else "Rich, practical examples relevant to their domain")
+    return f"""
     Create a personalized, adaptive learning pathway for a user with the following preferences:
     - Preferred Learning Style: {student_profile.get('learning_style')}
-    - Learning Topic/Subject: {student_profile.get('progress')}
-    - Hobbies: {student_profile.get('hobby')}
+    - Learning Topic/Subject: {student_profile.get('progress')}{_hobby_line(student_profile)}
     - Domain/Field of Interest: {student_profile.get('domain')}
 
-    Your goal is to act as an "Agentic AI Learning Assistant". Curate the best resources, design a comprehensive personalized "Adaptive Learning Pathway", and explain each step clearly.
-
-    Use the following extensive context to enrich the plan with diverse perspectives and comprehensive coverage:
-    {combined_text}
+    Design a comprehensive personalized "Adaptive Learning Pathway" and explain each step clearly,
+    using the retrieved context above for diverse perspectives and comprehensive coverage.
 
     The pathway should include:
     1. **Engaging History & Milestones:** A comprehensive history of the topic with 5-7 key milestones.
-    2. **Customized Examples:** Rich examples customized around the user's hobbies throughout all explanation sections.
+    2. **Customized Examples:** {examples} throughout all explanation sections.
     3. **Real-world Projects:** Multiple real-world project ideas and use-cases relevant to their domain.
     4. **Handpicked Links:** A curated list of reference links for deeper dives.
     5. **Progressive Learning:** Each phase should build upon the previous one, creating a logical learning progression.
@@ -40,21 +70,232 @@ def generate_structured_pathway(student_profile: dict, combined_text: str) -> Di
     Structure the response with:
     - A catchy title and welcoming introduction
     - At least 7 comprehensive learning phases, each with 3-4 detailed steps
-    - 5-6 explanation sections with hobby-specific analogies
+    - 5-6 explanation sections with {_section_examples(student_profile)}
     - 5-7 historical milestones
     - A next steps section with 4-5 actionable recommendations
     - A list of relevant links from the retrieved context
 
     Generate a comprehensive, well-structured learning plan. The tone should be encouraging, clear, and highly personalized.
     Use markdown formatting in content fields for better readability.
-    """
-    
-    # Get structured response
-    structured_response = structured_model.invoke(prompt)
-    
+    """ + (EXPRESS_PROMPT_SUFFIX if resolve_tier(student_profile) == "express" else "")
+
+
+def _to_dict(structured_response) -> Dict[str, Any]:
     # Convert to dict if it's a Pydantic model, otherwise return as dict
     if isinstance(structured_response, LearningPathway):
         return structured_response.model_dump()
     else:
         # If it's already a dict, return as is
         return dict(structured_response)
+
+
+async def invoke_structured(model, schema, prompt: str, stage: str = "structured_pathway",
+                            method: str = "function_calling"):
+    """Structured-output call that also records the token usage of the raw response"""
+    structured_model = model.with_structured_output(schema, method=method, include_raw=True)
+    result = await guarded_call(stage, "gemini", lambda: structured_model.ainvoke(prompt))
+    record_tokens(stage, result["raw"])
+    if result.get("parsing_error") is not None or result.get("parsed") is None:
+        record_llm_output(stage, "wasted")
+        raise result.get("parsing_error") or ValueError(f"Model returned no {schema.__name__}")
+    record_llm_output(stage, "parsed")
+    return result["parsed"]
+
+
+def _profile_header(student_profile: dict) -> str:
+    return f"""
+    Learner preferences:
+    - Preferred Learning Style: {student_profile.get('learning_style')}
+    - Learning Topic/Subject: {student_profile.get('progress')}{_hobby_line(student_profile)}
+    - Domain/Field of Interest: {student_profile.get('domain')}
+    """
+
+
+HISTORY_HOBBY_NOTE = " that connects to the learner's hobbies where natural"
+
+
+def build_decomposed_prompts(student_profile: dict) -> Dict[str, str]:
+    """One task prompt per independently generated part of the pathway; the context comes from the handle"""
+    header = _profile_header(student_profile)
+    return {
+        "outline": f"""
+    Design a personalized "Adaptive Learning Pathway", using the retrieved context above to enrich
+    the plan with diverse perspectives and comprehensive coverage.
+    {header}
+    Produce:
+    - A catchy title and welcoming introduction
+    - At least 7 comprehensive learning phases, each with 3-4 detailed steps, each phase
+      building on the previous one, with real-world projects relevant to the domain
+    - 5-6 explanation sections with {_section_examples(student_profile)}
+
+    The tone should be encouraging, clear, and highly personalized.
+    Use markdown formatting in content fields for better readability.
+    """,
+        "history": f"""
+    Write an engaging history of the learning topic below as 5-7 key milestones, each with a
+    year and a short description{HISTORY_HOBBY_NOTE if pathway_uses_hobby(student_profile) else ""}.
+    {header}
+    """,
+        "next_steps": f"""
+    Suggest what the learner should do after completing a learning pathway on the topic below:
+    a section title and 4-5 actionable next steps relevant to their domain.
+    {header}
+    """,
+    }
+
+
+async def _generate_monolithic(context: BoundContext, student_profile: dict) -> Dict[str, Any]:
+    prompt = context.prompt(build_pathway_prompt(student_profile))
+    
+    # Get structured response using the Pydantic model
+    structured_response = await invoke_structured(context.model, LearningPathway, prompt,
+                                                  method=context.structured_method)
+    
+    return _to_dict(structured_response)
+
+
+async def _generate_decomposed(context: BoundContext, student_profile: dict) -> Dict[str, Any]:
+    """
+    Generates the outline, history and next steps concurrently with their own
+    sub-models, then assembles and validates the full LearningPathway. The returned
+    dict carries a latency report under metadata.structured_generation.
+    """
+    prompts = build_decomposed_prompts(student_profile)
+    schemas = {
+        "outline": PathwayOutline,
+        "history": PathwayHistory,
+        "next_steps": NextStepsSection,
+    }
+    part_seconds = {}
+
+    async def generate_part(name: str):
+        start = time.perf_counter()
+        result = await invoke_structured(context.model, schemas[name], context.prompt(prompts[name]),
+                                         method=context.structured_method)
+        part_seconds[name] = round(time.perf_counter() - start, 3)
+        return name, schemas[name].model_validate(result)
+
+    start = time.perf_counter()
+    parts = dict(await asyncio.gather(*(generate_part(name) for name in schemas)))
+    wall_seconds = round(time.perf_counter() - start, 3)
+
+    pathway = LearningPathway(
+        **parts["outline"].model_dump(),
+        history_and_milestones=parts["history"].history_and_milestones,
+        next_steps=parts["next_steps"],
+        # Filled with the retrieved source links by the agent, so no call is spent generating them
+        relevant_links=[],
+    ).model_dump()
+    pathway["metadata"] = {"structured_generation": {
+        "mode": "decomposed",
+        "wall_seconds": wall_seconds,
+        "part_seconds": part_seconds,
+        # What the same calls would have cost run back to back
+        "serial_seconds": round(sum(part_seconds.values()), 3),
+    }}
+    return pathway
+
+
+@task  
+@instrument_stage("structured_pathway")
+async def generate_structured_pathway(student_profile: dict, context: ContextHandle) -> Dict[str, Any]:
+    """
+    Generates a complete structured learning pathway matching React frontend expectations.
+    PATHWAY_GENERATION_MODE selects one monolithic structured-output call or the
+    decomposed mode that generates independent sub-schemas concurrently. The model
+    comes from the profile's tier (model_routing); the retrieved context from the
+    request's context handle.
+    """
+    bound = await context.bind(student_profile.get("google_api_key"), model_for("structured_pathway", student_profile))
+    
+    start = time.perf_counter()
+    # Express requests are always a single call
+    if PATHWAY_GENERATION_MODE == "decomposed" and resolve_tier(student_profile) != "express":
+        return await _generate_decomposed(bound, student_profile)
+    pathway = await _generate_monolithic(bound, student_profile)
+    pathway["metadata"] = {"structured_generation": {
+        "mode": "monolithic",
+        "wall_seconds": round(time.perf_counter() - start, 3),
+    }}
+    return pathway
+
+
+async def stream_structured_pathway(student_profile: dict, context: ContextHandle) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streams the pathway as JSON tokens and parses them incrementally against the
+    data_models schema. Yields {"type": "phase" | "milestone" | "explanation_section",
+    "index": i, "item": {...}} as soon as each element closes, then a final
+    {"type": "pathway", "pathway": {...}} with the validated LearningPathway.
+    """
+    bound = await context.bind(student_profile.get("google_api_key"), model_for("structured_pathway", student_profile),
+                               response_mime_type="application/json")
+    model = bound.model
+    
+    prompt = bound.prompt(build_pathway_prompt(student_profile)) + f"""
+    Return ONLY a JSON object that validates against this JSON schema, emitting the
+    "phases" array first:
+    {json.dumps(LearningPathway.model_json_schema())}
+    """
+    
+    parser = IncrementalJSONParser([(field, "*") for field in STREAMED_ITEMS])
+    streamed = None
+    # The slot is held for the whole stream, which occupies the upstream until it ends
+    try:
+        async with upstream_limiter("gemini").slot():
+            chunks = model.astream(prompt).__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), STREAM_IDLE_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                streamed = chunk if streamed is None else streamed + chunk
+                content = chunk.content if isinstance(chunk.content, str) else "".join(
+                    part if isinstance(part, str) else part.get("text", "") for part in chunk.content
+                )
+                for (field, index), value in parser.feed(content):
+                    item_type, item_model = STREAMED_ITEMS[field]
+                    try:
+                        item = item_model.model_validate(value).model_dump()
+                    except ValueError as e:
+                        print(f"Skipping invalid streamed {item_type} {index}: {e}")
+                        continue
+                    yield {"type": item_type, "index": index, "item": item}
+    except Exception as e:
+        # A stalled or dropped stream falls through to the retried structured call below
+        if not is_retryable(e):
+            raise
+        print(f"Pathway stream failed with {type(e).__name__}, regenerating")
+    
+    if streamed is not None:
+        record_tokens("structured_pathway", streamed)
+    
+    root_start = parser.buffer.find("{")
+    root_end = parser.buffer.rfind("}")
+    try:
+        pathway = LearningPathway.model_validate_json(parser.buffer[root_start:root_end + 1])
+        record_llm_output("structured_pathway", "parsed")
+    except ValueError as e:
+        record_llm_output("structured_pathway", "wasted")
+        # Fall back to the monolithic structured-output call if the stream did not complete or validate
+        print(f"Streamed pathway failed validation, regenerating: {e}")
+        pathway = await invoke_structured(model, LearningPathway, bound.prompt(build_pathway_prompt(student_profile)),
+                                          method=bound.structured_method)
+    yield {"type": "pathway", "pathway": _to_dict(pathway)}
+
+
+@task
+@instrument_stage("structured_pathway")
+async def generate_structured_pathway_incremental(student_profile: dict, context: ContextHandle) -> Dict[str, Any]:
+    """
+    Streaming counterpart of generate_structured_pathway: writes each completed
+    phase, milestone and explanation section to the graph's custom stream as it
+    is generated and returns the full validated pathway.
+    """
+    writer = get_stream_writer()
+    pathway = None
+    async for event in stream_structured_pathway(student_profile, context):
+        if event["type"] == "pathway":
+            pathway = event["pathway"]
+        else:
+            writer({"event": event["type"], "index": event["index"], event["type"]: event["item"]})
+    return pathway
@@ -0,0 +1,76 @@
+"""
+Per-request telemetry for capacity planning.
+
+When TELEMETRY_PATH is set, every generation request appends one JSON line
+with its latency, stage timings, LLM token usage, process CPU time, the
+process memory high-water mark and the number of requests in flight when it
+started. cost-calculator.py turns these records into Cloud Run sizing
+recommendations.
+"""
+import contextvars
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+TELEMETRY_PATH = os.getenv("TELEMETRY_PATH")
+
+_current: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("request_telemetry", default=None)
+_in_flight = 0
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def add_tokens(prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    """Adds LLM token usage to the request being tracked, if any"""
+    record = _current.get()
+    if record is not None:
+        record["prompt_tokens"] += prompt_tokens
+        record["completion_tokens"] += completion_tokens
+
+
+def set_stage_timings(stage_timings: Dict[str, float]) -> None:
+    """Attaches the pipeline's stage timings to the request being tracked, if any"""
+    record = _current.get()
+    if record is not None:
+        record["stage_timings"] = dict(stage_timings)
+
+
+@contextmanager
+def track_request(endpoint: str):
+    """Collects telemetry for one request and appends it to TELEMETRY_PATH"""
+    global _in_flight
+    record = {
+        "timestamp": time.time(),
+        "endpoint": endpoint,
+        "in_flight": _in_flight,
+        "stage_timings": {},
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+    }
+    token = _current.set(record)
+    _in_flight += 1
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+        record["status"] = "ok"
+    except Exception:
+        record["status"] = "error"
+        raise
+    finally:
+        _in_flight -= 1
+        _current.reset(token)
+        record["latency_seconds"] = round(time.perf_counter() - start, 3)
+        # Process-wide CPU time: an upper bound for this request when others overlap it
+        record["cpu_seconds"] = round(time.process_time() - cpu_start, 3)
+        record["max_rss_mb"] = _max_rss_mb()
+        if TELEMETRY_PATH:
+            with open(TELEMETRY_PATH, "a") as f:
+                f.write(json.dumps(record) + "\n")
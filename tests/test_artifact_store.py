@@ -0,0 +1,102 @@
+"""
+Tests for per-stage artifact keys and reuse
+"""
+import asyncio
+import os
+import time
+import sys
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from artifact_store import ArtifactStore, stage_key
+
+
+PROFILE = {
+    "learning_style": "hands-on",
+    "progress": "LangGraph",
+    "hobby": "Cricket",
+    "domain": "Technology",
+    "google_api_key": "key-a",
+}
+
+
+def keys(profile: dict, context_key: str = "context") -> dict:
+    structured = stage_key("structured_pathway", profile, upstream=context_key)
+    return {
+        "retrieval": stage_key("retrieval", profile),
+        "structured_pathway": structured,
+        "enhancement": stage_key("enhancement", profile, upstream=structured),
+    }
+
+
+class TestStageKeys:
+    """Each stage is invalidated only by the fields it reads"""
+
+    def test_hobby_change_invalidates_enhancement_only(self):
+        before, after = keys(PROFILE), keys(dict(PROFILE, hobby="Chess"))
+        assert after["retrieval"] == before["retrieval"]
+        assert after["structured_pathway"] == before["structured_pathway"]
+        assert after["enhancement"] != before["enhancement"]
+
+    def test_learning_style_change_invalidates_every_stage(self):
+        before, after = keys(PROFILE), keys(dict(PROFILE, learning_style="visual"))
+        assert all(after[stage] != before[stage] for stage in before)
+
+    def test_new_context_invalidates_downstream(self):
+        before, after = keys(PROFILE), keys(PROFILE, context_key="other context")
+        assert after["structured_pathway"] != before["structured_pathway"]
+        assert after["enhancement"] != before["enhancement"]
+
+    def test_express_tier_makes_hobby_a_pathway_field(self):
+        express = dict(PROFILE, tier="express")
+        assert keys(dict(express, hobby="Chess"))["structured_pathway"] != keys(express)["structured_pathway"]
+
+    def test_ignores_credentials_and_case(self):
+        assert keys(dict(PROFILE, google_api_key="key-b", progress=" langgraph")) == keys(PROFILE)
+
+
+class TestArtifactStore:
+    """Stored artifacts are returned as copies and counted"""
+
+    def test_reuse(self):
+        store = ArtifactStore(ttl=60)
+        artifact = {"phases": [{"title": "Basics"}]}
+        store.put("structured_pathway", "k", artifact)
+        reused = store.get("structured_pathway", "k", PROFILE)
+        reused["phases"].append({"title": "Mutated"})
+        assert store.get("structured_pathway", "k", PROFILE) == artifact
+        assert store.get("structured_pathway", "other", PROFILE) is None
+        stats = store.stats()
+        assert stats["structured_pathway_reused"] == 2
+        assert stats["structured_pathway_computed"] == 1
+
+    def test_bypass_cache_skips_lookup(self):
+        store = ArtifactStore(ttl=60)
+        store.put("retrieval", "k", {"combined_text": "text"})
+        assert store.get("retrieval", "k", dict(PROFILE, bypass_cache=True)) is None
+        assert store.stats()["bypassed"] == 1
+
+    def test_retrieval_artifacts_expire_with_the_retrieval_cache(self):
+        store = ArtifactStore(ttl=86400, stage_ttls={"retrieval": 3600})
+        for stage in ("retrieval", "structured_pathway"):
+            store.store.memory.set(f"{stage}:k", {"stage": stage}, stored_at=time.time() - 7200)
+        assert store.get("retrieval", "k", PROFILE) is None
+        assert store.get("structured_pathway", "k", PROFILE) == {"stage": "structured_pathway"}
+
+    def test_stage_ttl_never_exceeds_store_ttl(self):
+        assert ArtifactStore(ttl=600, stage_ttls={"retrieval": 3600}).stage_ttls == {"retrieval": 600}
+
+    def test_async_access_uses_the_disk_tier(self, tmp_path):
+        path = str(tmp_path / "artifacts.sqlite")
+
+        async def scenario():
+            await ArtifactStore(ttl=60, path=path).aput("enhancement", "k", [{"title": "Phase 1"}])
+            reader = ArtifactStore(ttl=60, path=path)
+            return reader, await reader.aget("enhancement", "k", PROFILE), \
+                await reader.aget("enhancement", "k", dict(PROFILE, bypass_cache=True))
+
+        reader, sections, bypassed = asyncio.run(scenario())
+        assert sections == [{"title": "Phase 1"}]
+        assert bypassed is None
+        assert reader.stats()["enhancement_reused"] == 1
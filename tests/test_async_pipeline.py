@@ -0,0 +1,317 @@
+"""
+Tests that pathway generation runs off the event loop so health checks stay responsive
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from unittest.mock import patch
+
+import httpx
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent
+import app_cloudrun
+from jobs import JobManager
+from pathway_cache import PathwayCache, profile_key
+
+
+async def _slow_generation(student_profile):
+    """Stand-in for a long pipeline run that awaits its upstream calls"""
+    await asyncio.sleep(1.0)
+    return {"title": "Mock Learning Pathway", "relevant_links": []}
+
+
+class TestEventLoopResponsiveness:
+    """Health checks must not wait for in-flight generations"""
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "mock_key", "TAVILY_API_KEY": "mock_key"})
+    @patch("app_cloudrun.generate_pathway", side_effect=_slow_generation)
+    def test_health_stays_fast_during_generations(self, mock_generate):
+        app_cloudrun.health_check_passed = True
+        # Distinct profiles so request coalescing does not collapse them
+        payloads = [{"learningStyle": "hands-on", "topic": f"LangGraph {i}",
+                     "hobbies": "Cricket", "domain": "Technology"} for i in range(20)]
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                generations = [
+                    asyncio.create_task(client.post("/api/generate-pathway", json=payload))
+                    for payload in payloads
+                ]
+                await asyncio.sleep(0.1)
+
+                health_latencies = []
+                for _ in range(5):
+                    start = time.perf_counter()
+                    response = await client.get("/health")
+                    health_latencies.append(time.perf_counter() - start)
+                    assert response.status_code == 200
+
+                results = await asyncio.gather(*generations)
+                return health_latencies, results
+
+        health_latencies, results = asyncio.run(scenario())
+
+        assert max(health_latencies) < 0.05
+        assert all(r.status_code == 200 for r in results)
+        assert mock_generate.call_count == 20
+
+
+async def _held_events(student_profile):
+    """Pipeline events for a job that stays running until the test ends"""
+    yield {"event": "retrieval", "seconds": 0.1}
+    await asyncio.sleep(10)
+
+
+class TestJobApi:
+    """Job submission, polling and backpressure"""
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "mock_key", "TAVILY_API_KEY": "mock_key"})
+    def test_submit_poll_and_reject(self):
+        manager = JobManager(_held_events, workers=1, max_queue=1)
+        payload = {"learningStyle": "hands-on", "topic": "LangGraph", "hobbies": "Cricket", "domain": "Technology"}
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                created = await client.post("/api/jobs", json=payload)
+                await asyncio.sleep(0.05)
+                status = await client.get(created.json()["status_url"])
+                await client.post("/api/jobs", json=payload)
+                rejected = await client.post("/api/jobs", json=payload)
+                missing = await client.get("/api/jobs/unknown")
+            await manager.stop()
+            return created, status, rejected, missing
+
+        with patch.object(app_cloudrun, "job_manager", manager):
+            created, status, rejected, missing = asyncio.run(scenario())
+
+        assert created.status_code == 202
+        assert status.json()["status"] == "running"
+        assert status.json()["stage_timings"] == {"retrieval": 0.1}
+        assert "mock_key" not in status.text
+        assert rejected.status_code == 429
+        assert int(rejected.headers["Retry-After"]) >= 1
+        assert missing.status_code == 404
+
+
+async def _cohort_events(profiles, concurrency=None):
+    """Stand-in for stream_cohort_events: one shared retrieval, then one result per profile"""
+    yield {"event": "group_retrieval", "indices": list(range(len(profiles))), "seconds": 0.1}
+    for index in reversed(range(len(profiles))):
+        await asyncio.sleep(0.01)
+        if profiles[index]["progress"] == "broken":
+            yield {"event": "error", "index": index, "detail": "upstream down"}
+        else:
+            yield {"event": "result", "index": index, "pathway": {"title": profiles[index]["hobby"]}}
+
+
+class TestBatchApi:
+    """Cohort requests stream one NDJSON line per profile and a summary"""
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "mock_key", "TAVILY_API_KEY": "mock_key"})
+    @patch("app_cloudrun.stream_cohort_events", side_effect=_cohort_events)
+    def test_streams_results_and_summary(self, mock_events):
+        profiles = [{"learningStyle": "visual", "topic": "LangGraph", "hobbies": hobby, "domain": "Technology"}
+                    for hobby in ("Cricket", "Chess", "Music")]
+        profiles.append({"learningStyle": "visual", "topic": "broken", "hobbies": "Art", "domain": "Technology"})
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/api/generate-pathways/batch", json={"profiles": profiles})
+
+        response = asyncio.run(scenario())
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        results = {line["index"]: line for line in lines if line["event"] == "result"}
+        assert {i: r["pathway"]["title"] for i, r in results.items()} == {0: "Cricket", 1: "Chess", 2: "Music"}
+        assert lines[-1] == {"event": "summary", "profiles": 4, "groups": 1,
+                             "succeeded": 3, "failed": 1, "cached": 0}
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "mock_key", "TAVILY_API_KEY": "mock_key"})
+    def test_midstream_failure_counts_unfinished_profiles(self):
+        async def failing_events(profiles, concurrency=None):
+            yield {"event": "result", "index": 1, "pathway": {"title": "Done"}}
+            raise RuntimeError("cohort crashed")
+
+        profiles = [{"learningStyle": "visual", "topic": "LangGraph", "hobbies": hobby, "domain": "Technology"}
+                    for hobby in ("Cricket", "Chess", "Music")]
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/api/generate-pathways/batch", json={"profiles": profiles})
+
+        with patch("app_cloudrun.stream_cohort_events", side_effect=failing_events):
+            response = asyncio.run(scenario())
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert lines[1] == {"event": "error", "indices": [0, 2], "detail": "cohort crashed"}
+        assert lines[-1]["succeeded"] == 1
+        assert lines[-1]["failed"] == 2
+
+    def test_rejects_oversized_batch(self):
+        profile = {"learningStyle": "visual", "topic": "LangGraph", "hobbies": "Chess", "domain": "Technology"}
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/api/generate-pathways/batch",
+                                         json={"profiles": [profile] * (app_cloudrun.BATCH_MAX_PROFILES + 1)})
+
+        assert asyncio.run(scenario()).status_code == 413
+
+
+async def _large_pathway(student_profile):
+    """Stand-in pathway large enough to be worth compressing"""
+    return {"title": student_profile["progress"], "introduction": "Markdown content. " * 200, "relevant_links": []}
+
+
+class TestPathwayResponses:
+    """Pre-serialized, compressed pathway bodies with ETags and conditional GETs"""
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "mock_key", "TAVILY_API_KEY": "mock_key"})
+    def test_compressed_post_and_conditional_get(self):
+        payload = {"learningStyle": "hands-on", "topic": "Compressed Pathways", "hobbies": "Cricket",
+                   "domain": "Technology"}
+        cache = PathwayCache(ttl=60, stale_ttl=60)
+
+        async def generate(student_profile):
+            return await cache.get_or_generate(student_profile, _large_pathway)
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                posted = await client.post("/api/generate-pathway", json=payload,
+                                           headers={"Accept-Encoding": "gzip"})
+                pathway_id = posted.headers["X-Pathway-Id"]
+                fetched = await client.get(f"/api/pathways/{pathway_id}", headers={"Accept-Encoding": "identity"})
+                unchanged = await client.get(f"/api/pathways/{pathway_id}",
+                                             headers={"If-None-Match": posted.headers["ETag"]})
+                missing = await client.get("/api/pathways/unknown")
+                by_profile_key = await client.get(f"/api/pathways/{cache.ids.get(pathway_id)}")
+            return posted, fetched, unchanged, missing, by_profile_key
+
+        with patch("app_cloudrun.pathway_cache", cache), patch("app_cloudrun.generate_pathway", side_effect=generate):
+            posted, fetched, unchanged, missing, by_profile_key = asyncio.run(scenario())
+
+        assert posted.headers["Content-Encoding"] == "gzip"
+        assert posted.headers["ETag"].endswith('-gzip"')
+        assert posted.json()["title"] == "Compressed Pathways"
+        assert fetched.status_code == 200
+        assert "Content-Encoding" not in fetched.headers
+        assert fetched.json() == posted.json()
+        assert unchanged.status_code == 304
+        assert unchanged.content == b""
+        assert missing.status_code == 404
+        # Ids are not the guessable profile hash
+        assert by_profile_key.status_code == 404
+
+
+class TestCoalescingCredentials:
+    """Identical direct requests share a run only when they carry the same API keys"""
+
+    def test_different_keys_run_separately(self):
+        seen_keys = []
+
+        async def generate(student_profile):
+            seen_keys.append(student_profile["google_api_key"])
+            await asyncio.sleep(0.2)
+            if student_profile["google_api_key"] == "bad-key":
+                raise RuntimeError("API key not valid")
+            return {"title": "Coalesced", "relevant_links": []}
+
+        def direct(google_key):
+            return {"learning_style": "hands-on", "progress": "Coalescing Credentials", "hobby": "Chess",
+                    "domain": "Technology", "google_api_key": google_key, "tavily_api_key": "tavily-key"}
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(
+                    *(client.post("/api/generate-pathway-direct", json=direct("good-key")) for _ in range(3)),
+                    client.post("/api/generate-pathway-direct", json=direct("bad-key")),
+                )
+
+        with patch("app_cloudrun.generate_pathway", side_effect=generate):
+            responses = asyncio.run(scenario())
+
+        assert sorted(seen_keys) == ["bad-key", "good-key"]
+        assert [r.status_code for r in responses] == [200, 200, 200, 500]
+
+
+async def _pipeline_events(student_profile):
+    """Stand-in for stream_pathway_events: stage events, then an upstream failure"""
+    yield {"event": "retrieval", "relevant_links": [], "seconds": 0.1}
+    yield {"event": "phase", "index": 0, "phase": {"title": "Basics"}}
+    yield {"event": "structured_pathway", "pathway": {"title": "Partial"}, "seconds": 0.2}
+    raise RuntimeError("Gemini unavailable")
+
+
+class TestStreamApi:
+    """Streamed events keep their order and framing and end with an error event on failure"""
+
+    PAYLOAD = {"learningStyle": "hands-on", "topic": "Streaming", "hobbies": "Cricket", "domain": "Technology"}
+
+    def _post(self, stream_format):
+        async def scenario():
+            transport = httpx.ASGITransport(app=app_cloudrun.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(f"/api/generate-pathway/stream?format={stream_format}", json=self.PAYLOAD)
+
+        with patch("app_cloudrun.stream_pathway_events", side_effect=_pipeline_events):
+            return asyncio.run(scenario())
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "mock_key", "TAVILY_API_KEY": "mock_key"})
+    def test_ndjson_order_and_error(self):
+        response = self._post("ndjson")
+        events = [json.loads(line) for line in response.text.splitlines()]
+
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert [e["event"] for e in events] == ["retrieval", "phase", "structured_pathway", "error"]
+        assert events[-1]["detail"] == "Gemini unavailable"
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "mock_key", "TAVILY_API_KEY": "mock_key"})
+    def test_sse_framing(self):
+        response = self._post("sse")
+        messages = [m for m in response.text.split("\n\n") if m]
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["cache-control"] == "no-cache"
+        for message, name in zip(messages, ["retrieval", "phase", "structured_pathway", "error"]):
+            event_line, data_line = message.split("\n")
+            assert event_line == f"event: {name}"
+            assert json.loads(data_line[len("data: "):])["event"] == name
+        assert len(messages) == 4
+
+
+class TestStreamCache:
+    """Cached pathways stream as one 'complete' event, refreshing stale ones"""
+
+    def test_stale_entry_streams_and_refreshes(self):
+        cache = PathwayCache(ttl=60, stale_ttl=600)
+        profile = {"learning_style": "hands-on", "progress": "Stale Streaming", "hobby": "Chess",
+                   "domain": "Technology"}
+        cache.store.memory.set(profile_key(profile), {"title": "Old"}, stored_at=time.time() - 120)
+
+        async def refresh(student_profile):
+            return {"title": "Refreshed"}
+
+        async def scenario():
+            events = [event async for event in agent.stream_pathway_events(profile)]
+            await asyncio.gather(*cache._background)
+            return events
+
+        with patch.object(agent, "pathway_cache", cache), \
+                patch.object(agent.adaptive_learning_agent, "ainvoke", side_effect=refresh):
+            events = asyncio.run(scenario())
+
+        assert events == [{"event": "complete", "pathway": {"title": "Old"}, "stage_timings": {}, "cached": True}]
+        assert asyncio.run(cache.peek(profile)) == {"title": "Refreshed"}
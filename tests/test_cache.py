@@ -0,0 +1,88 @@
+"""
+Tests for the TTL + LRU caches used by retrieval and pathway caching
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import TTLCache, TieredCache
+
+
+class TestTTLCache:
+    """In-memory tier behaviour"""
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get_entry("a")
+        cache.set("c", 3)
+        assert cache.get_entry("b") is None
+        assert cache.get_entry("a")[0] == 1
+        assert cache.get_entry("c")[0] == 3
+
+    def test_ttl_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1, stored_at=time.time() - 120)
+        assert cache.get_entry("a") is None
+        assert len(cache) == 0
+
+
+class TestTieredCache:
+    """Memory + SQLite tiers and counters"""
+
+    def test_disk_tier_shared_between_instances(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        writer = TieredCache("retrieval", maxsize=4, ttl=60, path=path)
+        reader = TieredCache("retrieval", maxsize=4, ttl=60, path=path)
+
+        writer.set("4:langgraph", [{"page_content": "text", "metadata": {}}])
+
+        assert reader.get("4:langgraph") == [{"page_content": "text", "metadata": {}}]
+        assert reader.get("4:langgraph") is not None
+        stats = reader.stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 1
+
+    def test_async_access_reads_and_writes_disk_in_a_thread(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        writer = TieredCache("retrieval", maxsize=4, ttl=60, path=path)
+        reader = TieredCache("retrieval", maxsize=4, ttl=60, path=path)
+        disk_threads = set()
+        for tier in (writer.disk, reader.disk):
+            for name in ("get_entry", "set"):
+                method = getattr(tier, name)
+
+                def recorded(*args, _method=method, **kwargs):
+                    disk_threads.add(threading.get_ident())
+                    return _method(*args, **kwargs)
+                setattr(tier, name, recorded)
+
+        async def scenario():
+            await writer.aset("4:langgraph", [{"page_content": "text", "metadata": {}}])
+            first = await reader.aget("4:langgraph")
+            second = await reader.aget("4:langgraph")
+            missing = await reader.aget("4:other")
+            return first, second, missing
+
+        first, second, missing = asyncio.run(scenario())
+        assert first == second == [{"page_content": "text", "metadata": {}}]
+        assert missing is None
+        assert reader.stats()["disk_hits"] == 1
+        assert reader.stats()["memory_hits"] == 1
+        assert reader.stats()["misses"] == 1
+        assert disk_threads and threading.get_ident() not in disk_threads
+
+    def test_miss_and_bypass_counters(self):
+        cache = TieredCache("retrieval", maxsize=4, ttl=60)
+        assert cache.get("missing") is None
+        cache.record_bypass()
+        stats = cache.stats()
+        assert stats["misses"] == 1
+        assert stats["bypassed"] == 1
+        assert stats["hit_rate"] == 0.0
@@ -0,0 +1,112 @@
+"""
+Tests for upstream call deadlines, retries and hedging
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from call_policy import CallPolicy, is_retryable
+
+
+def flaky(failures, error=ConnectionError("reset")):
+    """Factory that fails `failures` times before succeeding"""
+    calls = {"n": 0}
+
+    async def call():
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise error
+        return "ok"
+    return call, calls
+
+
+class TestRetries:
+    """Retryable errors are retried within the deadline"""
+
+    def test_retries_then_succeeds(self):
+        policy = CallPolicy("test", timeout=1, deadline=5, retries=2, backoff_base=0.01)
+        call, calls = flaky(2)
+        assert asyncio.run(policy.run(call)) == "ok"
+        assert calls["n"] == 3
+        assert policy.counters["retries"] == 2
+
+    def test_non_retryable_error_is_raised(self):
+        policy = CallPolicy("test", timeout=1, deadline=5, retries=2, backoff_base=0.01)
+        call, calls = flaky(1, ValueError("bad schema"))
+        with pytest.raises(ValueError):
+            asyncio.run(policy.run(call))
+        assert calls["n"] == 1
+
+    def test_attempt_timeout_is_retried(self):
+        policy = CallPolicy("test", timeout=0.05, deadline=2, retries=1, backoff_base=0.01)
+        calls = {"n": 0}
+
+        async def call():
+            calls["n"] += 1
+            if calls["n"] == 1:
+                await asyncio.sleep(1)
+            return "ok"
+
+        assert asyncio.run(policy.run(call)) == "ok"
+        assert calls["n"] == 2
+
+    def test_deadline_bounds_all_attempts(self):
+        policy = CallPolicy("test", timeout=1, deadline=0.1, retries=5, backoff_base=0.01)
+
+        async def call():
+            await asyncio.sleep(1)
+
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(policy.run(call))
+
+    def test_is_retryable(self):
+        assert is_retryable(asyncio.TimeoutError())
+        assert is_retryable(RuntimeError("429 Too Many Requests"))
+        assert not is_retryable(ValueError("validation failed"))
+
+
+class TestHedging:
+    """A duplicate is fired after the observed p95 and the first result wins"""
+
+    def warmed_policy(self):
+        policy = CallPolicy("test", timeout=2, deadline=2, retries=0, hedge=True, min_samples=5)
+        policy._latencies.extend([0.02] * 20)
+        return policy
+
+    def test_slow_primary_loses_to_hedge(self):
+        policy = self.warmed_policy()
+        calls = {"n": 0}
+
+        async def call():
+            calls["n"] += 1
+            await asyncio.sleep(1 if calls["n"] == 1 else 0.01)
+            return calls["n"]
+
+        async def scenario():
+            start = asyncio.get_running_loop().time()
+            result = await policy.run(call)
+            return result, asyncio.get_running_loop().time() - start
+
+        result, elapsed = asyncio.run(scenario())
+        assert result == 2
+        assert elapsed < 0.5
+        assert policy.counters["hedges_fired"] == 1
+        assert policy.counters["hedges_won"] == 1
+
+    def test_fast_primary_fires_no_hedge(self):
+        policy = self.warmed_policy()
+
+        async def call():
+            return "ok"
+
+        assert asyncio.run(policy.run(call)) == "ok"
+        assert policy.counters["hedges_fired"] == 0
+
+    def test_no_hedging_without_samples(self):
+        policy = CallPolicy("test", timeout=1, deadline=1, hedge=True, min_samples=5)
+        assert policy.hedge_delay() is None
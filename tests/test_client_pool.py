@@ -0,0 +1,95 @@
+"""
+Tests for the pooled upstream client registry
+"""
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import client_pool
+from client_pool import ClientRegistry, RestChatGoogleGenerativeAI
+from data_models import PathwayHistory
+from fake_upstreams import UpstreamProfile, create_gemini_app
+
+
+class TestClientRegistry:
+    """Reuse, key separation and LRU eviction"""
+
+    def test_reuses_client_for_same_model_and_key(self):
+        registry = ClientRegistry(maxsize=4)
+        first = registry.get("google", "gemini-2.5-flash", "key-a", object)
+        second = registry.get("google", "gemini-2.5-flash", "key-a", object)
+        assert first is second
+        assert registry.stats()["reuse_rate"] == 0.5
+
+    def test_separates_keys_and_options(self):
+        registry = ClientRegistry(maxsize=4)
+        plain = registry.get("google", "gemini-2.5-flash", "key-a", object)
+        other_key = registry.get("google", "gemini-2.5-flash", "key-b", object)
+        json_mode = registry.get("google", "gemini-2.5-flash", "key-a", object,
+                                 {"response_mime_type": "application/json"})
+        assert len({id(plain), id(other_key), id(json_mode)}) == 3
+
+    def test_evicts_least_recently_used(self):
+        registry = ClientRegistry(maxsize=2)
+        a = registry.get("tavily", "search", "user-a", object)
+        registry.get("tavily", "search", "user-b", object)
+        registry.get("tavily", "search", "user-a", object)
+        registry.get("tavily", "search", "user-c", object)
+        assert registry.get("tavily", "search", "user-a", object) is a
+        assert registry.stats()["evicted"] == 1
+        assert registry.stats()["size"] == 2
+
+
+class TestRestChatModel:
+    """Async calls to a REST endpoint go over the shared HTTP client, not worker threads"""
+
+    def _model(self, monkeypatch, profile=None):
+        app = create_gemini_app(profile, seed=1)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        monkeypatch.setattr(client_pool, "shared_http_client", lambda: client)
+        model = RestChatGoogleGenerativeAI(model="gemini-2.5-flash", api_key="fake-key", transport="rest",
+                                           client_options={"api_endpoint": "http://fake-gemini"})
+        return model, app
+
+    def test_generate_structured_and_stream(self, monkeypatch):
+        model, _ = self._model(monkeypatch)
+
+        async def scenario():
+            text = await model.ainvoke("Write an overview")
+            structured = await model.with_structured_output(PathwayHistory, include_raw=True).ainvoke("History")
+            chunks = [chunk async for chunk in model.astream("Write an overview")]
+            return text, structured, chunks
+
+        text, structured, chunks = asyncio.run(scenario())
+        assert text.content.startswith("## Overview")
+        assert text.usage_metadata["output_tokens"] > 0
+        assert isinstance(structured["parsed"], PathwayHistory)
+        assert len(chunks) == 20
+        streamed = "".join(chunk.content for chunk in chunks)
+        assert streamed.startswith("## Overview")
+        # Cumulative counts are turned back into per-chunk differences
+        assert sum((chunk.usage_metadata or {}).get("output_tokens", 0) for chunk in chunks) == len(streamed) // 4
+
+    def test_concurrency_is_not_capped_by_the_thread_pool(self, monkeypatch):
+        model, app = self._model(monkeypatch, UpstreamProfile(latency="fixed", median_ms=200))
+
+        async def scenario():
+            start = time.perf_counter()
+            await asyncio.gather(*(model.ainvoke("Write an overview") for _ in range(40)))
+            return time.perf_counter() - start
+
+        assert asyncio.run(scenario()) < 1.5
+        assert app.state.behaviour.counters["requests"] == 40
+
+    def test_error_status_is_raised(self, monkeypatch):
+        model, _ = self._model(monkeypatch, UpstreamProfile(error_rate=1.0))
+        with pytest.raises(httpx.HTTPStatusError) as excinfo:
+            asyncio.run(model.ainvoke("Write an overview"))
+        assert excinfo.value.response.status_code == 500
@@ -0,0 +1,91 @@
+"""
+Tests for cohort batching: grouping, shared retrieval and index mapping
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent
+from pathway_cache import PathwayCache
+
+
+def _profile(topic, hobby, domain="Technology"):
+    return {"learning_style": "visual", "progress": topic, "hobby": hobby, "domain": domain}
+
+
+PROFILES = [
+    _profile("LangGraph", "Cricket"),
+    _profile("Transformers", "Chess"),
+    _profile(" langgraph ", "Music"),
+    _profile("broken", "Art"),
+    _profile("LangGraph", "Football", domain="Finance"),
+]
+
+
+class StubStages:
+    """Stands in for group retrieval (failing for the 'broken' topic) and the per-profile LLM stages"""
+
+    def __init__(self):
+        self.retrievals = []
+
+    async def retrieve(self, profiles):
+        self.retrievals.append([profile["hobby"] for profile in profiles])
+        await asyncio.sleep(0.01)
+        if profiles[0]["progress"] == "broken":
+            raise RuntimeError("All retrieval queries failed or timed out")
+        return {"combined_text": f"context for {profiles[0]['progress'].strip().lower()}",
+                "relevant_links": [], "timings": {}}
+
+    async def personalize(self, student_profile, retrieval_result, stage_timings, pipeline_start, writer):
+        await asyncio.sleep(0.01)
+        return {"title": student_profile["hobby"], "context": retrieval_result["combined_text"], "metadata": {}}
+
+
+def _run(profiles, cache):
+    stages = StubStages()
+
+    async def collect():
+        return [event async for event in agent.stream_cohort_events(profiles, concurrency=2)]
+
+    with patch.object(agent, "perform_group_retrieval", side_effect=stages.retrieve), \
+            patch.object(agent, "_personalize", side_effect=stages.personalize), \
+            patch.object(agent, "pathway_cache", cache):
+        return asyncio.run(collect()), stages
+
+
+class TestCohort:
+    """One retrieval per (topic, domain) group, results and errors mapped to caller indices"""
+
+    def test_groups_share_one_retrieval(self):
+        events, stages = _run(PROFILES, PathwayCache(ttl=60, stale_ttl=60))
+
+        assert sorted(stages.retrievals) == [["Art"], ["Chess"], ["Cricket", "Music"], ["Football"]]
+        groups = sorted(event["indices"] for event in events if event["event"] == "group_retrieval")
+        assert groups == [[0, 2], [1], [4]]
+
+    def test_results_and_errors_keep_caller_indices(self):
+        events, _ = _run(PROFILES, PathwayCache(ttl=60, stale_ttl=60))
+
+        results = {event["index"]: event["pathway"] for event in events if event["event"] == "result"}
+        assert {index: pathway["title"] for index, pathway in results.items()} == {
+            0: "Cricket", 1: "Chess", 2: "Music", 4: "Football"}
+        assert results[2]["context"] == "context for langgraph"
+        assert results[0]["metadata"]["cohort"] == {"group_size": 2, "shared_retrieval": True}
+        errors = [event for event in events if event["event"] == "error"]
+        assert [(e["index"], e["detail"]) for e in errors] == [(3, "All retrieval queries failed or timed out")]
+
+    def test_cached_profiles_are_skipped_and_indices_remapped(self):
+        cache = PathwayCache(ttl=60, stale_ttl=60)
+        asyncio.run(cache.put(PROFILES[1], {"title": "Cached"}))
+        events, stages = _run(PROFILES, cache)
+
+        assert events[0] == {"event": "result", "index": 1, "pathway": {"title": "Cached"}, "cached": True}
+        assert ["Chess"] not in stages.retrievals
+        results = {event["index"]: event["pathway"]["title"] for event in events[1:] if event["event"] == "result"}
+        assert results == {0: "Cricket", 2: "Music", 4: "Football"}
+        # Fresh results are cached for the next batch
+        assert asyncio.run(cache.peek(PROFILES[4]))["title"] == "Football"
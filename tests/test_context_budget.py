@@ -0,0 +1,57 @@
+"""
+Tests for deduplication and token-budgeted context assembly
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_budget import assemble_context, estimate_tokens, strip_boilerplate
+
+
+def make_doc(text, url=None, score=None):
+    metadata = {"source": url} if url else {}
+    if score is not None:
+        metadata["score"] = score
+    return SimpleNamespace(page_content=text, metadata=metadata)
+
+
+ARTICLE = ("LangGraph models agent workflows as graphs of nodes and edges. "
+           "Each node is a function that reads and updates shared state. ") * 10
+
+
+class TestContextAssembly:
+    """Dedupe, near-duplicate removal, boilerplate and budget packing"""
+
+    def test_exact_and_url_duplicates_removed(self):
+        docs = [
+            make_doc(ARTICLE, "https://a.example"),
+            make_doc("Different text about retrieval.", "https://a.example"),
+            make_doc(ARTICLE.upper(), "https://b.example"),
+        ]
+        stats = assemble_context(docs)["stats"]
+        assert stats["url_duplicates"] == 1
+        assert stats["content_duplicates"] == 1
+        assert stats["documents_packed"] == 1
+
+    def test_near_duplicates_removed(self):
+        near_copy = ARTICLE + " Published by the LangChain team."
+        docs = [make_doc(ARTICLE, "https://a.example"), make_doc(near_copy, "https://b.example")]
+        stats = assemble_context(docs)["stats"]
+        assert stats["near_duplicates"] == 1
+
+    def test_boilerplate_stripped(self):
+        text = "We use cookies to improve your experience.\nReal content here.\nAll rights reserved 2024"
+        assert strip_boilerplate(text) == "Real content here."
+
+    def test_packs_highest_scoring_passages_within_budget(self):
+        docs = [
+            make_doc("low relevance " * 200, "https://low.example", score=0.1),
+            make_doc("high relevance " * 200, "https://high.example", score=0.9),
+        ]
+        result = assemble_context(docs, token_budget=500)
+        assert result["combined_text"].startswith("high relevance")
+        assert estimate_tokens(result["combined_text"]) <= 500
+        assert result["stats"]["tokens_saved"] > 0
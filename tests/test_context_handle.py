@@ -0,0 +1,155 @@
+"""
+Tests for the shared per-request context handle
+"""
+import asyncio
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import context_handle
+from context_handle import BoundContext, ContextHandle, build_prefix, open_context
+
+
+class TestPrefix:
+    """Every stage sees the same byte-identical prefix"""
+
+    def test_links_are_ordered(self):
+        assert build_prefix("text", ["https://b", "https://a"]) == build_prefix("text", ["https://a", "https://b"])
+
+    def test_key_follows_content(self):
+        assert ContextHandle("text", ["https://a"]).key == ContextHandle("text", ["https://a"]).key
+        assert ContextHandle("text").key != ContextHandle("other text").key
+
+
+class TestBoundContext:
+    """Task prompts carry the prefix only when it is not cached upstream"""
+
+    def test_inline_prefix(self):
+        bound = BoundContext(model=None, prefix="PREFIX\n")
+        assert bound.prompt("task") == "PREFIX\ntask"
+        assert bound.structured_method == "function_calling"
+
+    def test_cached_prefix(self):
+        bound = BoundContext(model=None, prefix="PREFIX\n", cached_content="cachedContents/abc")
+        assert bound.prompt("task") == "task"
+        assert bound.structured_method == "json_mode"
+
+
+class TestContextHandle:
+    """Local binds share one prefix; identical retrievals share one handle"""
+
+    def test_local_bind(self, monkeypatch):
+        monkeypatch.setattr(context_handle, "get_chat_model", lambda api_key, model, **options: (model, options))
+        handle = ContextHandle("retrieved text", backend="local")
+
+        async def bind_twice():
+            return [await handle.bind("key", "gemini-2.5-flash") for _ in range(2)]
+
+        first, second = asyncio.run(bind_twice())
+        assert first.model == ("gemini-2.5-flash", {})
+        assert first.cached_content is None
+        assert first.prefix == second.prefix == handle.prefix
+        assert handle.stats()["binds"] == 2
+        assert handle.stats()["prefix_tokens_sent"] == 2 * handle.tokens
+
+    def test_open_context_dedupes(self):
+        result = {"combined_text": "shared retrieval", "relevant_links": ["https://a"]}
+        assert open_context(result) is open_context(dict(result))
+        assert open_context({**result, "combined_text": "different"}) is not open_context(result)
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self.payload
+
+
+class FakeCacheApi:
+    """Stands in for the Gemini cachedContents endpoint, recording each upload"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.uploads = []
+
+    async def post(self, url, headers=None, json=None):
+        self.uploads.append({"url": url, "api_key": headers["x-goog-api-key"], "body": json})
+        await asyncio.sleep(0.01)
+        if self.fail:
+            return FakeResponse({"error": "quota"}, status_code=429)
+        return FakeResponse({"name": f"cachedContents/{len(self.uploads)}"})
+
+
+class TestProviderCache:
+    """Uploads through cachedContents, shared per (model, API key), inline on failure"""
+
+    def _handle(self, monkeypatch, api):
+        monkeypatch.setattr(context_handle, "shared_http_client", lambda: api)
+        monkeypatch.setattr(context_handle, "get_chat_model", lambda api_key, model, **options: (api_key, options))
+        monkeypatch.setattr(context_handle, "record_upstream_error", lambda *args, **kwargs: None)
+        return ContextHandle("retrieved text", backend="gemini")
+
+    def test_create_cache_request(self, monkeypatch):
+        api = FakeCacheApi()
+        handle = self._handle(monkeypatch, api)
+
+        bound = asyncio.run(handle.bind("key-a", "gemini-2.5-flash"))
+
+        assert bound.cached_content == "cachedContents/1"
+        assert bound.model == ("key-a", {"cached_content": "cachedContents/1"})
+        assert bound.prompt("task") == "task"
+        upload = api.uploads[0]
+        assert upload["url"].endswith("/v1beta/cachedContents")
+        assert upload["api_key"] == "key-a"
+        assert upload["body"]["model"] == "models/gemini-2.5-flash"
+        assert upload["body"]["contents"][0]["parts"][0]["text"] == handle.prefix
+
+    def test_concurrent_binds_share_one_upload(self, monkeypatch):
+        api = FakeCacheApi()
+        handle = self._handle(monkeypatch, api)
+
+        async def scenario():
+            return await asyncio.gather(*(handle.bind("key-a", "gemini-2.5-flash") for _ in range(5)))
+
+        bound = asyncio.run(scenario())
+        assert len(api.uploads) == 1
+        assert {b.cached_content for b in bound} == {"cachedContents/1"}
+        assert handle.stats()["provider_cached_binds"] == 5
+
+    def test_uploads_are_per_api_key(self, monkeypatch):
+        api = FakeCacheApi()
+        handle = self._handle(monkeypatch, api)
+
+        async def scenario():
+            first = await handle.bind("key-a", "gemini-2.5-flash")
+            second = await handle.bind("key-b", "gemini-2.5-flash")
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert [upload["api_key"] for upload in api.uploads] == ["key-a", "key-b"]
+        assert first.cached_content != second.cached_content
+
+    def test_failed_upload_falls_back_inline_and_retries(self, monkeypatch):
+        api = FakeCacheApi(fail=True)
+        handle = self._handle(monkeypatch, api)
+
+        async def scenario():
+            failed = await handle.bind("key-a", "gemini-2.5-flash")
+            api.fail = False
+            retried = await handle.bind("key-a", "gemini-2.5-flash")
+            return failed, retried
+
+        failed, retried = asyncio.run(scenario())
+        assert failed.cached_content is None
+        assert failed.prompt("task") == handle.prefix + "task"
+        assert failed.structured_method == "function_calling"
+        assert retried.cached_content == "cachedContents/2"
+        assert handle.stats()["prefix_tokens_sent"] == handle.tokens
@@ -0,0 +1,113 @@
+"""
+Tests for decomposed structured pathway generation
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from langchain_core.messages import AIMessage
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_handle import BoundContext
+from data_models import (
+    ExplanationSection, Milestone, NextStepItem, NextStepsSection, PathwayHistory, PathwayOutline,
+    PathwayPhase, PathwayStep,
+)
+from structured_agent import _generate_decomposed, build_decomposed_prompts, build_pathway_prompt
+
+PROFILE = {"learning_style": "hands-on", "progress": "LangGraph", "hobby": "Cricket", "domain": "Technology"}
+
+PARTS = {
+    PathwayOutline: PathwayOutline(
+        title="LangGraph for Cricket Fans",
+        introduction="Welcome",
+        phases=[PathwayPhase(title="Basics", description="Graphs", steps=[
+            PathwayStep(title="Nodes", type="concept", content="Nodes are steps"),
+        ])],
+        explanation_and_kickstart_examples=[ExplanationSection(title="State", content="Like a scoreboard")],
+    ),
+    PathwayHistory: PathwayHistory(history_and_milestones=[Milestone(year=2024, description="LangGraph released")]),
+    NextStepsSection: NextStepsSection(title="Keep going", steps=[
+        NextStepItem(title="Build", description="Build an agent"),
+    ]),
+}
+
+
+class StubModel:
+    """Stands in for a chat model: each structured-output call returns the fixed part for its schema"""
+
+    def __init__(self, delay=0.05, fail=None):
+        self.delay = delay
+        self.fail = fail
+        self.prompts = {}
+        self.methods = set()
+
+    def with_structured_output(self, schema, method="function_calling", include_raw=False):
+        self.methods.add(method)
+        model = self
+
+        class Structured:
+            async def ainvoke(self, prompt):
+                model.prompts[schema] = prompt
+                await asyncio.sleep(model.delay)
+                if schema is model.fail:
+                    return {"raw": AIMessage(content="not json"), "parsed": None,
+                            "parsing_error": ValueError("invalid")}
+                return {"raw": AIMessage(content=""), "parsed": PARTS[schema], "parsing_error": None}
+
+        return Structured()
+
+
+class TestGenerateDecomposed:
+    """Concurrent sub-schema calls assembled into one validated LearningPathway"""
+
+    def test_assembles_parts(self):
+        model = StubModel()
+        pathway = asyncio.run(_generate_decomposed(BoundContext(model, "CONTEXT\n"), PROFILE))
+
+        assert pathway["title"] == "LangGraph for Cricket Fans"
+        assert pathway["phases"][0]["steps"][0]["title"] == "Nodes"
+        assert pathway["history_and_milestones"] == [{"year": 2024, "description": "LangGraph released"}]
+        assert pathway["next_steps"]["steps"][0]["title"] == "Build"
+        # Links come from retrieval, not from a model call
+        assert pathway["relevant_links"] == []
+        assert set(model.prompts) == set(PARTS)
+        assert all(prompt.startswith("CONTEXT\n") for prompt in model.prompts.values())
+        assert model.methods == {"function_calling"}
+
+    def test_latency_report(self):
+        pathway = asyncio.run(_generate_decomposed(BoundContext(StubModel(delay=0.1), ""), PROFILE))
+        report = pathway["metadata"]["structured_generation"]
+
+        assert report["mode"] == "decomposed"
+        assert set(report["part_seconds"]) == {"outline", "history", "next_steps"}
+        # The parts run concurrently
+        assert report["wall_seconds"] < report["serial_seconds"]
+
+    def test_cached_context_uses_json_mode(self):
+        model = StubModel(delay=0)
+        asyncio.run(_generate_decomposed(BoundContext(model, "CONTEXT\n", "cachedContents/1"), PROFILE))
+
+        assert model.methods == {"json_mode"}
+        assert not any(prompt.startswith("CONTEXT") for prompt in model.prompts.values())
+
+    def test_invalid_part_fails_the_pathway(self):
+        model = StubModel(delay=0, fail=PathwayHistory)
+        with pytest.raises(ValueError):
+            asyncio.run(_generate_decomposed(BoundContext(model, ""), PROFILE))
+
+
+class TestHobbyInPrompts:
+    """Structured pathway prompts leave the hobby to enhancement, except on tiers without it"""
+
+    def test_enhanced_tiers_omit_hobby(self):
+        prompts = [build_pathway_prompt(PROFILE), *build_decomposed_prompts(PROFILE).values()]
+        assert not any("Cricket" in prompt or "hobbies" in prompt.lower() for prompt in prompts)
+
+    def test_express_tier_uses_hobby(self):
+        express = dict(PROFILE, tier="express")
+        assert "Hobbies: Cricket" in build_pathway_prompt(express)
+        assert all("Hobbies: Cricket" in prompt for prompt in build_decomposed_prompts(express).values())
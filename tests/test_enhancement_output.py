@@ -0,0 +1,164 @@
+"""
+Tests for schema-enforced enhancement output and its repair
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from langchain_core.messages import AIMessage
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import explanation
+from context_handle import BoundContext
+from data_models import EnhancedExplanations, ExplanationSection
+from explanation import invoke_sections, repair_sections
+
+SECTIONS = [{"title": f"Concept {i}", "content": f"Explanation {i}"} for i in range(3)]
+
+
+class StructuredModel:
+    """Stands in for a chat model whose structured-output call returns a fixed include_raw result"""
+
+    def __init__(self, raw_text, parsed=None):
+        self.result = {
+            "raw": AIMessage(content=raw_text),
+            "parsed": parsed,
+            "parsing_error": None if parsed is not None else ValueError("invalid"),
+        }
+
+    def with_structured_output(self, schema, include_raw=False, method=None):
+        return self
+
+    async def ainvoke(self, prompt):
+        return self.result
+
+
+class TestRepairSections:
+    """Sections are recovered from fenced, wrapped and truncated output"""
+
+    def test_fenced_array(self):
+        assert repair_sections("```json\n" + json.dumps(SECTIONS) + "\n```") == SECTIONS
+
+    def test_wrapper_object(self):
+        text = json.dumps({"explanation_and_kickstart_examples": SECTIONS})
+        assert repair_sections(text) == SECTIONS
+
+    def test_truncated_array_keeps_complete_sections(self):
+        text = json.dumps(SECTIONS)
+        assert repair_sections(text[:text.index('{"title": "Concept 2"') + 20]) == SECTIONS[:2]
+
+    def test_invalid_sections_are_dropped(self):
+        text = json.dumps(SECTIONS + [{"title": "No content"}])
+        assert repair_sections(text) == SECTIONS
+
+
+class TestInvokeSections:
+    """Parsed, repaired and wasted calls"""
+
+    def test_parsed(self):
+        parsed = EnhancedExplanations(explanation_and_kickstart_examples=SECTIONS)
+        model = StructuredModel("", parsed)
+        assert asyncio.run(invoke_sections(model, EnhancedExplanations, "prompt")) == SECTIONS
+
+    def test_single_section_schema(self):
+        model = StructuredModel("", ExplanationSection(**SECTIONS[0]))
+        assert asyncio.run(invoke_sections(model, ExplanationSection, "prompt")) == SECTIONS[:1]
+
+    def test_repaired_from_raw_text(self):
+        model = StructuredModel("```json\n" + json.dumps(SECTIONS) + "\n```")
+        assert asyncio.run(invoke_sections(model, EnhancedExplanations, "prompt")) == SECTIONS
+
+    def test_wasted_raises(self):
+        model = StructuredModel("I could not write these sections.")
+        with pytest.raises(ValueError):
+            asyncio.run(invoke_sections(model, EnhancedExplanations, "prompt"))
+
+
+PATHWAY = {
+    "title": "LangGraph",
+    "phases": [
+        {"title": f"Phase {i}", "description": f"Overview {i}",
+         "steps": [{"title": "Nodes", "type": "concept", "content": "Nodes are steps"}] if i == 2 else []}
+        for i in range(1, 6)
+    ],
+    "explanation_and_kickstart_examples": SECTIONS[:2],
+}
+
+
+class PhaseModel:
+    """Writes one section per phase prompt, finishing later phases first; fails the phases in `failing`"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.in_flight = 0
+        self.peak = 0
+        self.schemas = []
+
+    def with_structured_output(self, schema, include_raw=False, method=None):
+        self.schemas.append(schema)
+        return self
+
+    async def ainvoke(self, prompt):
+        if "**Phase " not in prompt:
+            parsed = EnhancedExplanations(explanation_and_kickstart_examples=SECTIONS)
+            return {"raw": AIMessage(content=""), "parsed": parsed, "parsing_error": None}
+        number = int(prompt.split("**Phase ")[1].split(" of ")[0])
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.05 / number)
+            if number in self.failing:
+                return {"raw": AIMessage(content="no"), "parsed": None, "parsing_error": ValueError("invalid")}
+            parsed = ExplanationSection(title=f"Concept {number}", content=f"Enhanced {number}")
+            return {"raw": AIMessage(content=""), "parsed": parsed, "parsing_error": None}
+        finally:
+            self.in_flight -= 1
+
+
+class FakeContext:
+    """Stands in for a ContextHandle whose binds share one model and an inline prefix"""
+
+    def __init__(self, model):
+        self.model = model
+
+    async def bind(self, api_key, model, **options):
+        return BoundContext(self.model, "CONTEXT\n")
+
+
+class TestEnhancementModes:
+    """Per-phase fan-out, fallbacks and the single-call mode"""
+
+    def test_per_phase_keeps_phase_order_under_the_limit(self, monkeypatch):
+        monkeypatch.setattr(explanation, "ENHANCEMENT_MODE", "per_phase")
+        monkeypatch.setattr(explanation, "ENHANCEMENT_CONCURRENCY", 2)
+        model = PhaseModel()
+        enhanced = asyncio.run(explanation._enhance(PATHWAY, {}, FakeContext(model)))
+
+        titles = [section["title"] for section in enhanced["explanation_and_kickstart_examples"]]
+        assert titles == [f"Concept {i}" for i in range(1, 6)]
+        assert model.peak == 2
+        assert set(model.schemas) == {ExplanationSection}
+        assert enhanced["metadata"]["enhancement_fallbacks"] == 0
+
+    def test_failed_phase_keeps_original_content(self, monkeypatch):
+        monkeypatch.setattr(explanation, "ENHANCEMENT_MODE", "per_phase")
+        enhanced = asyncio.run(explanation._enhance(PATHWAY, {}, FakeContext(PhaseModel(failing={2, 4}))))
+
+        sections = enhanced["explanation_and_kickstart_examples"]
+        # The phase's own content, not the unrelated concept section at the same index
+        assert sections[1] == {"title": "Phase 2", "content": "Overview 2\n\n- **Nodes**: Nodes are steps"}
+        assert sections[3] == {"title": "Phase 4", "content": "Overview 4"}
+        assert sections[0]["title"] == "Concept 1"
+        assert enhanced["metadata"]["enhancement_fallbacks"] == 2
+
+    def test_single_mode_writes_concept_sections(self, monkeypatch):
+        monkeypatch.setattr(explanation, "ENHANCEMENT_MODE", "single")
+        model = PhaseModel()
+        enhanced = asyncio.run(explanation._enhance(PATHWAY, {}, FakeContext(model)))
+
+        assert enhanced["explanation_and_kickstart_examples"] == SECTIONS
+        assert model.schemas == [EnhancedExplanations]
@@ -0,0 +1,63 @@
+"""
+Tests for the local Gemini and Tavily stand-in servers
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_models import LearningPathway
+from fake_upstreams import UpstreamProfile, create_gemini_app, create_tavily_app
+
+
+def post(app, path, payload):
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://fake") as client:
+            return await client.post(path, json=payload)
+    return asyncio.run(request())
+
+
+class TestFakeGemini:
+    """Schema-valid structured output and failure injection"""
+
+    def test_function_call_returns_valid_learning_pathway(self):
+        app = create_gemini_app(UpstreamProfile(latency="fixed", median_ms=0), seed=1)
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": "Create a pathway"}]}],
+            "tools": [{"functionDeclarations": [{"name": "LearningPathway"}]}],
+        }
+        response = post(app, "/v1beta/models/gemini-2.5-flash:generateContent", body)
+
+        assert response.status_code == 200
+        call = response.json()["candidates"][0]["content"]["parts"][0]["functionCall"]
+        pathway = LearningPathway.model_validate(call["args"])
+        assert len(pathway.phases) == 7
+        assert response.json()["usageMetadata"]["totalTokenCount"] > 0
+
+    def test_error_rate_and_429_bursts(self):
+        failing = create_gemini_app(UpstreamProfile(latency="fixed", median_ms=0, error_rate=1.0))
+        throttled = create_gemini_app(UpstreamProfile(latency="fixed", median_ms=0,
+                                                      burst_every_s=60, burst_duration_s=60))
+        body = {"contents": [{"parts": [{"text": "hi"}]}]}
+
+        assert post(failing, "/v1beta/models/gemini-2.5-flash:generateContent", body).status_code == 500
+        response = post(throttled, "/v1beta/models/gemini-2.5-flash:generateContent", body)
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+
+
+class TestFakeTavily:
+    """Search results shaped like the Tavily API"""
+
+    def test_search_returns_max_results(self):
+        app = create_tavily_app(UpstreamProfile(latency="fixed", median_ms=0), seed=1)
+        response = post(app, "/search", {"query": "LangGraph", "max_results": 10})
+
+        results = response.json()["results"]
+        assert len(results) == 10
+        assert all(r["url"].startswith("https://example.com/langgraph/") for r in results)
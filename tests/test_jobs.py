@@ -0,0 +1,156 @@
+"""
+Tests for the asynchronous job queue and its stores
+"""
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import InMemoryJobStore, JobManager, JobQueueFull, SQLiteJobStore
+
+PROFILE = {"progress": "Graph algorithms", "google_api_key": "g", "tavily_api_key": "t"}
+
+
+def make_runner(release=None, fail=False):
+    async def runner(student_profile):
+        yield {"event": "retrieval", "seconds": 0.1}
+        yield {"event": "phase", "index": 0, "item": {}}
+        if release is not None:
+            await release.wait()
+        if fail:
+            raise RuntimeError("upstream down")
+        yield {"event": "structured_pathway", "seconds": 0.2}
+        yield {"event": "enhanced_explanations", "seconds": 0.3}
+        yield {"event": "complete", "pathway": {"title": student_profile["progress"]},
+               "stage_timings": {"retrieval": 0.1, "total": 0.6}}
+    return runner
+
+
+async def wait_for_status(manager, job_id, status):
+    for _ in range(100):
+        if manager.get(job_id)["status"] == status:
+            return manager.get(job_id)
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job never reached {status}")
+
+
+class TestJobManager:
+    """Jobs run in the background and report progress"""
+
+    def test_job_succeeds_with_result(self):
+        async def scenario():
+            manager = JobManager(make_runner(), workers=2, max_queue=4)
+            job = manager.submit(PROFILE)
+            done = await wait_for_status(manager, job["id"], "succeeded")
+            await manager.stop()
+            return done
+
+        job = asyncio.run(scenario())
+        assert job["result"] == {"title": "Graph algorithms"}
+        assert job["stage_timings"]["total"] == 0.6
+        assert job["items_generated"] == 1
+
+    def test_progress_while_running(self):
+        async def scenario():
+            release = asyncio.Event()
+            manager = JobManager(make_runner(release), workers=1, max_queue=4)
+            job = manager.submit(PROFILE)
+            running = await wait_for_status(manager, job["id"], "running")
+            await asyncio.sleep(0.01)
+            running = manager.get(job["id"])
+            release.set()
+            await wait_for_status(manager, job["id"], "succeeded")
+            await manager.stop()
+            return running
+
+        running = asyncio.run(scenario())
+        assert running["stage_timings"] == {"retrieval": 0.1}
+        assert running["current_stage"] == "structured_pathway"
+
+    def test_failure_is_recorded(self):
+        async def scenario():
+            manager = JobManager(make_runner(fail=True), workers=1, max_queue=4)
+            job = manager.submit(PROFILE)
+            failed = await wait_for_status(manager, job["id"], "failed")
+            await manager.stop()
+            return failed, manager.stats()
+
+        failed, stats = asyncio.run(scenario())
+        assert "upstream down" in failed["error"]
+        assert stats["failed"] == 1
+
+    def test_full_queue_rejects_with_retry_after(self):
+        async def scenario():
+            release = asyncio.Event()
+            manager = JobManager(make_runner(release), workers=1, max_queue=2)
+            first = manager.submit(PROFILE)
+            await wait_for_status(manager, first["id"], "running")
+            manager.submit(PROFILE)
+            manager.submit(PROFILE)
+            with pytest.raises(JobQueueFull) as excinfo:
+                manager.submit(PROFILE)
+            release.set()
+            await manager.stop()
+            return excinfo.value, manager.stats()
+
+        error, stats = asyncio.run(scenario())
+        assert error.retry_after >= 1
+        assert stats["rejected"] == 1
+        assert stats["submitted"] == 3
+
+    def test_cancelled_job_is_marked_failed(self):
+        async def scenario():
+            manager = JobManager(make_runner(asyncio.Event()), workers=1, max_queue=4)
+            job = manager.submit(PROFILE)
+            await wait_for_status(manager, job["id"], "running")
+            await manager.stop()
+            return manager.get(job["id"]), manager.stats()
+
+        job, stats = asyncio.run(scenario())
+        assert job["status"] == "failed"
+        assert "cancelled" in job["error"]
+        assert job["finished_at"] is not None
+        assert stats["failed"] == 1
+
+    def test_sqlite_writes_run_off_the_event_loop(self, tmp_path):
+        class RecordingStore(SQLiteJobStore):
+            def update(self, job_id, **fields):
+                writers.add(threading.get_ident())
+                super().update(job_id, **fields)
+
+        writers = set()
+
+        async def scenario():
+            manager = JobManager(make_runner(), RecordingStore(str(tmp_path / "jobs.db")), workers=1, max_queue=4)
+            job = manager.submit(PROFILE)
+            done = await wait_for_status(manager, job["id"], "succeeded")
+            await manager.stop()
+            return done
+
+        job = asyncio.run(scenario())
+        assert job["result"] == {"title": "Graph algorithms"}
+        assert writers and threading.get_ident() not in writers
+
+
+class TestJobStores:
+    """Both stores keep the same records"""
+
+    @pytest.mark.parametrize("kind", ["memory", "sqlite"])
+    def test_create_update_prune(self, kind, tmp_path):
+        store = InMemoryJobStore(ttl=60) if kind == "memory" else SQLiteJobStore(str(tmp_path / "jobs.db"), ttl=60)
+        store.create({"id": "a", "status": "queued", "finished_at": None})
+        store.update("a", status="succeeded", result={"title": "t"}, finished_at=0)
+        assert store.get("a")["result"] == {"title": "t"}
+        store.prune()
+        assert store.get("a") is None
+        assert store.get("missing") is None
+
+    def test_sqlite_store_is_shared(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        SQLiteJobStore(path).create({"id": "a", "status": "queued", "finished_at": None})
+        assert SQLiteJobStore(path).get("a")["status"] == "queued"
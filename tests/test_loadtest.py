@@ -0,0 +1,58 @@
+"""
+Tests for the load test's percentiles and baseline regression gate
+"""
+import importlib.util
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("loadtest", os.path.join(ROOT, "benchmarks", "loadtest.py"))
+loadtest = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(loadtest)
+
+BASELINE = {"throughput_rps": 10.0, "latency_p50": 1.0, "latency_p95": 2.0, "latency_p99": 3.0, "error_rate": 0.0}
+
+
+class TestPercentile:
+    """Nearest-rank percentiles"""
+
+    def test_nearest_rank(self):
+        values = [float(i) for i in range(1, 101)]
+        assert loadtest.percentile(values, 50) == 50.0
+        assert loadtest.percentile(values, 95) == 95.0
+        assert loadtest.percentile(values, 100) == 100.0
+
+    def test_small_and_empty_samples(self):
+        assert loadtest.percentile([3.0, 1.0, 2.0], 99) == 3.0
+        assert loadtest.percentile([5.0], 1) == 5.0
+        assert loadtest.percentile([], 50) is None
+
+
+class TestBaselineGate:
+    """Relative gates for throughput and latency, an absolute one for error rate"""
+
+    def test_within_tolerance(self):
+        report = dict(BASELINE, throughput_rps=9.5, latency_p95=2.1, error_rate=0.005)
+        assert loadtest.diff_against_baseline(report, BASELINE, 0.10, 0.01) == []
+
+    def test_relative_regressions(self):
+        report = dict(BASELINE, throughput_rps=8.0, latency_p99=3.5)
+        assert loadtest.diff_against_baseline(report, BASELINE, 0.10, 0.01) == ["throughput_rps", "latency_p99"]
+
+    def test_error_rate_from_zero_is_gated_in_points(self, capsys):
+        report = dict(BASELINE, error_rate=0.099)
+        assert loadtest.diff_against_baseline(report, BASELINE, 0.10, 0.01) == ["error_rate"]
+        output = capsys.readouterr().out
+        assert "+9.90 pp" in output
+        assert "inf" not in output
+
+    def test_zero_baseline_latency_is_not_gated(self, capsys):
+        report = dict(BASELINE, latency_p50=0.5)
+        assert loadtest.diff_against_baseline(report, dict(BASELINE, latency_p50=0.0), 0.10, 0.01) == []
+        assert "inf" not in capsys.readouterr().out
+
+    def test_missing_metrics_are_skipped(self):
+        assert loadtest.diff_against_baseline({"throughput_rps": 1.0}, {}, 0.10, 0.01) == []
@@ -0,0 +1,86 @@
+"""
+Tests for the Prometheus instrumentation helpers
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from prometheus_client import REGISTRY
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import instrument_stage, record_tokens, register_stats, render_metrics, track_stage
+
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestStageInstrumentation:
+    """Latency, in-flight and error accounting"""
+
+    def test_successful_stage_observed(self):
+        before = sample("pathway_stage_duration_seconds_count", {"stage": "retrieval"})
+        with track_stage("retrieval"):
+            assert sample("pathway_stage_in_flight", {"stage": "retrieval"}) == 1
+        assert sample("pathway_stage_duration_seconds_count", {"stage": "retrieval"}) == before + 1
+        assert sample("pathway_stage_in_flight", {"stage": "retrieval"}) == 0
+
+    def test_failed_stage_counts_upstream_error(self):
+        labels = {"provider": "gemini", "stage": "enhancement", "error": "TimeoutError"}
+        before = sample("pathway_upstream_errors_total", labels)
+        with pytest.raises(TimeoutError):
+            with track_stage("enhancement"):
+                raise TimeoutError()
+        assert sample("pathway_upstream_errors_total", labels) == before + 1
+
+    def test_local_error_not_counted(self):
+        labels = {"provider": "gemini", "stage": "structured_pathway", "error": "KeyError"}
+        before = sample("pathway_upstream_errors_total", labels)
+        with pytest.raises(KeyError):
+            with track_stage("structured_pathway"):
+                raise KeyError("phases")
+        assert sample("pathway_upstream_errors_total", labels) == before
+
+    def test_http_error_counted(self):
+        class ServerError(Exception):
+            status_code = 503
+
+        labels = {"provider": "tavily", "stage": "retrieval", "error": "ServerError"}
+        before = sample("pathway_upstream_errors_total", labels)
+        with pytest.raises(ServerError):
+            with track_stage("retrieval"):
+                raise ServerError()
+        assert sample("pathway_upstream_errors_total", labels) == before + 1
+
+    def test_nested_stages_count_once(self):
+        @instrument_stage("enhancement")
+        async def enhance():
+            raise TimeoutError()
+
+        @instrument_stage("pipeline")
+        async def pipeline():
+            return await enhance()
+
+        stage_labels = {"provider": "gemini", "stage": "enhancement", "error": "TimeoutError"}
+        pipeline_labels = {"provider": "all", "stage": "pipeline", "error": "TimeoutError"}
+        before = sample("pathway_upstream_errors_total", stage_labels)
+        before_pipeline = sample("pathway_upstream_errors_total", pipeline_labels)
+        with pytest.raises(TimeoutError):
+            asyncio.run(pipeline())
+        assert sample("pathway_upstream_errors_total", stage_labels) == before + 1
+        assert sample("pathway_upstream_errors_total", pipeline_labels) == before_pipeline
+
+    def test_token_usage_recorded(self):
+        message = type("Message", (), {"usage_metadata": {"input_tokens": 120, "output_tokens": 30}})()
+        before = sample("pathway_llm_tokens_total", {"stage": "structured_pathway", "kind": "prompt"})
+        record_tokens("structured_pathway", message)
+        assert sample("pathway_llm_tokens_total", {"stage": "structured_pathway", "kind": "prompt"}) == before + 120
+
+    def test_registered_stats_exported(self):
+        register_stats("test_cache", lambda: {"memory_hits": 3, "disk_enabled": False})
+        body, _ = render_metrics()
+        assert b"pathway_test_cache_memory_hits 3.0" in body
+        assert b"disk_enabled" not in body
@@ -0,0 +1,56 @@
+"""
+Tests for per-stage model routing and latency/quality tiers
+"""
+import os
+import sys
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_routing import model_for, pathway_uses_hobby, resolve_tier, routing_metadata, runs_stage
+
+
+class TestTiers:
+    """Tier resolution and the stages each tier runs"""
+
+    def test_default_and_unknown_tiers(self):
+        assert resolve_tier({}) == "standard"
+        assert resolve_tier({"tier": "EXPRESS"}) == "express"
+        assert resolve_tier({"tier": "turbo"}) == "standard"
+
+    def test_express_skips_enhancement(self):
+        assert runs_stage("structured_pathway", {"tier": "express"})
+        assert not runs_stage("enhancement", {"tier": "express"})
+        assert runs_stage("enhancement", {"tier": "standard"})
+
+
+class TestModelRouting:
+    """Per-stage models with environment overrides"""
+
+    def test_defaults(self):
+        assert model_for("structured_pathway", {}) == "gemini-2.5-flash"
+        assert model_for("structured_pathway", {"tier": "express"}) == "gemini-2.5-flash-lite"
+        assert model_for("structured_pathway", {"tier": "quality"}) == "gemini-2.5-pro"
+
+    @patch.dict(os.environ, {"STANDARD_ENHANCEMENT_MODEL": "gemini-2.5-flash-lite"})
+    def test_env_override(self):
+        assert model_for("enhancement", {"tier": "standard"}) == "gemini-2.5-flash-lite"
+        assert model_for("structured_pathway", {"tier": "standard"}) == "gemini-2.5-flash"
+
+    def test_metadata_records_tier_models_and_latency(self):
+        metadata = routing_metadata({"tier": "express"}, 4.2)
+        assert metadata == {
+            "tier": "express",
+            "models": {"structured_pathway": "gemini-2.5-flash-lite"},
+            "seconds": 4.2,
+        }
+
+
+class TestPathwayUsesHobby:
+    """Hobby personalization belongs to enhancement unless the tier skips it"""
+
+    def test_tiers(self):
+        assert not pathway_uses_hobby({"tier": "standard"})
+        assert not pathway_uses_hobby({"tier": "quality"})
+        assert pathway_uses_hobby({"tier": "express"})
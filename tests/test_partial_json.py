@@ -0,0 +1,75 @@
+"""
+Tests for incremental parsing of streamed pathway JSON
+"""
+import json
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from partial_json import IncrementalJSONParser, extract_json, salvage_items, strip_code_fences
+
+
+PATHWAY = {
+    "title": "Learning \"LangGraph\" {fast}",
+    "phases": [
+        {"title": "Phase 1", "description": "d", "steps": [
+            {"title": "s", "type": "concept", "content": "commas, brackets ]} and \\\\ escapes"}]},
+        {"title": "Phase 2", "description": "d", "steps": []},
+    ],
+    "history_and_milestones": [{"year": 2023, "description": "LangGraph released"}],
+}
+
+
+class TestIncrementalJSONParser:
+    """Completed elements are emitted as soon as they close"""
+
+    def test_yields_each_watched_element_once(self):
+        text = "```json\n" + json.dumps(PATHWAY, indent=2) + "\n```"
+        parser = IncrementalJSONParser([("phases", "*"), ("history_and_milestones", "*")])
+
+        completed = []
+        for i in range(0, len(text), 5):
+            completed.extend(parser.feed(text[i:i + 5]))
+
+        assert [path for path, _ in completed] == [
+            ("phases", 0), ("phases", 1), ("history_and_milestones", 0)]
+        assert completed[0][1] == PATHWAY["phases"][0]
+
+    def test_element_emitted_before_stream_ends(self):
+        text = json.dumps(PATHWAY)
+        cut = text.index('{"title": "Phase 2"')
+        parser = IncrementalJSONParser([("phases", "*")])
+
+        first = parser.feed(text[:cut])
+
+        assert [path for path, _ in first] == [("phases", 0)]
+        assert [path for path, _ in parser.feed(text[cut:])] == [("phases", 1)]
+
+
+class TestRepair:
+    """Complete responses wrapped in fences or cut off mid-value"""
+
+    def test_strip_code_fences(self):
+        assert strip_code_fences('```json\n[1, 2]\n```') == "[1, 2]"
+        assert strip_code_fences("[1, 2]") == "[1, 2]"
+
+    def test_extract_json_ignores_fences_and_prose(self):
+        text = "Here are the sections:\n```json\n" + json.dumps(PATHWAY) + "\n```\nEnjoy!"
+        assert extract_json(text) == PATHWAY
+
+    def test_extract_json_rejects_text_without_json(self):
+        with pytest.raises(ValueError):
+            extract_json("Sorry, I cannot help with that.")
+
+    def test_salvage_items_from_truncated_array(self):
+        sections = [{"title": f"S{i}", "content": "c"} for i in range(3)]
+        text = "```json\n" + json.dumps(sections)
+        truncated = text[:text.index('{"title": "S2"') + 12]
+
+        with pytest.raises(ValueError):
+            extract_json(truncated)
+        assert salvage_items(truncated, [("*",)]) == sections[:2]
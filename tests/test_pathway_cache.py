@@ -0,0 +1,206 @@
+"""
+Tests for the content-addressed pathway cache
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pathway_cache import PathwayCache, cohort_key, profile_key
+
+
+PROFILE = {
+    "learning_style": "hands-on",
+    "progress": "LangGraph",
+    "hobby": "Cricket",
+    "domain": "Technology",
+    "google_api_key": "key-a",
+    "tavily_api_key": "key-a",
+}
+
+
+class TestProfileKey:
+    """Canonical profile hashing"""
+
+    def test_ignores_credentials_case_and_whitespace(self):
+        other = dict(PROFILE, google_api_key="key-b", tavily_api_key="key-b",
+                     progress="  langgraph ", bypass_cache=True)
+        assert profile_key(other) == profile_key(PROFILE)
+
+    def test_content_fields_change_key(self):
+        assert profile_key(dict(PROFILE, hobby="Chess")) != profile_key(PROFILE)
+
+    def test_cohort_key_groups_by_topic_and_domain(self):
+        classmate = dict(PROFILE, hobby="Chess", learning_style="visual", progress="LANGGRAPH ")
+        assert cohort_key(classmate) == cohort_key(PROFILE) == ("langgraph", "technology")
+        assert cohort_key(dict(PROFILE, domain="Finance")) != cohort_key(PROFILE)
+
+
+class TestStaleWhileRevalidate:
+    """Fresh hits, stale hits and background refreshes"""
+
+    def test_hit_skips_generation(self):
+        cache = PathwayCache(ttl=60, stale_ttl=60)
+        calls = []
+
+        async def generate(profile):
+            calls.append(profile)
+            return {"title": f"Pathway {len(calls)}"}
+
+        async def scenario():
+            first = await cache.get_or_generate(PROFILE, generate)
+            second = await cache.get_or_generate(PROFILE, generate)
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert first == second == {"title": "Pathway 1"}
+        assert len(calls) == 1
+
+    def test_stale_entry_served_and_refreshed(self):
+        cache = PathwayCache(ttl=60, stale_ttl=600)
+        key = profile_key(PROFILE)
+
+        async def generate(profile):
+            return {"title": "Refreshed"}
+
+        async def scenario():
+            cache.store.set(key, {"title": "Old"})
+            cache.store.memory.set(key, {"title": "Old"}, stored_at=time.time() - 120)
+            served = await cache.get_or_generate(PROFILE, generate)
+            await asyncio.gather(*cache._background)
+            return served, await cache.get_or_generate(PROFILE, generate)
+
+        served, refreshed = asyncio.run(scenario())
+        assert served == {"title": "Old"}
+        assert refreshed == {"title": "Refreshed"}
+        assert cache.counters["stale_served"] == 1
+        assert cache.counters["refreshes"] == 1
+
+
+class TestEncodedBodies:
+    """Stored pathways are serialized once and re-encoded only when they change"""
+
+    def test_encoded_until_entry_changes(self):
+        cache = PathwayCache(ttl=60, stale_ttl=60)
+        key = profile_key(PROFILE)
+        cache.store.set(key, {"title": "First"})
+
+        async def scenario():
+            first = await cache.encoded(key)
+            assert await cache.encoded(key) is first
+            cache.store.memory.set(key, {"title": "Second"}, stored_at=time.time() + 1)
+            return first, await cache.encoded(key), await cache.encoded("unknown")
+
+        first, second, unknown = asyncio.run(scenario())
+        assert json.loads(second.identity) == {"title": "Second"}
+        assert second.digest != first.digest
+        assert cache.counters["encodes"] == 2
+        assert cache.counters["encoded_hits"] == 1
+        assert unknown is None
+
+    def test_opaque_ids(self):
+        cache = PathwayCache(ttl=60, stale_ttl=60, id_secret="secret")
+        key = profile_key(PROFILE)
+
+        async def scenario():
+            await cache.put(PROFILE, {"title": "First"})
+            pathway_id = await cache.pathway_id(key)
+            assert pathway_id != key and key not in pathway_id
+            assert pathway_id == await cache.pathway_id(key)
+            assert await PathwayCache(id_secret="other").pathway_id(key) != pathway_id
+            assert json.loads((await cache.encoded_by_id(pathway_id)).identity) == {"title": "First"}
+            assert await cache.encoded_by_id(key) is None
+            assert await cache.encoded_by_id("unknown") is None
+
+        asyncio.run(scenario())
+
+    def test_sqlite_tier_shared_across_instances(self, tmp_path):
+        path = str(tmp_path / "pathways.sqlite")
+        key = profile_key(PROFILE)
+
+        async def scenario():
+            writer = PathwayCache(ttl=60, stale_ttl=60, path=path, id_secret="secret")
+            await writer.put(PROFILE, {"title": "On disk"})
+            pathway_id = await writer.pathway_id(key)
+            reader = PathwayCache(ttl=60, stale_ttl=60, path=path, id_secret="secret")
+            return await reader.peek(PROFILE), await reader.encoded_by_id(pathway_id)
+
+        pathway, body = asyncio.run(scenario())
+        assert pathway == {"title": "On disk"}
+        assert json.loads(body.identity) == {"title": "On disk"}
+
+
+class TestPeek:
+    """Peeks serve stale entries and refresh them when given a generator"""
+
+    def test_stale_peek_schedules_refresh(self):
+        cache = PathwayCache(ttl=60, stale_ttl=600)
+        key = profile_key(PROFILE)
+        refreshed_with = []
+
+        async def generate(profile):
+            refreshed_with.append(profile)
+            return {"title": "Refreshed"}
+
+        async def scenario():
+            cache.store.memory.set(key, {"title": "Old"}, stored_at=time.time() - 120)
+            served = await cache.peek(PROFILE, generate)
+            await asyncio.gather(*cache._background)
+            return served, await cache.peek(PROFILE, generate)
+
+        served, refreshed = asyncio.run(scenario())
+        assert served == {"title": "Old"}
+        assert refreshed == {"title": "Refreshed"}
+        assert refreshed_with[0]["bypass_cache"] is True
+        assert cache.counters["refreshes"] == 1
+
+    def test_fresh_or_plain_peek_does_not_refresh(self):
+        cache = PathwayCache(ttl=60, stale_ttl=600)
+        key = profile_key(PROFILE)
+        cache.store.memory.set(key, {"title": "Old"}, stored_at=time.time() - 120)
+        assert asyncio.run(cache.peek(PROFILE)) == {"title": "Old"}
+        assert asyncio.run(cache.peek(dict(PROFILE, bypass_cache=True))) is None
+        assert cache.counters["refreshes"] == 0
+
+
+class TestDegradedPathways:
+    """Pathways built around upstream failures are returned but not stored"""
+
+    def test_fallbacks_and_failed_queries_are_not_cached(self):
+        cache = PathwayCache(ttl=60, stale_ttl=60)
+        fallback = {"title": "Fallback", "metadata": {"enhancement_fallbacks": 1}}
+        timed_out = {"title": "Timed out", "metadata": {"query_statuses": {"domain": "timeout", "hobby": "ok"}}}
+        complete = {"title": "Complete", "metadata": {"enhancement_fallbacks": 0,
+                                                      "query_statuses": {"domain": "cached", "hobby": "ok"}}}
+        calls = []
+
+        async def generate(profile):
+            calls.append(profile)
+            return [fallback, timed_out, complete][len(calls) - 1]
+
+        async def scenario():
+            return [(await cache.get_or_generate(PROFILE, generate))["title"] for _ in range(4)]
+
+        assert asyncio.run(scenario()) == ["Fallback", "Timed out", "Complete", "Complete"]
+        assert len(calls) == 3
+        assert cache.counters["degraded_skipped"] == 2
+
+    def test_degraded_refresh_keeps_previous_entry(self):
+        cache = PathwayCache(ttl=60, stale_ttl=600)
+        cache.store.memory.set(profile_key(PROFILE), {"title": "Old"}, stored_at=time.time() - 120)
+
+        async def generate(profile):
+            return {"title": "Degraded", "metadata": {"enhancement_fallbacks": 2}}
+
+        async def scenario():
+            await cache.peek(PROFILE, generate)
+            await asyncio.gather(*cache._background)
+            await cache.put(PROFILE, await generate(PROFILE))
+            return await cache.peek(PROFILE)
+
+        assert asyncio.run(scenario()) == {"title": "Old"}
+        assert cache.counters["degraded_skipped"] == 2
@@ -0,0 +1,136 @@
+"""
+Tests for per-upstream rate limiting and adaptive concurrency
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import AdaptiveConcurrencyLimit, TokenBucket, UpstreamLimiter, is_rate_limited, upstream_limiter
+
+
+class TestTokenBucket:
+    """Bursts pass immediately, then calls are paced at the rate"""
+
+    def test_paces_after_burst(self):
+        async def scenario():
+            bucket = TokenBucket(rate=50, burst=5)
+            start = time.perf_counter()
+            for _ in range(10):
+                await bucket.acquire()
+            return time.perf_counter() - start
+
+        # 5 tokens up front, 5 more at 50/s
+        assert 0.08 <= asyncio.run(scenario()) < 0.5
+
+    def test_zero_rate_is_unlimited(self):
+        async def scenario():
+            bucket = TokenBucket(rate=0, burst=1)
+            for _ in range(1000):
+                await bucket.acquire()
+
+        asyncio.run(scenario())
+
+
+class TestAdaptiveConcurrencyLimit:
+    """AIMD: additive increase on success, multiplicative decrease on 429"""
+
+    def test_increase_and_backoff(self):
+        async def scenario():
+            limit = AdaptiveConcurrencyLimit(initial=4, minimum=1, maximum=8)
+            for _ in range(4):
+                await limit.acquire()
+                await limit.release()
+            grown = limit.limit
+            await limit.acquire()
+            await limit.release(rate_limited=True)
+            return grown, limit.limit
+
+        grown, backed_off = asyncio.run(scenario())
+        assert 4.9 < grown < 5.1
+        assert backed_off == pytest.approx(grown / 2)
+
+    def test_failures_hold_the_limit(self):
+        async def scenario():
+            limit = AdaptiveConcurrencyLimit(initial=4, minimum=1, maximum=8)
+            for _ in range(8):
+                await limit.acquire()
+                await limit.release(succeeded=False)
+            return limit.limit
+
+        assert asyncio.run(scenario()) == 4
+
+    def test_caps_in_flight(self):
+        async def scenario():
+            limit = AdaptiveConcurrencyLimit(initial=2, maximum=2)
+            peak = 0
+
+            async def call():
+                nonlocal peak
+                await limit.acquire()
+                peak = max(peak, limit.in_flight)
+                await asyncio.sleep(0.01)
+                await limit.release()
+
+            await asyncio.gather(*(call() for _ in range(10)))
+            return peak
+
+        assert asyncio.run(scenario()) == 2
+
+
+class TestUpstreamLimiter:
+    """Rate-limit errors shrink the concurrency limit and are re-raised"""
+
+    def test_rate_limited_call_backs_off(self):
+        async def scenario():
+            limiter = UpstreamLimiter("gemini", rate=0, burst=1, concurrency=8, max_concurrency=16)
+            with pytest.raises(RuntimeError):
+                async with limiter.slot():
+                    raise RuntimeError("429 RESOURCE_EXHAUSTED: quota exceeded")
+            async with limiter.slot():
+                pass
+            return limiter.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["calls"] == 2
+        assert stats["rate_limited"] == 1
+        assert stats["concurrency_limit"] == 4
+        assert stats["in_flight"] == 0
+
+    def test_timeouts_and_cancellations_do_not_grow_the_limit(self):
+        async def scenario():
+            limiter = UpstreamLimiter("gemini", rate=0, burst=1, concurrency=8, max_concurrency=16)
+            for _ in range(4):
+                with pytest.raises(asyncio.TimeoutError):
+                    async with limiter.slot():
+                        raise asyncio.TimeoutError()
+
+            async def hedge_loser():
+                async with limiter.slot():
+                    await asyncio.sleep(10)
+
+            loser = asyncio.create_task(hedge_loser())
+            await asyncio.sleep(0.01)
+            loser.cancel()
+            await asyncio.gather(loser, return_exceptions=True)
+            return limiter.concurrency.limit, limiter.stats()
+
+        limit, stats = asyncio.run(scenario())
+        assert limit == 8
+        assert stats["rate_limited"] == 0
+        assert stats["in_flight"] == 0
+
+    def test_is_rate_limited(self):
+        assert is_rate_limited(RuntimeError("Too Many Requests"))
+        assert not is_rate_limited(TimeoutError("read timed out"))
+
+    def test_limiter_per_event_loop(self):
+        async def get():
+            return upstream_limiter("tavily")
+
+        assert asyncio.run(get()) is not asyncio.run(get())
@@ -0,0 +1,58 @@
+"""
+Tests for the BM25 passage reranker
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reranker import BM25Index, chunk_text, rerank_documents
+
+
+class TestBM25:
+    """Index scoring and reranking"""
+
+    def test_matching_passage_scores_highest(self):
+        index = BM25Index([
+            "Cricket batting techniques for beginners.",
+            "LangGraph builds stateful agent workflows as graphs.",
+            "Healthcare data privacy regulations.",
+        ])
+        scores = index.score("LangGraph agent workflows")
+        assert scores.argmax() == 1
+        assert scores[0] == 0 and scores[2] == 0
+
+    def test_chunking_respects_word_limit(self):
+        text = " ".join(f"Sentence number {i} about agents." for i in range(100))
+        chunks = chunk_text(text, max_words=50)
+        assert len(chunks) > 1
+        assert all(len(chunk.split()) <= 50 for chunk in chunks)
+
+    def test_rerank_returns_top_n_chunks_with_metadata(self):
+        docs = [
+            SimpleNamespace(page_content="Unrelated gardening tips. " * 40, metadata={"source": "https://a"}),
+            SimpleNamespace(page_content="LangGraph agents in healthcare. " * 40, metadata={"source": "https://b"}),
+        ]
+        result = rerank_documents(docs, [("LangGraph", 1.0), ("healthcare", 0.5)], top_n=2)
+        assert len(result["documents"]) == 2
+        assert all(doc.metadata["source"] == "https://b" for doc in result["documents"])
+        assert "chunk" in result["documents"][0].metadata
+        # 120 words fit one chunk, 160 words need two
+        assert result["stats"]["chunks_scored"] == 3
+
+    def test_duplicate_chunks_do_not_crowd_top_n(self):
+        page = "LangGraph agents in healthcare. " * 40
+        docs = [
+            # The same page returned by three queries
+            *(SimpleNamespace(page_content=page, metadata={"source": "https://b"}) for _ in range(3)),
+            # The same text under another URL
+            SimpleNamespace(page_content=page, metadata={"source": "https://mirror"}),
+            SimpleNamespace(page_content="LangGraph state graphs for healthcare triage. " * 30,
+                            metadata={"source": "https://c"}),
+        ]
+        result = rerank_documents(docs, [("LangGraph", 1.0), ("healthcare", 0.5)], top_n=4)
+        selected = {(doc.metadata["source"], doc.metadata["chunk"]) for doc in result["documents"]}
+        assert selected == {("https://b", 0), ("https://b", 1), ("https://c", 0), ("https://c", 1)}
+        assert result["stats"]["duplicate_chunks"] == 6
@@ -0,0 +1,73 @@
+"""
+Tests for pre-serialized, compressed response bodies
+"""
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_encoding import encode_json, etag_matches, negotiate_encoding
+
+PATHWAY = {"title": "LangGraph", "phases": [{"title": f"Phase {i}", "description": "Markdown. " * 50} for i in range(5)]}
+
+
+class TestEncodeJson:
+    """One serialization, compressed variants and a content digest"""
+
+    def test_variants_round_trip(self):
+        body = encode_json(PATHWAY)
+        assert json.loads(body.identity) == PATHWAY
+        assert gzip.decompress(body.variants["gzip"]) == body.identity
+        assert len(body.variants["gzip"]) < len(body.identity)
+
+    def test_brotli_variant(self):
+        brotli = pytest.importorskip("brotli")
+        body = encode_json(PATHWAY)
+        assert brotli.decompress(body.variants["br"]) == body.identity
+
+    def test_digest_is_stable_and_content_based(self):
+        assert encode_json(PATHWAY).digest == encode_json(dict(PATHWAY)).digest
+        assert encode_json({**PATHWAY, "title": "Other"}).digest != encode_json(PATHWAY).digest
+
+    def test_tiny_bodies_stay_uncompressed(self):
+        assert encode_json({}).variants == {}
+
+    def test_etag_per_encoding(self):
+        body = encode_json(PATHWAY)
+        assert body.etag(None) == f'"{body.digest}"'
+        assert body.etag("gzip") == f'"{body.digest}-gzip"'
+
+
+class TestNegotiation:
+    """Accept-Encoding q-values and preferences"""
+
+    def test_prefers_brotli(self):
+        assert negotiate_encoding("gzip, deflate, br", {"gzip", "br"}) == "br"
+
+    def test_quality_values(self):
+        assert negotiate_encoding("br;q=0.5, gzip", {"gzip", "br"}) == "gzip"
+        assert negotiate_encoding("gzip;q=0", {"gzip"}) is None
+
+    def test_wildcard_and_missing(self):
+        assert negotiate_encoding("*", {"gzip"}) == "gzip"
+        assert negotiate_encoding("", {"gzip", "br"}) is None
+        assert negotiate_encoding("br", {"gzip"}) is None
+
+
+class TestEtagMatches:
+    """If-None-Match matches any encoding of the same body"""
+
+    def test_matches(self):
+        assert etag_matches('"abc"', "abc")
+        assert etag_matches('W/"abc-gzip"', "abc")
+        assert etag_matches('"other", "abc-br"', "abc")
+        assert etag_matches("*", "abc")
+
+    def test_no_match(self):
+        assert not etag_matches('"abcd"', "abc")
+        assert not etag_matches("", "abc")
@@ -0,0 +1,123 @@
+"""
+Tests for the concurrent retrieval fan-out
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retrieval
+from cache import TieredCache
+from retrieval import _retrieve_context, _run_query
+
+QUERIES = {
+    "Learning Topic": "LangGraph",
+    "domain": "Technology with respect to LangGraph",
+    "learning_style": "visual with respect to LangGraph",
+}
+WEIGHTED_QUERIES = [("LangGraph", 1.0), ("Technology", 0.5), ("visual", 0.5)]
+
+
+class FakeRetriever:
+    """Stands in for the Tavily retriever: per-query delays and failures, recording each search"""
+
+    def __init__(self, delays=None, failures=()):
+        self.k = 10
+        self.delays = delays or {}
+        self.failures = set(failures)
+        self.queries = []
+
+    async def ainvoke(self, query):
+        self.queries.append(query)
+        await asyncio.sleep(self.delays.get(query, 0))
+        if query in self.failures:
+            raise ValueError(f"search failed: {query}")
+        slug = query.split()[0].lower()
+        return [Document(page_content=f"{query} explained with LangGraph agent examples.",
+                         metadata={"source": f"https://example.com/{slug}"})]
+
+
+@pytest.fixture
+def fresh_cache():
+    cache = TieredCache("test_retrieval", maxsize=16, ttl=60)
+    with patch.object(retrieval, "retrieval_cache", cache), \
+            patch.object(retrieval, "record_upstream_error", lambda *args, **kwargs: None):
+        yield cache
+
+
+def _retrieve(retriever, timeout=0.2, use_cache=True):
+    with patch.object(retrieval, "get_retriever", lambda api_key: retriever), \
+            patch.object(retrieval, "RETRIEVAL_QUERY_TIMEOUT", timeout):
+        return asyncio.run(_retrieve_context(QUERIES, WEIGHTED_QUERIES, "key", use_cache=use_cache))
+
+
+class TestRunQuery:
+    """A single query reports its status instead of raising"""
+
+    def test_ok_then_cached(self, fresh_cache):
+        retriever = FakeRetriever()
+
+        async def twice():
+            return [await _run_query(retriever, "Learning Topic", "LangGraph", timeout=1) for _ in range(2)]
+
+        (_, docs, first), (_, cached_docs, second) = asyncio.run(twice())
+        assert first["status"] == "ok" and first["documents"] == 1
+        assert second["status"] == "cached"
+        assert cached_docs[0].page_content == docs[0].page_content
+        assert retriever.queries == ["LangGraph"]
+
+    def test_timeout(self, fresh_cache):
+        retriever = FakeRetriever(delays={"LangGraph": 5})
+        field, docs, timing = asyncio.run(_run_query(retriever, "Learning Topic", "LangGraph", timeout=0.1))
+
+        assert (field, docs, timing["status"]) == ("Learning Topic", [], "timeout")
+        assert timing["seconds"] < 1
+        assert fresh_cache.get(retrieval.retrieval_cache_key("LangGraph", 10)) is None
+
+    def test_error(self, fresh_cache):
+        retriever = FakeRetriever(failures={"LangGraph"})
+        _, docs, timing = asyncio.run(_run_query(retriever, "Learning Topic", "LangGraph", timeout=1))
+        assert docs == [] and timing["status"] == "error"
+
+
+class TestRetrieveContext:
+    """Queries run concurrently; the request fails only when every query does"""
+
+    def test_slow_query_times_out_while_others_contribute(self, fresh_cache):
+        retriever = FakeRetriever(delays={QUERIES["domain"]: 5})
+        result = _retrieve(retriever)
+
+        assert {field: timing["status"] for field, timing in result["timings"].items()} == {
+            "Learning Topic": "ok", "domain": "timeout", "learning_style": "ok"}
+        assert sorted(result["relevant_links"]) == ["https://example.com/langgraph", "https://example.com/visual"]
+        assert "visual with respect to LangGraph" in result["combined_text"]
+        # The fan-out is bounded by the timeout, not by the slow query
+        assert max(timing["seconds"] for timing in result["timings"].values()) < 1
+
+    def test_partial_failure_still_succeeds(self, fresh_cache):
+        retriever = FakeRetriever(failures={QUERIES["Learning Topic"]}, delays={QUERIES["domain"]: 5})
+        result = _retrieve(retriever)
+
+        assert [timing["status"] for timing in result["timings"].values()].count("ok") == 1
+        assert result["relevant_links"] == ["https://example.com/visual"]
+
+    def test_all_queries_failing_raises(self, fresh_cache):
+        retriever = FakeRetriever(failures={QUERIES["Learning Topic"], QUERIES["learning_style"]},
+                                  delays={QUERIES["domain"]: 5})
+        with pytest.raises(RuntimeError, match="All retrieval queries failed"):
+            _retrieve(retriever)
+
+    def test_bypass_counted_once_per_request(self, fresh_cache):
+        retriever = FakeRetriever()
+        _retrieve(retriever)
+        result = _retrieve(retriever, use_cache=False)
+
+        assert {timing["status"] for timing in result["timings"].values()} == {"ok"}
+        assert len(retriever.queries) == 2 * len(QUERIES)
+        assert fresh_cache.stats()["bypassed"] == 1
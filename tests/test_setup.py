@@ -51,7 +51,7 @@ class TestBasicSetup:
 class TestAgentFunctionality:
     """Test agent functionality with mocked API calls"""
     
-    @patch('structured_agent.ChatGoogleGenerativeAI')
+    @patch('client_pool.ChatGoogleGenerativeAI')
     @patch('retrieval.TavilySearchAPIRetriever')
     def test_agent_pipeline_structure(self, mock_tavily, mock_gemini):
         """Test that the agent pipeline can be invoked without API calls"""
@@ -0,0 +1,61 @@
+"""
+Tests for single-flight coalescing of identical generation requests
+"""
+import asyncio
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """Shared execution, error propagation and counters"""
+
+    def test_concurrent_callers_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def generate():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"title": "Shared"}
+
+        async def scenario():
+            return await asyncio.gather(*[flight.do("profile", generate) for _ in range(10)])
+
+        results = asyncio.run(scenario())
+        assert len(calls) == 1
+        assert all(r == {"title": "Shared"} for r in results)
+        assert flight.stats()["coalesced"] == 9
+        assert flight.stats()["in_flight"] == 0
+
+    def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        async def generate():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        async def scenario():
+            return await asyncio.gather(*[flight.do("profile", generate) for _ in range(3)],
+                                        return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flight.counters["errors"] == 1
+
+    def test_sequential_calls_run_again(self):
+        flight = SingleFlight()
+
+        async def generate():
+            return 1
+
+        async def scenario():
+            await flight.do("profile", generate)
+            await flight.do("profile", generate)
+
+        asyncio.run(scenario())
+        assert flight.counters["executions"] == 2
@@ -0,0 +1,83 @@
+"""
+Tests for per-request telemetry and the capacity planner
+"""
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telemetry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("cost_calculator", os.path.join(ROOT, "cost-calculator.py"))
+cost_calculator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cost_calculator)
+
+
+class TestTrackRequest:
+    """Test telemetry collection"""
+
+    def test_record_written(self, tmp_path, monkeypatch):
+        path = tmp_path / "telemetry.jsonl"
+        monkeypatch.setattr(telemetry, "TELEMETRY_PATH", str(path))
+        with telemetry.track_request("generate-pathway"):
+            telemetry.add_tokens(100, 20)
+            telemetry.add_tokens(50, 5)
+            telemetry.set_stage_timings({"retrieval": 1.0, "total": 2.0})
+        record = json.loads(path.read_text())
+        assert record["status"] == "ok"
+        assert record["prompt_tokens"] == 150
+        assert record["completion_tokens"] == 25
+        assert record["stage_timings"]["total"] == 2.0
+        assert record["max_rss_mb"] > 0
+
+    def test_error_status(self, tmp_path, monkeypatch):
+        path = tmp_path / "telemetry.jsonl"
+        monkeypatch.setattr(telemetry, "TELEMETRY_PATH", str(path))
+        with pytest.raises(ValueError):
+            with telemetry.track_request("generate-pathway"):
+                raise ValueError("boom")
+        assert json.loads(path.read_text())["status"] == "error"
+
+    def test_untracked_calls_are_ignored(self):
+        telemetry.add_tokens(10, 10)
+        telemetry.set_stage_timings({"total": 1.0})
+
+
+class TestCapacityPlan:
+    """Test the sizing recommendations"""
+
+    def records(self, cpu_seconds=0.2, rss_step=2.0):
+        return [
+            {
+                "status": "ok",
+                "latency_seconds": 10.0,
+                "cpu_seconds": cpu_seconds,
+                "in_flight": i % 4,
+                "max_rss_mb": 200.0 + rss_step * (i % 4),
+                "prompt_tokens": 4000,
+                "completion_tokens": 1500,
+                "stage_timings": {"retrieval": 2.0, "total": 10.0},
+            }
+            for i in range(40)
+        ]
+
+    def test_io_bound_service_gets_high_concurrency(self):
+        result = cost_calculator.plan(self.records(), rate=1.0)
+        rec = result["recommendation"]
+        assert result["in_flight_mean"] == 10.0
+        assert rec["containerConcurrency"] >= 20
+        assert rec["maxScale"] >= 1
+        assert result["monthly"]["llm_cost_usd"] > 0
+
+    def test_cpu_bound_service_gets_low_concurrency(self):
+        result = cost_calculator.plan(self.records(cpu_seconds=8.0), rate=1.0)
+        rec = result["recommendation"]
+        assert rec["limited_by"] == "cpu"
+        assert rec["containerConcurrency"] <= 2
+        assert rec["maxScale"] >= result["in_flight_peak"] / rec["containerConcurrency"]